@@ -0,0 +1,154 @@
+"""
+Applies Nomoject's Capabilities changes without the GUI.
+
+This module doubles as the boot-time agent run by the scheduled task:
+
+    python apply.py POLICY.json [--status STATUS.json]
+
+It only imports what it needs to touch the registry, so it starts quickly.
+Exit codes: 0 when every key is in place, 1 when some key failed,
+2 when the policy or the registry could not be read.
+"""
+import os
+import sys
+import json
+import time
+from registry import REG_DWORD, open_registry
+from devices import non_removable
+
+# Per-key outcomes of apply_capabilities
+APPLIED = 'applied'
+UNCHANGED = 'unchanged'
+MISSING = 'missing'
+FAILED = 'failed'
+# Reported by dry runs for keys that would be written
+PENDING = 'pending'
+
+POLICY_VERSION = 1
+
+EXIT_OK = 0
+EXIT_FAILED_KEYS = 1
+EXIT_ERROR = 2
+
+
+def apply_capabilities(registry, paths, capabilities=None, verify=True):
+    """
+    Sets Capabilities on every key in paths directly through the registry backend.
+    Without an explicit value, each key keeps its own bits except the removable
+    one. Keys that already hold the target value are left untouched. Returns one
+    result dict per key with its path, status, previous value and error.
+    """
+    results = []
+    for path in paths:
+        result = {'path': path, 'status': FAILED, 'previous': None, 'error': None}
+        results.append(result)
+
+        try:
+            key = registry.open_key(path, write=True)
+        except FileNotFoundError as e:
+            # The device is not present, e.g. not attached on this boot
+            result['status'] = MISSING
+            result['error'] = str(e)
+            continue
+        except OSError as e:
+            result['error'] = str(e)
+            continue
+
+        try:
+            try:
+                result['previous'], _ = registry.query_value(key, "Capabilities")
+            except FileNotFoundError:
+                pass
+
+            target = non_removable(result['previous']) if capabilities is None else capabilities
+            if result['previous'] == target:
+                result['status'] = UNCHANGED
+                continue
+
+            registry.set_value(key, "Capabilities", target, REG_DWORD)
+            if verify and registry.query_value(key, "Capabilities")[0] != target:
+                result['error'] = "Value did not change after writing"
+                continue
+            result['status'] = APPLIED
+        except OSError as e:
+            result['error'] = str(e)
+        finally:
+            registry.close_key(key)
+
+    return results
+
+
+def count_results(results):
+    """Returns the number of results per status"""
+    counts = {APPLIED: 0, UNCHANGED: 0, MISSING: 0, FAILED: 0}
+    for result in results:
+        counts[result['status']] += 1
+    return counts
+
+
+def write_policy(path, paths, capabilities=None):
+    """Writes the policy read by the boot-time agent, null capabilities only clear the removable bit"""
+    policy = {'version': POLICY_VERSION, 'capabilities': capabilities, 'keys': list(paths)}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(policy, f, indent=1)
+
+
+def load_policy(path):
+    """Returns (capabilities, paths) from a policy file, raising ValueError if it is invalid"""
+    with open(path, 'r', encoding='utf-8') as f:
+        policy = json.load(f)
+    if not isinstance(policy, dict) or policy.get('version') != POLICY_VERSION:
+        raise ValueError("Unsupported policy file")
+    capabilities = policy.get('capabilities')
+    paths = policy.get('keys')
+    if not isinstance(capabilities, (int, type(None))) or not isinstance(paths, list):
+        raise ValueError("Malformed policy file")
+    return capabilities, paths
+
+
+def write_status(path, status):
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(status, f, indent=1)
+    except OSError:
+        pass  # Reporting must never fail the run
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    start = time.perf_counter()
+
+    if not argv or argv[0] in ('-h', '--help'):
+        print(__doc__.strip())
+        return EXIT_OK if argv else EXIT_ERROR
+    policy_path = argv[0]
+    status_path = os.path.splitext(policy_path)[0] + '.status.json'
+    if len(argv) >= 3 and argv[1] == '--status':
+        status_path = argv[2]
+
+    status = {'started': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    try:
+        capabilities, paths = load_policy(policy_path)
+        registry = open_registry(os.environ.get('NOMOJECT_REGISTRY'))
+        results = apply_capabilities(registry, paths, capabilities)
+    except (OSError, ValueError) as e:
+        status.update({'exit_code': EXIT_ERROR, 'error': str(e),
+                       'elapsed_ms': round((time.perf_counter() - start) * 1000, 3)})
+        write_status(status_path, status)
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+
+    counts = count_results(results)
+    exit_code = EXIT_FAILED_KEYS if counts[FAILED] else EXIT_OK
+    status.update({
+        'exit_code': exit_code,
+        'counts': counts,
+        'failures': [result for result in results if result['status'] == FAILED],
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 3)
+    })
+    write_status(status_path, status)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
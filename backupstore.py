@@ -0,0 +1,150 @@
+"""
+Local backup history of device keys, stored by content.
+
+Each device key's values are serialized, hashed and kept once as a
+compressed object; a snapshot is only a manifest listing (key path,
+object digest) pairs. Unchanged keys cost nothing but a manifest line,
+keys whose last write time did not move are not even hashed again, and a
+snapshot identical to the latest one is not recorded twice. Any snapshot
+can be exported back to a regular .reg file.
+
+Layout under the store directory:
+    objects/ab/cdef...   zlib-compressed JSON list of [name, data, type]
+    snapshots/<id>.json  manifest of one snapshot
+"""
+import os
+import json
+import zlib
+import hashlib
+from datetime import datetime
+from cache import encode_data, decode_data
+from instrument import span, count
+
+STORE_VERSION = 1
+DIGEST_SIZE = 20
+
+
+def get_store_dir():
+    # Imported here so the module stays usable without the settings defaults
+    from settings import get_app_data_dir
+    return os.path.join(get_app_data_dir(), 'backups')
+
+
+def serialize_values(values):
+    """Returns the canonical bytes of a key's values, in their captured order"""
+    return json.dumps([[name, encode_data(data), type_] for name, data, type_ in values],
+                      separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class BackupStore:
+    def __init__(self, root=None):
+        self.root = root or get_store_dir()
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.snapshots_dir = os.path.join(self.root, 'snapshots')
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def _write_atomic(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def put_values(self, values):
+        """Stores a key's values unless an identical block exists, returns (digest, stored)"""
+        data = serialize_values(values)
+        digest = hashlib.blake2b(data, digest_size=DIGEST_SIZE).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            return digest, False
+        self._write_atomic(path, zlib.compress(data, 6))
+        count('backups.bytes_stored', os.path.getsize(path))
+        return digest, True
+
+    def get_values(self, digest):
+        """Returns the values stored under a digest, raises OSError if it is missing or damaged"""
+        with open(self._object_path(digest), 'rb') as f:
+            content = f.read()
+        try:
+            data = zlib.decompress(content)
+            if hashlib.blake2b(data, digest_size=DIGEST_SIZE).hexdigest() != digest:
+                raise ValueError("digest mismatch")
+            return [(name, decode_data(data), type_) for name, data, type_ in json.loads(data)]
+        except (ValueError, TypeError, zlib.error) as e:
+            raise OSError(f"Damaged backup object {digest}: {e}")
+
+    def snapshot_ids(self):
+        """Returns every snapshot id, oldest first"""
+        try:
+            names = os.listdir(self.snapshots_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith('.json'))
+
+    def load_snapshot(self, snapshot_id):
+        """Returns a snapshot manifest, raises OSError if it cannot be read"""
+        path = os.path.join(self.snapshots_dir, snapshot_id + '.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except ValueError as e:
+            raise OSError(f"Damaged snapshot {snapshot_id}: {e}")
+        if not isinstance(manifest, dict) or manifest.get('version') != STORE_VERSION:
+            raise OSError(f"Unsupported snapshot {snapshot_id}")
+        return manifest
+
+    def latest_snapshot(self):
+        """Returns the newest readable manifest, or None"""
+        for snapshot_id in reversed(self.snapshot_ids()):
+            try:
+                return self.load_snapshot(snapshot_id)
+            except OSError:
+                continue
+        return None
+
+    def take_snapshot(self, devices, label=None):
+        """
+        Records the current values of the given devices. Returns a dict with
+        the snapshot id, whether a new snapshot was recorded (False when it
+        matches the latest one) and the number of new objects stored.
+        """
+        with span('backups.snapshot'):
+            latest = self.latest_snapshot()
+            # Keys whose last write time did not move keep their digest without hashing
+            known = {}
+            if latest:
+                known = {(path, last_write): digest for path, digest, last_write in latest['keys']
+                         if last_write is not None}
+
+            keys = []
+            stored = 0
+            for device in devices:
+                digest = known.get((device.path, device.last_write))
+                if digest is None:
+                    digest, is_new = self.put_values(device.values or [])
+                    stored += is_new
+                keys.append([device.path, digest, device.last_write])
+
+            if latest and [key[:2] for key in latest['keys']] == [key[:2] for key in keys]:
+                return {'id': latest['id'], 'created': False, 'keys': len(keys), 'stored': 0}
+
+            now = datetime.now()
+            snapshot_id = now.strftime('%Y%m%d_%H%M%S_%f')
+            manifest = {'version': STORE_VERSION, 'id': snapshot_id, 'created': now.isoformat(timespec='seconds'),
+                        'label': label, 'keys': keys}
+            self._write_atomic(os.path.join(self.snapshots_dir, snapshot_id + '.json'),
+                               json.dumps(manifest, separators=(',', ':')).encode('utf-8'))
+        return {'id': snapshot_id, 'created': True, 'keys': len(keys), 'stored': stored}
+
+    def export_snapshot(self, snapshot_id, target):
+        """Writes a snapshot as a regular .reg backup"""
+        # Imported here so taking snapshots does not load the .reg writer
+        from regfile import RegFileWriter
+
+        manifest = self.load_snapshot(snapshot_id)
+        with span('backups.export'), RegFileWriter(target) as writer:
+            for path, digest, _ in manifest['keys']:
+                writer.write_key(path, self.get_values(digest))
+        return len(manifest['keys'])
@@ -0,0 +1,97 @@
+"""
+Measures how quickly the hot-plug guard hides devices that appear, on a
+simulated event stream.
+
+Usage: python benchmarks/bench_hotplug.py [--vendors N] [--arrivals N] [--interval MS]
+
+Each arrival creates a synthetic instance key value by value, signalling
+every write like Plug and Play's registry writes, in a synthetic tree
+already holding --vendors devices. Latency runs from the first write of an
+arrival to its Capabilities being rewritten.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from statistics import median
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from devices import PCI_ENUM_PATH
+from watcher import FakeChangeSource
+from hotplug import HotplugGuard
+from synthetic import KNOWN_DEVICES, generate_pci_tree, instance_values
+
+GUARDED_VENDOR = "VEN_1AF4"
+
+
+def add_device(registry, source, rng, index):
+    """Creates a removable VirtIO device key, signalling every write, returns (path, time of the first write)"""
+    vendor_id, device_id, desc = KNOWN_DEVICES[0]
+    device_id, subsys = 0x8000 + index, 0x00011AF4
+    path = f"{PCI_ENUM_PATH}\\VEN_{vendor_id:04X}&DEV_{device_id:04X}&SUBSYS_{subsys:08X}&REV_00\\3&267a616a&0&10"
+    key = registry.create_key(path)
+    started = time.perf_counter()
+    source.notify()
+    for name, data, type_ in instance_values(rng, vendor_id, device_id, subsys, desc, True, 256):
+        registry.set_value(key, name, data, type_)
+        source.notify()
+    return path, started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vendors', type=int, default=200, help="devices present before the guard starts")
+    parser.add_argument('--arrivals', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=150, help="milliseconds between arrivals")
+    args = parser.parse_args()
+
+    registry = generate_pci_tree(vendors=args.vendors, instances=1)
+    source = FakeChangeSource()
+
+    hidden_at = {}
+
+    def on_applied(results, latency_ms):
+        now = time.perf_counter()
+        for result in results:
+            hidden_at[result['path']] = now
+
+    guard = HotplugGuard(registry, source, lambda device: device.vendor_key.startswith(GUARDED_VENDOR),
+                         on_applied=on_applied)
+    stop = threading.Event()
+    thread = threading.Thread(target=guard.run, args=(stop.is_set,), daemon=True)
+    start = time.perf_counter()
+    thread.start()
+    while guard.refreshes == 0:
+        time.sleep(0.001)
+    initial_time = time.perf_counter() - start
+    notifications, refreshes = source.notifications, guard.refreshes
+
+    rng = random.Random(1)
+    arrivals = {}
+    for i in range(args.arrivals):
+        time.sleep(args.interval / 1000)
+        path, started = add_device(registry, source, rng, i)
+        arrivals[path] = started
+
+    deadline = time.perf_counter() + 2
+    while len(arrivals.keys() & hidden_at.keys()) < len(arrivals) and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    stop.set()
+    thread.join()
+
+    latencies = sorted((hidden_at[path] - started) * 1000 for path, started in arrivals.items() if path in hidden_at)
+    stats = guard.stats()
+    print(f"initial pass: {initial_time * 1000:.1f} ms over {args.vendors} vendor keys")
+    print(f"hidden:       {len(latencies)}/{len(arrivals)} arrivals, {stats['applied']} key(s) changed")
+    print(f"coalescing:   {stats['notifications'] - notifications} notifications in "
+          f"{stats['refreshes'] - refreshes} refreshes")
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"latency:      median {median(latencies):.1f} ms, p95 {p95:.1f} ms, max {latencies[-1]:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Measures PCI ID index compilation, first use and lookup cost.
+
+Usage: python benchmarks/bench_pciids.py [--pci-ids FILE] [--vendors N] [--lookups N]
+
+Without --pci-ids a synthetic database about the size of the upstream one is generated.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pciids
+from synthetic import write_pci_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pci-ids', help="real pci.ids file to compile")
+    parser.add_argument('--vendors', type=int, default=5000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = args.pci_ids
+        ids = None
+        if not source:
+            source = os.path.join(tmp_dir, 'pci.ids')
+            ids = write_pci_ids(source, args.vendors)
+        target = os.path.join(tmp_dir, pciids.INDEX_FILENAME)
+
+        start = time.perf_counter()
+        count = pciids.compile_pci_ids(source, target)
+        compile_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = pciids.PciIdIndex(target)
+        open_time = time.perf_counter() - start
+        pciids._index = index
+
+        if ids is None:
+            ids = [(f"{vendor:04X}", None, None) for vendor in index.tables[0][0]]
+            ids += [(f"{key >> 16:04X}", f"{key & 0xFFFF:04X}", None) for key in index.tables[1][0]]
+        rng = random.Random(1)
+        queries = [rng.choice(ids) for _ in range(args.lookups)]
+
+        start = time.perf_counter()
+        found = sum(1 for query in queries if pciids.lookup_device_name(*query))
+        lookup_time = time.perf_counter() - start
+
+        print(f"source:     {os.path.getsize(source) / 1024 / 1024:.1f} MB, {count} names")
+        print(f"index:      {os.path.getsize(target) / 1024 / 1024:.1f} MB")
+        print(f"compile:    {compile_time:.3f} s")
+        print(f"first use:  {open_time * 1000:.2f} ms")
+        print(f"lookup:     {lookup_time / len(queries) * 1e6:.2f} us ({found}/{len(queries)} found)")
+        del index
+        pciids._index = None
+
+
+if __name__ == '__main__':
+    main()
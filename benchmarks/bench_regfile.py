@@ -0,0 +1,40 @@
+"""
+Measures .reg export throughput.
+
+Usage: python benchmarks/bench_regfile.py [--keys N] [--blob-size BYTES]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from regfile import write_devices_backup
+from synthetic import generate_devices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--keys', type=int, default=20000)
+    parser.add_argument('--blob-size', type=int, default=4096)
+    args = parser.parse_args()
+
+    devices = generate_devices(args.keys, blob_size=args.blob_size)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'bench.reg')
+        start = time.perf_counter()
+        write_devices_backup(path, devices)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path)
+
+    print(f"keys:       {len(devices)} removable of {args.keys}")
+    print(f"blob size:  {args.blob_size} bytes")
+    print(f"file size:  {size / 1024 / 1024:.1f} MB")
+    print(f"time:       {elapsed:.3f} s")
+    print(f"throughput: {len(devices) / elapsed:.0f} keys/s, {size / 1024 / 1024 / elapsed:.1f} MB/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Measures cold-start time: importing the GUI module and launching to the
+first window, from source and for each built distribution found.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--exe PATH ...] [--registry FILE]
+
+Each launch is a fresh process with an empty settings folder and update
+checks off, closed as soon as its event loop runs (--quit-after-start),
+so the wall time covers interpreter start, bundle extraction for
+--onefile builds, imports, and building and showing the window. The
+in-process phases come from the --profile trace. Frozen builds elevate
+on start, run them from an elevated prompt. Without Windows the window
+is rendered offscreen and a synthetic .reg file stands in for the
+registry.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from statistics import median
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import generate_pci_tree, write_reg_file
+
+PHASES = ['startup.translations', 'cache.load', 'startup.application', 'startup.window']
+
+# Built by "python build.py" and "python build.py --onedir"
+DISTRIBUTIONS = [
+    ('onefile', os.path.join(ROOT, 'dist', 'Nomoject.exe')),
+    ('onedir', os.path.join(ROOT, 'dist-onedir', 'Nomoject', 'Nomoject.exe')),
+]
+
+
+def time_process(command, env):
+    start = time.perf_counter()
+    subprocess.run(command, env=env, cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def read_phases(trace_path):
+    with open(trace_path, 'r', encoding='utf-8') as f:
+        events = json.load(f)['traceEvents']
+    totals = {}
+    for event in events:
+        if event.get('ph') == 'X':
+            totals[event['name']] = totals.get(event['name'], 0.0) + event['dur'] / 1000
+    return totals
+
+
+def run_mode(name, command, env, runs, tmp_dir):
+    """Launches command runs times, returns (wall times, per phase times) in milliseconds"""
+    walls = []
+    phases = {phase: [] for phase in PHASES}
+    for run in range(runs):
+        trace_path = os.path.join(tmp_dir, f"{name}_{run}.json")
+        walls.append(time_process([*command, '--quit-after-start', f'--profile={trace_path}'], env))
+        totals = read_phases(trace_path)
+        for phase in PHASES:
+            if phase in totals:
+                phases[phase].append(totals[phase])
+    return walls, phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--exe', action='append', default=[], help="other executable to launch (repeatable)")
+    parser.add_argument('--registry', metavar='FILE', help=".reg file or hive to show instead of the live registry")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = os.path.join(tmp_dir, 'data')
+        os.makedirs(data_dir)
+        with open(os.path.join(data_dir, 'settings.json'), 'w', encoding='utf-8') as f:
+            json.dump({'check_for_updates': False}, f)
+
+        env = dict(os.environ, NOMOJECT_DATA_DIR=data_dir)
+        if args.registry:
+            env['NOMOJECT_REGISTRY'] = os.path.abspath(args.registry)
+        elif os.name != 'nt':
+            env['NOMOJECT_REGISTRY'] = os.path.join(tmp_dir, 'fixture.reg')
+            write_reg_file(generate_pci_tree(vendors=10), env['NOMOJECT_REGISTRY'])
+        if os.name != 'nt':
+            env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+        interpreter = [time_process([sys.executable, '-c', 'pass'], env) for _ in range(args.runs)]
+        imports = [time_process([sys.executable, '-c', 'import nomoject'], env) for _ in range(args.runs)]
+        print(f"{'interpreter':<12} {median(interpreter):8.1f} ms")
+        print(f"{'import':<12} {median(imports):8.1f} ms  (nomoject module, interpreter included)")
+
+        # Source runs call main() directly, skipping the elevation of "python nomoject.py"
+        modes = [('source', [sys.executable, '-c', 'import nomoject; nomoject.main()'])]
+        modes += [(name, [path]) for name, path in DISTRIBUTIONS if os.path.exists(path)]
+        modes += [(os.path.basename(path), [os.path.abspath(path)]) for path in args.exe]
+
+        for name, command in modes:
+            walls, phases = run_mode(name, command, env, args.runs, tmp_dir)
+            details = ', '.join(f"{phase} {median(times):.1f}" for phase, times in phases.items() if times)
+            print(f"{name:<12} {median(walls):8.1f} ms  (min {min(walls):.1f}; {details})")
+
+
+if __name__ == '__main__':
+    main()
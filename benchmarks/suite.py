@@ -0,0 +1,255 @@
+"""
+Benchmark suite for the device hot paths, checked against stored baselines.
+
+Usage:
+    python benchmarks/suite.py [--sizes 10,1000] [--case scan] [--repeat N]
+    python benchmarks/suite.py --save-baseline
+
+Every case runs on synthetic PCI trees (synthetic.BENCHMARK_TREE), headless:
+    scan      scan_devices over the whole tree, what the GUI does to list devices
+    backup    write_devices_backup of every removable device
+    snapshot  BackupStore.take_snapshot into an empty store, what Backup PCI Keys does
+    generate  write_capabilities_file, what Generate Registry File does
+
+Each case is timed --repeat times, each run right after a short
+calibration loop, and the median of the run to calibration ratios counts,
+so a baseline recorded on one machine still means something on another
+and a machine changing speed mid-run does not skew it. Snapshot writes a
+file per vendor, so its calibration writes files too. Output goes to a RAM
+filesystem where there is one, keeping disk writeback out of the times.
+One more run under tracemalloc gives the peak memory. The exit code is 1
+when a case is slower or uses more memory than its baseline by more than
+its tolerances.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from statistics import median
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from devices import scan_devices
+from regfile import write_devices_backup, write_capabilities_file
+from backupstore import BackupStore
+from synthetic import generate_pci_tree, BENCHMARK_TREE
+
+BASELINE_VERSION = 2
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_REPEAT = 7
+# Work directories go here when it exists, a disk flushing in the background skews file writes
+RAM_DIR = '/dev/shm'
+
+
+def run_scan(registry, devices, work_dir):
+    return list(scan_devices(registry))
+
+
+def run_backup(registry, devices, work_dir):
+    write_devices_backup(os.path.join(work_dir, 'backup.reg'), devices)
+
+
+def run_snapshot(registry, devices, work_dir):
+    BackupStore(os.path.join(work_dir, 'store')).take_snapshot(devices)
+
+
+def run_generate(registry, devices, work_dir):
+    write_capabilities_file(os.path.join(work_dir, 'hide.reg'), devices)
+
+
+CASES = {
+    'scan': run_scan,
+    'backup': run_backup,
+    'snapshot': run_snapshot,
+    'generate': run_generate,
+}
+
+
+def work_root():
+    return RAM_DIR if os.path.isdir(RAM_DIR) and os.access(RAM_DIR, os.W_OK) else None
+
+
+def calibrate(rounds=1):
+    """Returns the best time, in milliseconds, of a fixed pure Python workload"""
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        table = {}
+        for i in range(50000):
+            table[f"VEN_{i & 0xFFFF:04X}"] = table.get(f"VEN_{i & 0xFFFF:04X}", 0) + i
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate_files(files=100):
+    """Returns the time, in milliseconds, of writing small files the way BackupStore does"""
+    with tempfile.TemporaryDirectory(dir=work_root()) as work_dir:
+        start = time.perf_counter()
+        for i in range(files):
+            path = os.path.join(work_dir, f"{i & 0xFF:02x}", str(i))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(bytes(256))
+            os.replace(path + '.tmp', path)
+        return (time.perf_counter() - start) * 1000
+
+
+# Per case: the calibration its times are relative to, the allowed slowdown and
+# the noise floor in ms below which a slowdown is ignored. Creating the output
+# file costs backup and generate a few ms of filesystem jitter, and snapshot
+# still moves with the filesystem more than the others do with the CPU.
+TIMING = {
+    'scan': (calibrate, 0.30, 1.0),
+    'backup': (calibrate, 0.30, 3.0),
+    'snapshot': (calibrate_files, 0.50, 5.0),
+    'generate': (calibrate, 0.30, 3.0),
+}
+MEMORY_THRESHOLD = 0.10
+MEMORY_NOISE_KB = 64
+
+
+def measure(case, registry, devices, repeat):
+    """
+    Returns the medians of the times in ms, of the calibration times in ms
+    and of the time to calibration ratios, and the peak traced memory in KB
+    """
+    function = CASES[case]
+    calibration = TIMING[case][0]
+    times = []
+    calibrations = []
+    ratios = []
+    for run in range(repeat + 1):
+        with tempfile.TemporaryDirectory(dir=work_root()) as work_dir:
+            gc.collect()
+            if run < repeat:
+                calibration_ms = calibration()
+                start = time.perf_counter()
+                function(registry, devices, work_dir)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                times.append(elapsed_ms)
+                calibrations.append(calibration_ms)
+                ratios.append(elapsed_ms / calibration_ms)
+            else:
+                tracemalloc.start()
+                try:
+                    function(registry, devices, work_dir)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+    return median(times), median(calibrations), median(ratios), peak / 1024
+
+
+def load_baseline(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        return None
+    if not isinstance(baseline, dict) or baseline.get('version') != BASELINE_VERSION:
+        raise ValueError(f"{path}: unsupported baseline file")
+    return baseline
+
+
+def compare(case, result, expected, args):
+    """Returns the problems of a result against its baseline entry, as strings"""
+    problems = []
+    _, time_threshold, min_ms = TIMING[case]
+    if args.time_threshold is not None:
+        time_threshold = args.time_threshold
+    if args.min_ms is not None:
+        min_ms = args.min_ms
+    allowed = expected['relative_time'] * (1 + time_threshold)
+    extra_ms = (result['relative_time'] - expected['relative_time']) * result['calibration_ms']
+    if result['relative_time'] > allowed and extra_ms > min_ms:
+        problems.append(f"time +{(result['relative_time'] / expected['relative_time'] - 1) * 100:.0f}%")
+    if result['peak_kb'] > expected['peak_kb'] * (1 + args.memory_threshold) + args.min_kb:
+        problems.append(f"memory +{(result['peak_kb'] / expected['peak_kb'] - 1) * 100:.0f}%")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=lambda text: [int(size) for size in text.split(',')], default=DEFAULT_SIZES,
+                        help="comma separated device counts (default 10,100,1000,10000; up to 100000)")
+    parser.add_argument('--case', action='append', choices=list(CASES), help="case to run (repeatable, default all)")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f"timed runs per case, the median counts (default {DEFAULT_REPEAT})")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline file (default benchmarks/baseline.json)")
+    parser.add_argument('--save-baseline', action='store_true', help="record the results as the new baseline")
+    parser.add_argument('--time-threshold', type=float,
+                        help="allowed slowdown for every case (default per case, 0.30 or 0.50 for snapshot)")
+    parser.add_argument('--memory-threshold', type=float, default=MEMORY_THRESHOLD,
+                        help=f"allowed memory growth (default {MEMORY_THRESHOLD})")
+    parser.add_argument('--min-ms', type=float,
+                        help="slowdowns below this many ms are noise (default per case, 1 to 5)")
+    parser.add_argument('--min-kb', type=float, default=MEMORY_NOISE_KB,
+                        help=f"memory growth below this many KB is noise (default {MEMORY_NOISE_KB})")
+    args = parser.parse_args()
+    cases = args.case or list(CASES)
+
+    try:
+        baseline = load_baseline(args.baseline)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    calibration_ms = calibrate(rounds=5)
+    print(f"calibration: {calibration_ms:.1f} ms" +
+          (f" (baseline {baseline['calibration_ms']:.1f} ms)" if baseline else " (no baseline)"))
+    print(f"{'case':<10} {'devices':>8} {'time ms':>10} {'devices/s':>11} {'peak KB':>10}  result")
+
+    results = {}
+    failures = 0
+    for size in args.sizes:
+        registry = generate_pci_tree(devices=size, **BENCHMARK_TREE)
+        devices = list(scan_devices(registry))
+        for case in cases:
+            elapsed_ms, case_calibration_ms, relative_time, peak_kb = measure(case, registry, devices, args.repeat)
+            result = {'devices': len(devices), 'time_ms': round(elapsed_ms, 3), 'peak_kb': round(peak_kb, 1),
+                      'calibration_ms': case_calibration_ms, 'relative_time': relative_time}
+            key = f"{case}/{size}"
+            results[key] = result
+
+            expected = baseline['results'].get(key) if baseline else None
+            if args.save_baseline:
+                verdict = "recorded"
+            elif expected is None:
+                verdict = "no baseline"
+            else:
+                problems = compare(case, result, expected, args)
+                failures += bool(problems)
+                change = (result['relative_time'] / expected['relative_time'] - 1) * 100
+                verdict = "REGRESSION: " + ', '.join(problems) if problems else f"ok ({change:+.0f}%)"
+            rate = len(devices) / (elapsed_ms / 1000) if elapsed_ms else 0
+            print(f"{case:<10} {len(devices):>8} {elapsed_ms:>10.2f} {rate:>11.0f} {peak_kb:>10.0f}  {verdict}",
+                  flush=True)
+        del registry, devices
+
+    if args.save_baseline:
+        if baseline:
+            # Sizes and cases not run this time keep their previous entries, relative times carry over as is
+            results = {**baseline['results'], **results}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'version': BASELINE_VERSION, 'python': platform.python_version(),
+                       'calibration_ms': calibration_ms,
+                       'results': {key: {'devices': result['devices'], 'relative_time': result['relative_time'],
+                                         'time_ms': result['time_ms'], 'peak_kb': result['peak_kb']}
+                                   for key, result in sorted(results.items())}}, f, indent=1)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if failures:
+        print(f"{failures} case(s) regressed", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,24 +3,74 @@ import sys
 import subprocess
 import shutil
 
-def build():
+# Each layout has its own output folder, so both builds can be kept side by side
+DIST_DIRS = {False: "dist", True: "dist-onedir"}
+
+def build(onedir=False):
     print("Building Nomoject...")
     
-    # Clean previous builds
+    # --onefile unpacks the whole bundle to a temporary folder on every launch,
+    # --onedir leaves it unpacked next to the executable and starts faster
+    layout = "--onedir" if onedir else "--onefile"
+    dist_dir = DIST_DIRS[onedir]
+    
+    # Clean previous builds of this layout
     if os.path.exists("build"):
         shutil.rmtree("build")
-    if os.path.exists("dist"):
-        shutil.rmtree("dist")
+    if os.path.exists(dist_dir):
+        shutil.rmtree(dist_dir)
+    
+    # Device names, compiled from pci.ids (https://pci-ids.ucw.cz/v2.2/pci.ids) when it is present
+    pci_ids_data = []
+    if os.path.exists("pci.ids"):
+        from pciids import compile_pci_ids, INDEX_FILENAME
+        print(f"Compiled {compile_pci_ids('pci.ids', INDEX_FILENAME)} PCI ID names")
+        pci_ids_data = ["--add-data", f"{INDEX_FILENAME};."]
+    
+    # Boot-time apply agent, kept free of the GUI and network stacks. Always a single
+    # file, since the GUI bundles it and copies it out for the startup task
+    agent_cmd = [
+        "pyinstaller",
+        "--name=NomojectApply",
+        "--noconsole",
+        "--onefile",
+        "--clean",
+        "--noconfirm",
+        "--distpath", dist_dir,
+        "--exclude-module", "PyQt5",
+        "--exclude-module", "requests",
+        "--exclude-module", "urllib3",
+        "apply.py"
+    ]
+    
+    # Console command line tool, also without the GUI and network stacks
+    cli_cmd = [
+        "pyinstaller",
+        "--name=NomojectCLI",
+        "--console",
+        layout,
+        "--clean",
+        "--noconfirm",
+        "--distpath", dist_dir,
+        "--exclude-module", "PyQt5",
+        "--exclude-module", "requests",
+        "--exclude-module", "urllib3",
+        *pci_ids_data,
+        "cli.py"
+    ]
     
     # PyInstaller
     cmd = [
         "pyinstaller",
         "--name=Nomoject",
         "--windowed",
-        "--onefile",
+        layout,
         "--clean",
         "--noconfirm",
+        "--distpath", dist_dir,
         "--add-data", "locales;locales",
+        "--add-binary", f"{os.path.join(dist_dir, 'NomojectApply.exe')};.",
+        *pci_ids_data,
         "nomoject.py"
     ]
     
@@ -29,9 +79,13 @@ def build():
         cmd.extend(["--icon=icon.ico"])
     
     try:
+        subprocess.run(agent_cmd, check=True)
+        subprocess.run(cli_cmd, check=True)
         subprocess.run(cmd, check=True)
         print("\nBuild completed successfully!")
-        print(f"Executable location: {os.path.join('dist', 'Nomoject.exe')}")
+        folders = ("Nomoject", "NomojectCLI") if onedir else ("", "")
+        print(f"Executable location: {os.path.join(dist_dir, folders[0], 'Nomoject.exe')}")
+        print(f"Command line tool: {os.path.join(dist_dir, folders[1], 'NomojectCLI.exe')}")
     except subprocess.CalledProcessError as e:
         print(f"\nError during build: {e}")
         sys.exit(1)
@@ -40,4 +94,4 @@ def build():
         sys.exit(1)
 
 if __name__ == "__main__":
-    build() 
\ No newline at end of file
+    build(onedir="--onedir" in sys.argv[1:]) 
\ No newline at end of file
@@ -0,0 +1,103 @@
+import os
+import json
+import zlib
+import base64
+import hashlib
+from devices import Device
+
+CACHE_MAGIC = b"NMJC"
+CACHE_VERSION = 3
+
+# Values beyond this budget are not cached and get read again when needed
+MAX_CACHED_VALUE_BYTES = 8 * 1024 * 1024
+MAX_CACHED_DEVICES = 100000
+
+
+def encode_data(data):
+    """Makes value data JSON serializable, bytes are stored as base64"""
+    if isinstance(data, (bytes, bytearray)):
+        return {'b64': base64.b64encode(data).decode('ascii')}
+    return data
+
+
+def decode_data(data):
+    if isinstance(data, dict):
+        return base64.b64decode(data['b64'])
+    return data
+
+
+def data_size(data):
+    if isinstance(data, (bytes, bytearray, str)):
+        return len(data)
+    if isinstance(data, list):
+        return sum(len(s) for s in data)
+    return 8
+
+
+def save_device_cache(path, source, devices, stamps):
+    """
+    Writes the device list and vendor stamps for the given registry source.
+    The file is replaced atomically and carries a checksum, so a crash or
+    a damaged file can only ever cost a full scan.
+    """
+    budget = MAX_CACHED_VALUE_BYTES
+    # Vendors with devices past the cap lose their stamp, so they are rescanned instead of trusted
+    truncated = {device.group for device in devices[MAX_CACHED_DEVICES:]}
+    cached_devices = []
+    for device in devices[:MAX_CACHED_DEVICES]:
+        values, last_write = device.values, device.last_write
+        if values is not None:
+            budget -= sum(data_size(data) for _, data, _ in values)
+            if budget >= 0:
+                values = [[name, encode_data(data), type_] for name, data, type_ in values]
+        if budget < 0 or values is None:
+            # Over budget: last_write None makes refresh_stale_devices read the key again
+            values, last_write = None, None
+        cached_devices.append([device.bus, device.vendor_key, device.instance, device.desc, values, last_write])
+
+    payload = zlib.compress(json.dumps({
+        'source': source,
+        'devices': cached_devices,
+        'stamps': [[name, vendor_last_write, instance_stamps]
+                   for name, (vendor_last_write, instance_stamps) in stamps.items() if name not in truncated]
+    }, separators=(',', ':')).encode('utf-8'), 1)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(CACHE_MAGIC + bytes([CACHE_VERSION]) + hashlib.sha256(payload).digest() + payload)
+    os.replace(tmp_path, path)
+
+
+def load_device_cache(path, source):
+    """Returns (devices, stamps) cached for the given source, or None if there is no usable cache"""
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+    except OSError:
+        return None
+
+    header_size = len(CACHE_MAGIC) + 1 + 32
+    if (len(content) < header_size or not content.startswith(CACHE_MAGIC)
+            or content[len(CACHE_MAGIC)] != CACHE_VERSION):
+        return None
+    digest, payload = content[len(CACHE_MAGIC) + 1:header_size], content[header_size:]
+    if hashlib.sha256(payload).digest() != digest:
+        return None
+
+    try:
+        cache = json.loads(zlib.decompress(payload))
+        if cache['source'] != source:
+            return None
+        devices = []
+        for bus, vendor_key, instance, desc, values, last_write in cache['devices']:
+            if values is not None:
+                values = [(name, decode_data(data), type_) for name, data, type_ in values]
+            devices.append(Device(vendor_key, instance, desc, values, last_write, bus))
+        stamps = {
+            name: (vendor_last_write, tuple((instance, last_write) for instance, last_write in instance_stamps))
+            for name, vendor_last_write, instance_stamps in cache['stamps']
+        }
+    except (ValueError, KeyError, TypeError, zlib.error):
+        return None
+    return devices, stamps
@@ -0,0 +1,406 @@
+"""
+Nomoject command line interface, for scripted and unattended runs.
+
+Examples:
+    python cli.py list --format csv
+    python cli.py backup pci_keys.reg
+    python cli.py generate hide.reg --vendor "VEN_1AF4*"
+    python cli.py apply --description "virtio" --dry-run
+    python cli.py fleet images/ out/ --vendor "VEN_1AF4*"
+    python cli.py generate hide.reg --selection rules.json
+    python cli.py --profile trace.json list
+    python cli.py diff pci_keys_backup_old.reg pci_keys_backup_new.reg
+    python cli.py snapshot --label "before update"
+    python cli.py export-snapshot 20250101_120000_000000 restore.reg
+    python cli.py guard --selection rules.json
+
+The GUI toolkit is never imported, so commands start quickly.
+"""
+import os
+import re
+import sys
+import argparse
+import instrument
+from instrument import span
+from registry import open_registry
+from devices import (scan_devices, select_devices, get_value, non_removable, DeviceFilter,
+                     CM_DEVCAP_REMOVABLE)
+
+DEVICE_FIELDS = ['path', 'bus', 'desc', 'vendor_key', 'instance']
+
+
+def write_records(records, fields, output_format, output=None):
+    """Writes records as JSON or CSV to a file or to stdout"""
+    f = open(output, 'w', encoding='utf-8', newline='') if output else sys.stdout
+    try:
+        if output_format == 'csv':
+            import csv
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore', lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(records)
+        else:
+            import json
+            json.dump([{field: record[field] for field in fields} for record in records], f, indent=2)
+            f.write('\n')
+    finally:
+        if output:
+            f.close()
+
+
+def load_selected_devices(args):
+    with span('open_registry'):
+        registry = open_registry(args.registry or os.environ.get('NOMOJECT_REGISTRY'))
+    device_filter = build_device_filter(args)
+    with span('scan'):
+        devices = list(select_devices(scan_devices(registry, device_filter=device_filter),
+                                      args.vendor, args.instance, args.description))
+    if args.selection:
+        devices = args.selection.hidden(devices)
+    return registry, devices
+
+
+def build_device_filter(args):
+    """Compiles the scan filter options, the vendor wildcard also prunes the scan"""
+    return DeviceFilter(
+        buses=args.bus or ['PCI'],
+        capabilities_mask=args.capabilities_mask,
+        capabilities_value=args.capabilities_value,
+        hardware_id=args.hardware_id,
+        class_guids=args.class_guid,
+        vendor=args.vendor
+    )
+
+
+def load_selection_argument(path):
+    """Compiles a rules file while parsing arguments, so mistakes are reported as usage errors"""
+    from selection import load_selection
+
+    try:
+        return load_selection(path)
+    except (OSError, ValueError) as e:
+        raise argparse.ArgumentTypeError(f"{path}: {e}")
+
+
+def cmd_list(args):
+    _, devices = load_selected_devices(args)
+    write_records([device.as_dict() for device in devices], DEVICE_FIELDS, args.format, args.output)
+    return 0
+
+
+def cmd_backup(args):
+    from regfile import write_devices_backup
+
+    _, devices = load_selected_devices(args)
+    write_devices_backup(args.file, devices)
+    print(f"Backed up {len(devices)} device(s) to {args.file}", file=sys.stderr)
+    return 0
+
+
+def cmd_snapshot(args):
+    from backupstore import BackupStore
+
+    _, devices = load_selected_devices(args)
+    result = BackupStore(args.store).take_snapshot(devices, args.label)
+    if result['created']:
+        print(f"Snapshot {result['id']}: {result['keys']} key(s), {result['stored']} new", file=sys.stderr)
+    else:
+        print(f"Unchanged since snapshot {result['id']}", file=sys.stderr)
+    print(result['id'])
+    return 0
+
+
+def cmd_snapshots(args):
+    from backupstore import BackupStore
+
+    store = BackupStore(args.store)
+    records = []
+    for snapshot_id in store.snapshot_ids():
+        manifest = store.load_snapshot(snapshot_id)
+        records.append({'id': snapshot_id, 'created': manifest['created'], 'label': manifest['label'],
+                        'keys': len(manifest['keys'])})
+    write_records(records, ['id', 'created', 'label', 'keys'], args.format, args.output)
+    return 0
+
+
+def cmd_export_snapshot(args):
+    from backupstore import BackupStore
+
+    count = BackupStore(args.store).export_snapshot(args.snapshot, args.file)
+    print(f"Exported {count} key(s) to {args.file}", file=sys.stderr)
+    return 0
+
+
+def cmd_generate(args):
+    from regfile import write_capabilities_file
+
+    _, devices = load_selected_devices(args)
+    if not devices:
+        print("No devices selected", file=sys.stderr)
+        return 1
+
+    file_path = args.file if args.file.endswith('.reg') else args.file + '.reg'
+    if args.registry and not args.store:
+        # The local store holds this machine's history, not that of an image read with --registry
+        print("No backup snapshot for a --registry file, give --store to record one", file=sys.stderr)
+    elif not args.no_backup:
+        from backupstore import BackupStore
+
+        # Same as the GUI, the snapshot is labelled with the file it backs up
+        result = BackupStore(args.store).take_snapshot(devices, os.path.basename(file_path))
+        print(f"Backup in snapshot {result['id']}", file=sys.stderr)
+    write_capabilities_file(file_path, devices, args.capabilities)
+    print(f"Wrote {len(devices)} device(s) to {file_path}", file=sys.stderr)
+    return 0
+
+
+def require_live_registry(args):
+    """Write commands refuse --registry, changes to a file backend would be silently lost"""
+    if args.registry:
+        raise ValueError(f"{args.command} changes the live registry, --registry files are read-only "
+                         "(use generate to write a .reg file)")
+
+
+def cmd_apply(args):
+    from apply import apply_capabilities, count_results, UNCHANGED, PENDING, FAILED
+
+    if not args.dry_run:
+        require_live_registry(args)
+    registry, devices = load_selected_devices(args)
+    paths = [device.path for device in devices]
+    if args.dry_run:
+        results = []
+        for device in devices:
+            previous = get_value(device.values, "Capabilities")
+            target = non_removable(previous) if args.capabilities is None else args.capabilities
+            status = UNCHANGED if previous == target else PENDING
+            results.append({'path': device.path, 'status': status, 'previous': previous, 'error': None})
+    else:
+        results = apply_capabilities(registry, paths, args.capabilities)
+
+    write_records(results, ['path', 'status', 'previous', 'error'], args.format, args.output)
+    return 1 if not args.dry_run and count_results(results)[FAILED] else 0
+
+
+def cmd_fleet(args):
+    from fleet import run_fleet, SUMMARY_FILENAME
+
+    def on_progress(done, total, result):
+        line = f"[{done}/{total}] {result['image']}: {result['status']}"
+        if result['error']:
+            line += f" ({result['error']})"
+        print(line, file=sys.stderr, flush=True)
+
+    summary = run_fleet(args.directory, args.output_dir, args.workers,
+                        (args.vendor, args.instance, args.description), args.capabilities, on_progress,
+                        build_device_filter(args), args.selection)
+    print(f"{summary['images']} image(s), {summary['devices']} device(s), {summary['failed']} failed "
+          f"in {summary['elapsed_ms'] / 1000:.1f} s; summary in "
+          f"{os.path.join(args.output_dir, SUMMARY_FILENAME)}", file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+
+def build_match(args):
+    """Returns match(device) for the guard's device selectors, or None when none is given"""
+    selectors = (args.vendor, args.instance, args.description)
+    if any(selectors):
+        return lambda device: any(select_devices([device], *selectors))
+    if args.hardware_id or args.class_guid:
+        # Already applied by the scan filter, so every device the guard sees matches
+        return lambda device: True
+    return None
+
+
+def cmd_guard(args):
+    from hotplug import HotplugGuard, build_rule
+    from watcher import create_change_source
+    from apply import load_policy, APPLIED, FAILED
+
+    require_live_registry(args)
+    paths = None
+    capabilities = args.capabilities
+    if args.policy:
+        try:
+            capabilities, paths = load_policy(args.policy)
+        except ValueError as e:
+            raise OSError(f"{args.policy}: {e}")
+    try:
+        should_hide = build_rule(paths, args.selection, build_match(args))
+    except ValueError as e:
+        # Refuse rather than hide every removable device of the machine
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    registry = open_registry(os.environ.get('NOMOJECT_REGISTRY'))
+    device_filter = build_device_filter(args)
+
+    def on_applied(results, latency_ms):
+        for result in results:
+            if result['status'] in (APPLIED, FAILED):
+                line = f"{result['status']}: {result['path']}"
+                if result['error']:
+                    line += f" ({result['error']})"
+                print(line, file=sys.stderr, flush=True)
+        if latency_ms is not None:
+            print(f"hidden {latency_ms:.1f} ms after the change was signalled", file=sys.stderr, flush=True)
+
+    source = create_change_source(registry, device_filter)
+    guard = HotplugGuard(registry, source, should_hide, capabilities, device_filter, on_applied)
+    print("Guarding devices, press Ctrl+C to stop", file=sys.stderr, flush=True)
+    try:
+        guard.run(lambda: False, args.debounce / 1000, args.max_delay / 1000)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        guard.close()
+
+    stats = guard.stats()
+    latency = stats['latency_ms']
+    print(f"{stats['applied']} key(s) changed, {stats['failed']} failed, {stats['notifications']} notification(s) "
+          f"in {stats['refreshes']} refresh(es)", file=sys.stderr)
+    if stats['bursts']:
+        print(f"latency: median {latency['median']:.1f} ms, max {latency['max']:.1f} ms", file=sys.stderr)
+    return 1 if stats['failed'] else 0
+
+
+def cmd_diff(args):
+    from regdiff import diff_sources, reg_file_blocks, device_blocks
+
+    def open_source(source):
+        if source is None:
+            registry = open_registry(args.registry or os.environ.get('NOMOJECT_REGISTRY'))
+            return lambda wanted: device_blocks(registry)
+        with open(source, 'rb') as f:
+            if f.read(4) == b'regf':
+                registry = open_registry(source)
+                return lambda wanted: device_blocks(registry)
+        return lambda wanted: reg_file_blocks(source, wanted)
+
+    changes = list(diff_sources(open_source(args.old), open_source(args.new)))
+    write_records(changes, ['change', 'path', 'value', 'old', 'new'], args.format, args.output)
+    return 1 if changes else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='nomoject', description="Manage removable PCI devices without the GUI")
+    parser.add_argument('--registry', metavar='FILE',
+                        help="read an exported .reg file or an offline SYSTEM hive instead of the live registry")
+    parser.add_argument('--profile', metavar='TRACE',
+                        help="write a Chrome trace of where the time went and print a summary to stderr")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_selectors(subparser):
+        subparser.add_argument('--vendor', help="vendor key wildcard, e.g. 'VEN_1AF4&DEV_10*'")
+        subparser.add_argument('--instance', help="instance key wildcard")
+        subparser.add_argument('--description', help="regular expression searched in the description")
+        subparser.add_argument('--bus', action='append', type=str.upper,
+                               help="enumerator to scan, e.g. PCI, USB, SCSI or ACPI (repeatable, default PCI)")
+        subparser.add_argument('--capabilities-mask', type=lambda text: int(text, 0), default=CM_DEVCAP_REMOVABLE,
+                               help="Capabilities bits to test (default 0x4, removable)")
+        subparser.add_argument('--capabilities-value', type=lambda text: int(text, 0),
+                               help="value the masked bits must have (default: all set)")
+        subparser.add_argument('--hardware-id', help="regular expression one of the hardware IDs must match")
+        subparser.add_argument('--class-guid', action='append', help="device class GUID to accept (repeatable)")
+        subparser.add_argument('--selection', metavar='FILE', type=load_selection_argument,
+                               help="JSON or TOML rules file; only the devices it hides are used")
+
+    def add_output(subparser):
+        subparser.add_argument('--format', choices=['json', 'csv'], default='json')
+        subparser.add_argument('-o', '--output', help="write to a file instead of stdout")
+
+    list_parser = subparsers.add_parser('list', help="list removable devices")
+    add_selectors(list_parser)
+    add_output(list_parser)
+    list_parser.set_defaults(func=cmd_list)
+
+    backup_parser = subparsers.add_parser('backup', help="back up the keys of removable devices")
+    backup_parser.add_argument('file')
+    add_selectors(backup_parser)
+    backup_parser.set_defaults(func=cmd_backup)
+
+    def add_store(subparser):
+        subparser.add_argument('--store', metavar='DIR', help="backup store directory (default: in the settings folder)")
+
+    snapshot_parser = subparsers.add_parser('snapshot', help="record the keys of removable devices in the backup store")
+    snapshot_parser.add_argument('--label', help="note kept with the snapshot")
+    add_store(snapshot_parser)
+    add_selectors(snapshot_parser)
+    snapshot_parser.set_defaults(func=cmd_snapshot)
+
+    snapshots_parser = subparsers.add_parser('snapshots', help="list the snapshots of the backup store")
+    add_store(snapshots_parser)
+    add_output(snapshots_parser)
+    snapshots_parser.set_defaults(func=cmd_snapshots)
+
+    export_parser = subparsers.add_parser('export-snapshot', help="write a snapshot as a .reg backup")
+    export_parser.add_argument('snapshot')
+    export_parser.add_argument('file')
+    add_store(export_parser)
+    export_parser.set_defaults(func=cmd_export_snapshot)
+
+    generate_parser = subparsers.add_parser('generate', help="write a .reg file making devices non-removable")
+    generate_parser.add_argument('file')
+    generate_parser.add_argument('--no-backup', action='store_true', help="do not record a backup snapshot first")
+    generate_parser.add_argument('--capabilities', type=lambda text: int(text, 0),
+                                 help="value to write (default: the current value without the removable bit)")
+    add_store(generate_parser)
+    add_selectors(generate_parser)
+    generate_parser.set_defaults(func=cmd_generate)
+
+    apply_parser = subparsers.add_parser('apply', help="make devices non-removable directly in the registry")
+    apply_parser.add_argument('--dry-run', action='store_true', help="only report what would change")
+    apply_parser.add_argument('--capabilities', type=lambda text: int(text, 0),
+                              help="value to write (default: the current value without the removable bit)")
+    add_selectors(apply_parser)
+    add_output(apply_parser)
+    apply_parser.set_defaults(func=cmd_apply)
+
+    fleet_parser = subparsers.add_parser('fleet', help="generate .reg files for a directory of hives or .reg exports")
+    fleet_parser.add_argument('directory')
+    fleet_parser.add_argument('output_dir')
+    fleet_parser.add_argument('--workers', type=int, help="worker processes, defaults to the number of CPUs")
+    fleet_parser.add_argument('--capabilities', type=lambda text: int(text, 0),
+                              help="value to write (default: the current value without the removable bit)")
+    add_selectors(fleet_parser)
+    fleet_parser.set_defaults(func=cmd_fleet)
+
+    guard_parser = subparsers.add_parser('guard', help="stay resident and hide matching devices as soon as they appear")
+    guard_parser.add_argument('--policy', metavar='FILE', help="hide the keys of a boot-time agent policy file")
+    guard_parser.add_argument('--capabilities', type=lambda text: int(text, 0),
+                              help="value to write (default: the current value without the removable bit)")
+    guard_parser.add_argument('--debounce', type=float, metavar='MS', default=20,
+                              help="quiet time coalescing a burst of changes (default 20)")
+    guard_parser.add_argument('--max-delay', type=float, metavar='MS', default=100,
+                              help="longest a burst may postpone the refresh (default 100)")
+    add_selectors(guard_parser)
+    guard_parser.set_defaults(func=cmd_guard)
+
+    diff_parser = subparsers.add_parser('diff', help="compare two backups, or a backup and the current devices")
+    diff_parser.add_argument('old', help="backup .reg file or offline hive")
+    diff_parser.add_argument('new', nargs='?', help="defaults to the removable devices of the registry")
+    add_output(diff_parser)
+    diff_parser.set_defaults(func=cmd_diff)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.profile:
+        instrument.enable()
+    try:
+        with span(args.command):
+            return args.func(args)
+    except (OSError, ValueError, re.error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if args.profile:
+            instrument.write_trace(args.profile)
+            print(instrument.format_summary(), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    # Needed for the fleet worker processes of the frozen executable
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(main())
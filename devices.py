@@ -0,0 +1,410 @@
+import re
+import sys
+from fnmatch import fnmatch
+from instrument import span, count
+
+ENUM_PATH = r"SYSTEM\CurrentControlSet\Enum"
+PCI_ENUM_PATH = ENUM_PATH + r"\PCI"
+REMOVABLE_CAPABILITIES = 6
+NON_REMOVABLE_CAPABILITIES = 2
+
+# Capabilities bits (CM_DEVCAP_*)
+CM_DEVCAP_REMOVABLE = 0x4
+
+DEFAULT_BUSES = ('PCI',)
+# Enumerators where hot-pluggable virtual devices show up
+HOTPLUG_BUSES = ('PCI', 'USB', 'SCSI', 'ACPI')
+
+# PCI (VEN/DEV/SUBSYS) and USB (VID/PID) style hardware IDs
+PCI_ID_PATTERN = re.compile(r'(?:VEN|VID)_([0-9A-F]{4})(?:&(?:DEV|PID)_([0-9A-F]{4}))?(?:&SUBSYS_([0-9A-F]{8}))?',
+                            re.IGNORECASE)
+
+# Names Windows gives PCI functions it has no driver for, replaced by the PCI ID database name
+GENERIC_DESCRIPTIONS = frozenset((
+    'pci device', 'base system device', 'unknown device', 'multimedia controller', 'video controller',
+    'network controller', 'mass storage controller', 'pci memory controller', 'pci input device',
+    'pci simple communications controller', 'pci data acquisition and signal processing controller',
+))
+
+
+class Device:
+    """
+    A removable device found under an enumerator (PCI unless bus says otherwise).
+    Vendor key, instance and description strings are interned, since many
+    devices share them, and the PCI IDs are parsed once from the vendor key.
+    """
+    __slots__ = ('path', 'bus', 'desc', 'vendor_key', 'instance', 'vendor_id', 'device_id', 'subsys_id',
+                 'values', 'last_write')
+
+    def __init__(self, vendor_key, instance, desc, values=None, last_write=None, bus='PCI'):
+        self.bus = sys.intern(bus)
+        self.vendor_key = sys.intern(vendor_key)
+        self.instance = sys.intern(instance)
+        self.desc = sys.intern(desc)
+        self.path = f"{ENUM_PATH}\\{bus}\\{vendor_key}\\{instance}"
+        match = PCI_ID_PATTERN.match(vendor_key)
+        ids = [sys.intern(part.upper()) if part else None for part in match.groups()] if match else [None] * 3
+        self.vendor_id, self.device_id, self.subsys_id = ids
+        self.values = values
+        self.last_write = last_write
+
+    def __repr__(self):
+        return f"Device({self.path!r}, {self.desc!r})"
+
+    def copy(self):
+        """Returns a device sharing the same values list, for handing to another thread"""
+        return Device(self.vendor_key, self.instance, self.desc, self.values, self.last_write, self.bus)
+
+    def as_dict(self):
+        return {'path': self.path, 'bus': self.bus, 'desc': self.desc, 'vendor_key': self.vendor_key,
+                'instance': self.instance}
+
+    @property
+    def group(self):
+        """The enumerator and vendor key the device was scanned under, as used in stamps"""
+        return f"{self.bus}\\{self.vendor_key}"
+
+
+class DeviceStore:
+    """
+    Devices in scan order, indexed by path and by vendor, device and
+    subsystem ID so lookups and selections do not walk the whole list.
+    Adding a device with a known path replaces it in place.
+    """
+
+    def __init__(self, devices=()):
+        self._by_path = {}
+        self._by_vendor_id = {}
+        self._by_device_id = {}
+        self._by_subsys_id = {}
+        for device in devices:
+            self.add(device)
+
+    def __len__(self):
+        return len(self._by_path)
+
+    def __iter__(self):
+        return iter(list(self._by_path.values()))
+
+    def __contains__(self, path):
+        return path in self._by_path
+
+    def get(self, path, default=None):
+        return self._by_path.get(path, default)
+
+    def add(self, device):
+        previous = self._by_path.get(device.path)
+        if previous is not None:
+            self._unindex(previous)
+        self._by_path[device.path] = device
+        for index, key in self._index_keys(device):
+            index.setdefault(key, {})[device.path] = device
+        return previous
+
+    def remove(self, path):
+        """Removes and returns the device with the given path, or None"""
+        device = self._by_path.pop(path, None)
+        if device is not None:
+            self._unindex(device)
+        return device
+
+    def clear(self):
+        self._by_path.clear()
+        self._by_vendor_id.clear()
+        self._by_device_id.clear()
+        self._by_subsys_id.clear()
+
+    def with_vendor_id(self, vendor_id):
+        return list(self._by_vendor_id.get(vendor_id.upper(), {}).values())
+
+    def with_device_id(self, device_id):
+        return list(self._by_device_id.get(device_id.upper(), {}).values())
+
+    def with_subsys_id(self, subsys_id):
+        return list(self._by_subsys_id.get(subsys_id.upper(), {}).values())
+
+    def _index_keys(self, device):
+        for index, key in ((self._by_vendor_id, device.vendor_id), (self._by_device_id, device.device_id),
+                           (self._by_subsys_id, device.subsys_id)):
+            if key is not None:
+                yield index, key
+
+    def _unindex(self, device):
+        for index, key in self._index_keys(device):
+            paths = index[key]
+            del paths[device.path]
+            if not paths:
+                del index[key]
+
+
+class DeviceFilter:
+    """
+    Decides which device instances a scan reports, compiled once per scan.
+    Checks run cheapest first: enumerators and vendor keys prune whole
+    subtrees, Capabilities is tested before any other value is read, and
+    all values are only read for instances that match.
+    """
+
+    def __init__(self, buses=DEFAULT_BUSES, capabilities_mask=CM_DEVCAP_REMOVABLE, capabilities_value=None,
+                 hardware_id=None, class_guids=None, vendor=None):
+        self.buses = tuple(bus.upper() for bus in buses)
+        # A device matches when (Capabilities & mask) == value
+        self.capabilities_mask = capabilities_mask
+        self.capabilities_value = capabilities_mask if capabilities_value is None else capabilities_value
+        self.hardware_id = re.compile(hardware_id, re.IGNORECASE) if hardware_id else None
+        self.class_guids = frozenset(guid.lower() for guid in class_guids) if class_guids else None
+        self.vendor = vendor.lower() if vendor else None
+
+    @classmethod
+    def from_config(cls, config):
+        """Builds a filter from a settings dict, missing keys keep their defaults"""
+        config = config or {}
+        return cls(
+            buses=config.get('buses') or DEFAULT_BUSES,
+            capabilities_mask=config.get('capabilities_mask', CM_DEVCAP_REMOVABLE),
+            capabilities_value=config.get('capabilities_value'),
+            hardware_id=config.get('hardware_id'),
+            class_guids=config.get('class_guids'),
+            vendor=config.get('vendor')
+        )
+
+    def accepts_vendor(self, vendor_key_name):
+        return self.vendor is None or fnmatch(vendor_key_name.lower(), self.vendor)
+
+    def accepts_capabilities(self, capabilities):
+        return isinstance(capabilities, int) and capabilities & self.capabilities_mask == self.capabilities_value
+
+    def accepts_instance(self, registry, instance_key):
+        """Tests the value-based conditions, reading only the values they need"""
+        if self.hardware_id is not None:
+            try:
+                hardware_ids, _ = registry.query_value(instance_key, "HardwareID")
+            except OSError:
+                return False
+            if isinstance(hardware_ids, str):
+                hardware_ids = [hardware_ids]
+            if not any(self.hardware_id.search(hardware_id) for hardware_id in hardware_ids or ()):
+                return False
+        if self.class_guids is not None:
+            try:
+                class_guid, _ = registry.query_value(instance_key, "ClassGUID")
+            except OSError:
+                return False
+            if not isinstance(class_guid, str) or class_guid.lower() not in self.class_guids:
+                return False
+        return True
+
+
+DEFAULT_FILTER = DeviceFilter()
+
+
+def open_device_groups(registry, device_filter=DEFAULT_FILTER):
+    """
+    Opens the enumerator keys the filter covers and lists their vendor keys.
+    Returns (bus_keys, groups) with groups as (bus, vendor_key_name) pairs;
+    the caller closes the bus keys.
+    """
+    bus_keys = {}
+    groups = []
+    for bus in device_filter.buses:
+        try:
+            bus_key = registry.open_key(f"{ENUM_PATH}\\{bus}")
+        except OSError:
+            continue  # Enumerator not present on this system
+        bus_keys[bus] = bus_key
+        groups.extend((bus, name) for name in list(registry.enum_keys(bus_key)) if device_filter.accepts_vendor(name))
+    return bus_keys, groups
+
+
+def scan_devices(registry, on_progress=None, is_cancelled=None, stamps=None, device_filter=DEFAULT_FILTER):
+    """
+    Walks the enumerators of the filter and yields every device it accepts.
+    on_progress(done, total) is called after each vendor key and the walk
+    stops early once is_cancelled() returns True. If a stamps dict is given
+    it receives the stamp of every vendor key walked (see scan_vendor),
+    keyed by "BUS\\vendor key".
+    """
+    with span('devices.open_groups'):
+        bus_keys, groups = open_device_groups(registry, device_filter)
+    try:
+        total = len(groups)
+
+        for done, (bus, vendor_key_name) in enumerate(groups, 1):
+            if is_cancelled and is_cancelled():
+                return
+
+            try:
+                with span('devices.scan_vendor'):
+                    devices, stamp = scan_vendor(registry, bus_keys[bus], vendor_key_name, bus, device_filter)
+            except OSError:
+                continue
+            if stamps is not None:
+                stamps[f"{bus}\\{vendor_key_name}"] = stamp
+            yield from devices
+
+            if on_progress:
+                on_progress(done, total)
+    finally:
+        for bus_key in bus_keys.values():
+            registry.close_key(bus_key)
+
+
+def scan_vendor(registry, bus_key, vendor_key_name, bus='PCI', device_filter=DEFAULT_FILTER):
+    """
+    Reads the matching devices under one vendor key.
+    Returns (devices, stamp) where stamp holds the last write times of the
+    vendor key and each of its instance keys, so later changes anywhere in
+    the subtree can be detected without reading any values.
+    """
+    vendor_key = registry.open_key(vendor_key_name, bus_key)
+    try:
+        vendor_last_write = registry.query_info(vendor_key)[2]
+        devices = []
+        instance_stamps = []
+        for instance_name in list(registry.enum_keys(vendor_key)):
+            device, last_write = read_device(registry, vendor_key, vendor_key_name, instance_name, bus, device_filter)
+            instance_stamps.append((instance_name, last_write))
+            if device is not None:
+                devices.append(device)
+    finally:
+        registry.close_key(vendor_key)
+    return devices, (vendor_last_write, tuple(instance_stamps))
+
+
+def read_vendor_stamp(registry, bus_key, vendor_key_name):
+    """Returns the same stamp as scan_vendor by querying key info only"""
+    vendor_key = registry.open_key(vendor_key_name, bus_key)
+    try:
+        vendor_last_write = registry.query_info(vendor_key)[2]
+        instance_stamps = []
+        for instance_name in list(registry.enum_keys(vendor_key)):
+            try:
+                instance_key = registry.open_key(instance_name, vendor_key)
+            except OSError:
+                instance_stamps.append((instance_name, None))
+                continue
+            try:
+                instance_stamps.append((instance_name, registry.query_info(instance_key)[2]))
+            finally:
+                registry.close_key(instance_key)
+    finally:
+        registry.close_key(vendor_key)
+    return vendor_last_write, tuple(instance_stamps)
+
+
+def read_device(registry, vendor_key, vendor_key_name, instance_name, bus='PCI', device_filter=DEFAULT_FILTER):
+    """
+    Reads an instance key, returning (device, last_write) where device is
+    None if the filter rejects the instance. All values of a matching device
+    are captured along with the key's last write time, so backups can be
+    served without reading the key again.
+    """
+    try:
+        instance_key = registry.open_key(instance_name, vendor_key)
+    except OSError:
+        return None, None
+
+    last_write = None
+    try:
+        last_write = registry.query_info(instance_key)[2]
+        capabilities, _ = registry.query_value(instance_key, "Capabilities")
+        if not device_filter.accepts_capabilities(capabilities):
+            return None, last_write
+        if not device_filter.accepts_instance(registry, instance_key):
+            return None, last_write
+
+        values = list(registry.enum_values(instance_key))
+        count('registry.values_read', len(values))
+    except OSError:
+        return None, last_write
+    finally:
+        registry.close_key(instance_key)
+
+    device_desc = get_value(values, "DeviceDesc")
+    if not isinstance(device_desc, str):
+        return None, last_write
+    if ';' in device_desc:
+        device_desc = device_desc.split(';')[-1]
+    device_desc = describe_device(bus, vendor_key_name, device_desc)
+
+    return Device(vendor_key_name, instance_name, device_desc, values, last_write, bus), last_write
+
+
+def describe_device(bus, vendor_key_name, device_desc):
+    """Returns the PCI ID database name for a generic or unresolved (@oem*.inf) description"""
+    if bus != 'PCI' or not (device_desc.startswith('@') or device_desc.strip().lower() in GENERIC_DESCRIPTIONS):
+        return device_desc
+    match = PCI_ID_PATTERN.match(vendor_key_name)
+    if not match:
+        return device_desc
+    # Imported here so the database is only mapped once a device needs it
+    from pciids import lookup_device_name
+    return lookup_device_name(*match.groups()) or device_desc
+
+
+def non_removable(capabilities):
+    """Returns the Capabilities value that hides a device, with only the removable bit cleared"""
+    if not isinstance(capabilities, int):
+        return NON_REMOVABLE_CAPABILITIES
+    return capabilities & ~CM_DEVCAP_REMOVABLE
+
+
+def get_value(values, name, default=None):
+    """Looks up a captured value by name (case-insensitive)"""
+    # Names nearly always have their usual case, so look for that before lower-casing every name
+    for value_name, data, _ in values:
+        if value_name == name:
+            return data
+    name = name.lower()
+    for value_name, data, _ in values:
+        if value_name.lower() == name:
+            return data
+    return default
+
+
+def refresh_stale_devices(registry, devices):
+    """
+    Re-reads the values of devices whose key changed since they were captured.
+    Only the key's last write time is queried for unchanged devices. Devices
+    whose key was removed since are skipped. Returns the number of devices
+    that were refreshed and the list of those whose key no longer exists.
+    """
+    refreshed = 0
+    missing = []
+    with span('devices.refresh_stale'):
+        for device in devices:
+            try:
+                key = registry.open_key(device.path)
+            except FileNotFoundError:
+                missing.append(device)
+                continue
+            try:
+                last_write = registry.query_info(key)[2]
+                if last_write != device.last_write:
+                    device.values = list(registry.enum_values(key))
+                    count('registry.values_read', len(device.values))
+                    device.last_write = last_write
+                    refreshed += 1
+            finally:
+                registry.close_key(key)
+        count('devices.missing', len(missing))
+    return refreshed, missing
+
+
+def select_devices(devices, vendor=None, instance=None, description=None):
+    """
+    Filters devices by vendor key and instance wildcards (case-insensitive)
+    and by a regular expression searched in the description.
+    """
+    vendor = vendor.lower() if vendor else None
+    instance = instance.lower() if instance else None
+    description = re.compile(description, re.IGNORECASE) if description else None
+
+    for device in devices:
+        if vendor and not fnmatch(device.vendor_key.lower(), vendor):
+            continue
+        if instance and not fnmatch(device.instance.lower(), instance):
+            continue
+        if description and not description.search(device.desc):
+            continue
+        yield device
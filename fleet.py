@@ -0,0 +1,138 @@
+"""
+Fleet processing: runs the scan, selection and .reg generation for a whole
+directory of VM images (offline SYSTEM hives or exported .reg files) on a
+pool of worker processes.
+
+Each image is handled independently in a worker and only a small summary
+travels back, so a failing image never affects the others and throughput
+grows with the number of cores.
+"""
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from devices import DEFAULT_FILTER
+
+SUMMARY_FILENAME = 'fleet_summary.json'
+
+# Image statuses
+DONE = 'done'
+NO_DEVICES = 'no_devices'
+FAILED = 'failed'
+
+
+def is_image(path):
+    """Returns True for .reg files and files starting with the regf signature"""
+    if path.lower().endswith('.reg'):
+        return True
+    try:
+        with open(path, 'rb') as f:
+            return f.read(4) == b'regf'
+    except OSError:
+        return False
+
+
+def find_images(directory):
+    """Returns the image files below a directory, sorted by path"""
+    images = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if is_image(path):
+                images.append(path)
+    return images
+
+
+def output_name(directory, image):
+    """Derives a unique output file prefix from the image path relative to the fleet directory"""
+    relative = os.path.splitext(os.path.relpath(image, directory))[0]
+    return relative.replace(os.sep, '_').replace('/', '_')
+
+
+def process_image(image, prefix, selectors=(None, None, None), capabilities=None,
+                  device_filter=DEFAULT_FILTER, selection=None):
+    """
+    Scans one image and writes <prefix>.reg with the selected devices made
+    non-removable and <prefix>_backup.reg with their current keys. If a
+    compiled DeviceSelection is given, only the devices it hides are kept.
+    Runs in a worker process and returns a summary dict, never raises.
+    """
+    # Imported here so workers only load what they use
+    from registry import open_registry
+    from devices import scan_devices, select_devices
+    from regfile import write_devices_backup, write_capabilities_file
+
+    started = time.perf_counter()
+    result = {'image': image, 'status': FAILED, 'devices': 0, 'outputs': [], 'error': None}
+    registry = None
+    try:
+        registry = open_registry(image)
+        devices = list(select_devices(scan_devices(registry, device_filter=device_filter), *selectors))
+        if selection is not None:
+            devices = selection.hidden(devices)
+        result['devices'] = len(devices)
+        if devices:
+            backup_path, file_path = prefix + '_backup.reg', prefix + '.reg'
+            write_devices_backup(backup_path, devices)
+            write_capabilities_file(file_path, devices, capabilities)
+            result['outputs'] = [file_path, backup_path]
+            result['status'] = DONE
+        else:
+            result['status'] = NO_DEVICES
+    except Exception as e:
+        # Anything going wrong with one image is reported, not propagated
+        result['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        if registry is not None and hasattr(registry, 'close'):
+            registry.close()
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def run_fleet(directory, output_dir, workers=None, selectors=(None, None, None),
+              capabilities=None, on_progress=None, device_filter=DEFAULT_FILTER,
+              selection=None):
+    """
+    Processes every image below directory into output_dir and writes the
+    consolidated summary there. on_progress(done, total, result) is called
+    in completion order. Returns the summary dict.
+    """
+    started = time.perf_counter()
+    images = find_images(directory)
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    if images:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=min(workers, len(images))) as executor:
+            futures = {
+                executor.submit(process_image, image, os.path.join(output_dir, output_name(directory, image)),
+                                selectors, capabilities, device_filter, selection): image
+                for image in images
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker process itself died, e.g. killed or out of memory
+                    result = {'image': futures[future], 'status': FAILED, 'devices': 0, 'outputs': [],
+                              'error': f"{type(e).__name__}: {e}", 'elapsed_ms': None}
+                results.append(result)
+                if on_progress:
+                    on_progress(len(results), len(images), result)
+
+    results.sort(key=lambda result: result['image'])
+    summary = {
+        'directory': directory,
+        'images': len(images),
+        'done': sum(1 for result in results if result['status'] == DONE),
+        'no_devices': sum(1 for result in results if result['status'] == NO_DEVICES),
+        'failed': sum(1 for result in results if result['status'] == FAILED),
+        'devices': sum(result['devices'] for result in results),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        'results': results
+    }
+    with open(os.path.join(output_dir, SUMMARY_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    return summary
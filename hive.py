@@ -0,0 +1,255 @@
+"""
+Read-only access to offline registry hive files (the binary "regf" format).
+
+The hive is memory-mapped and cells are decoded in place with
+struct.unpack_from, so only the keys actually visited are ever read.
+HiveRegistry implements the registry backend interface, which lets the
+regular device scan run against a SYSTEM hive taken from a VM disk image.
+"""
+import mmap
+import struct
+from registry import RegistryBackend, REG_DWORD
+from instrument import count
+from regfile import decode_value_data
+
+REGF_SIGNATURE = b"regf"
+BASE_BLOCK_SIZE = 4096
+
+# Key node flags
+KEY_COMP_NAME = 0x20
+# Value flags
+VALUE_COMP_NAME = 0x1
+
+# Data larger than this is split into segments behind a "db" cell
+BIG_DATA_SEGMENT_SIZE = 16344
+DATA_INLINE_FLAG = 0x80000000
+
+NK_HEADER = struct.Struct('<2sHQ4xII4xI4xIIII20xHH')
+VK_HEADER = struct.Struct('<2sHIIIH2x')
+
+
+class HiveKey:
+    """An opened key of an offline hive: the offset of its key node cell"""
+    __slots__ = ('offset',)
+
+    def __init__(self, offset):
+        self.offset = offset
+
+
+class Hive:
+    """Decodes cells of a memory-mapped regf file"""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise OSError(f"Empty hive file: {path}")
+        if self.data[:4] != REGF_SIGNATURE or len(self.data) < BASE_BLOCK_SIZE:
+            self.close()
+            raise OSError(f"Not a registry hive: {path}")
+        self.minor_version = struct.unpack_from('<I', self.data, 0x18)[0]
+        self.root_offset = struct.unpack_from('<I', self.data, 0x24)[0]
+        # Subkey name lookups, built lazily per parent key
+        self._children = {}
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self._file.close()
+
+    def unpack(self, layout, position, offset):
+        """Unpacks a struct format at position, a read past the end of the file is blamed on the cell at offset"""
+        try:
+            return struct.unpack_from(layout, self.data, position)
+        except struct.error:
+            raise OSError(f"Corrupt hive: cell at {offset:#x} runs past the end of the file") from None
+
+    def read(self, position, length, offset):
+        """Returns length bytes at position, which must lie within the file"""
+        if position + length > len(self.data):
+            raise OSError(f"Corrupt hive: cell at {offset:#x} runs past the end of the file")
+        return self.data[position:position + length]
+
+    def cell(self, offset):
+        """Returns (position, size) of a cell's data in the file"""
+        position = BASE_BLOCK_SIZE + offset
+        size, = self.unpack('<i', position, offset)
+        # Allocated cells have a negative size that includes the size field
+        size = (-size if size < 0 else size) - 4
+        if size < 0 or position + 4 + size > len(self.data):
+            raise OSError(f"Corrupt hive: bad cell size at {offset:#x}")
+        return position + 4, size
+
+    def key_node(self, offset):
+        """Returns the decoded header fields of an "nk" cell"""
+        position, _ = self.cell(offset)
+        (signature, flags, last_write, _, subkey_count, subkey_list,
+         value_count, value_list, _, _, name_length, _) = self.unpack(NK_HEADER.format, position, offset)
+        if signature != b'nk':
+            raise OSError(f"Corrupt hive: expected key node at {offset:#x}")
+        raw_name = self.read(position + NK_HEADER.size, name_length, offset)
+        name = raw_name.decode('latin-1') if flags & KEY_COMP_NAME else raw_name.decode('utf-16-le')
+        return name, last_write, subkey_count, subkey_list, value_count, value_list
+
+    def subkey_offsets(self, list_offset, nested=False):
+        """Yields key node offsets from an lf/lh/li/ri subkey list"""
+        position, _ = self.cell(list_offset)
+        signature, count = self.unpack('<2sH', position, list_offset)
+        if signature in (b'lf', b'lh'):
+            # Offset and name hint pairs
+            yield from self.unpack(f'<{count * 2}I', position + 4, list_offset)[::2]
+        elif signature == b'li':
+            yield from self.unpack(f'<{count}I', position + 4, list_offset)
+        elif signature == b'ri' and not nested:
+            # An index root only points to leaf lists, which also stops a list referring to itself
+            for sublist in self.unpack(f'<{count}I', position + 4, list_offset):
+                yield from self.subkey_offsets(sublist, nested=True)
+        else:
+            raise OSError(f"Corrupt hive: unknown subkey list at {list_offset:#x}")
+
+    def subkeys(self, offset):
+        """Yields (name, offset) for the subkeys of a key node"""
+        _, _, subkey_count, subkey_list, _, _ = self.key_node(offset)
+        if not subkey_count:
+            return
+        for child in self.subkey_offsets(subkey_list):
+            yield self.key_node(child)[0], child
+
+    def find_subkey(self, offset, name):
+        children = self._children.get(offset)
+        if children is None:
+            children = {child_name.lower(): child for child_name, child in self.subkeys(offset)}
+            self._children[offset] = children
+        child = children.get(name.lower())
+        if child is None:
+            raise FileNotFoundError(f"Registry key not found: {name}")
+        return child
+
+    def value_offsets(self, offset):
+        _, _, _, _, value_count, value_list = self.key_node(offset)
+        if not value_count:
+            return ()
+        position, _ = self.cell(value_list)
+        return self.unpack(f'<{value_count}I', position, value_list)
+
+    def values(self, offset):
+        """Yields (name, data, type) for the values of a key node"""
+        for value_offset in self.value_offsets(offset):
+            yield self.value(value_offset)
+
+    def find_value(self, offset, name):
+        """Returns (data, type) of a value, decoding only the names of the others"""
+        name = name.lower()
+        for value_offset in self.value_offsets(offset):
+            position, header = self.value_header(value_offset)
+            if self.value_name(value_offset, position, header).lower() == name:
+                _, _, data_size, data_offset, type_, _ = header
+                return decode_value_data(self.value_data(position, data_size, data_offset), type_), type_
+        raise FileNotFoundError(f"Registry value not found: {name}")
+
+    def value_header(self, offset):
+        position, _ = self.cell(offset)
+        header = self.unpack(VK_HEADER.format, position, offset)
+        if header[0] != b'vk':
+            raise OSError(f"Corrupt hive: expected value at {offset:#x}")
+        return position, header
+
+    def value_name(self, offset, position, header):
+        name_length, flags = header[1], header[5]
+        raw_name = self.read(position + VK_HEADER.size, name_length, offset)
+        return raw_name.decode('latin-1') if flags & VALUE_COMP_NAME else raw_name.decode('utf-16-le')
+
+    def value(self, offset):
+        position, header = self.value_header(offset)
+        _, _, data_size, data_offset, type_, _ = header
+        data = decode_value_data(self.value_data(position, data_size, data_offset), type_)
+        return self.value_name(offset, position, header), data, type_
+
+    def value_data(self, vk_position, data_size, data_offset):
+        if data_size & DATA_INLINE_FLAG:
+            # Up to four bytes stored in the data offset field itself
+            size = min(data_size & ~DATA_INLINE_FLAG, 4)
+            return self.data[vk_position + 8:vk_position + 8 + size]
+        if not data_size:
+            return b''
+
+        position, cell_size = self.cell(data_offset)
+        if data_size > BIG_DATA_SEGMENT_SIZE and self.minor_version >= 4 and self.data[position:position + 2] == b'db':
+            segment_count, segment_list = self.unpack('<HI', position + 2, data_offset)
+            list_position, _ = self.cell(segment_list)
+            chunks = []
+            remaining = data_size
+            for segment in self.unpack(f'<{segment_count}I', list_position, segment_list):
+                segment_position, segment_size = self.cell(segment)
+                take = min(remaining, segment_size, BIG_DATA_SEGMENT_SIZE)
+                chunks.append(self.data[segment_position:segment_position + take])
+                remaining -= take
+            return b''.join(chunks)
+        return self.data[position:position + min(data_size, cell_size)]
+
+
+class HiveRegistry(RegistryBackend):
+    """
+    Read-only registry backend over an offline hive file.
+    The hive is mounted at HKEY_LOCAL_MACHINE\\<mount_point>, and for a SYSTEM
+    hive CurrentControlSet resolves to the control set named by Select\\Current.
+    """
+
+    def __init__(self, path, mount_point='SYSTEM'):
+        self.hive = Hive(path)
+        self.mount_point = mount_point.lower()
+        self.current_control_set = None
+        try:
+            select = self.hive.find_subkey(self.hive.root_offset, 'Select')
+            for name, data, type_ in self.hive.values(select):
+                if name.lower() == 'current' and type_ == REG_DWORD:
+                    self.current_control_set = f"ControlSet{data:03d}"
+        except FileNotFoundError:
+            pass  # Not a SYSTEM hive
+
+    def close(self):
+        self.hive.close()
+
+    def open_key(self, path, parent=None, write=False):
+        if write:
+            raise PermissionError("Offline hives are opened read-only")
+        count('registry.keys_opened')
+        parts = [part for part in path.split("\\") if part]
+        if parent is None:
+            if not parts or parts[0].lower() != self.mount_point:
+                raise FileNotFoundError(f"Registry key not found: {path}")
+            parts = parts[1:]
+            if parts and parts[0].lower() == 'currentcontrolset' and self.current_control_set:
+                parts[0] = self.current_control_set
+            offset = self.hive.root_offset
+        else:
+            offset = parent.offset
+        for part in parts:
+            offset = self.hive.find_subkey(offset, part)
+        return HiveKey(offset)
+
+    def create_key(self, path, parent=None):
+        raise PermissionError("Offline hives are opened read-only")
+
+    def close_key(self, key):
+        pass
+
+    def enum_keys(self, key):
+        for name, _ in self.hive.subkeys(key.offset):
+            yield name
+
+    def enum_values(self, key):
+        return self.hive.values(key.offset)
+
+    def query_value(self, key, name):
+        return self.hive.find_value(key.offset, name)
+
+    def query_info(self, key):
+        _, last_write, subkey_count, _, value_count, _ = self.hive.key_node(key.offset)
+        return subkey_count, value_count, last_write
+
+    def set_value(self, key, name, data, type_):
+        raise PermissionError("Offline hives are opened read-only")
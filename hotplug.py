@@ -0,0 +1,117 @@
+"""
+Resident hot-plug guard: keeps devices hidden from the Eject popup while
+the system runs, instead of only at startup.
+
+A change source signals every change below the Enum tree, which is where
+Plug and Play creates the instance key of a newly arrived device. Bursts
+of notifications are coalesced, only the vendor subtrees whose stamps
+moved are read again, and Capabilities is rewritten on just the devices
+that appeared (or reappeared as removable) and match the configured rules.
+The time from the first notification of a burst to the keys being
+written is measured for every burst.
+"""
+import time
+from statistics import median
+from apply import apply_capabilities, count_results, APPLIED, FAILED
+from devices import DEFAULT_FILTER
+from selection import HIDE
+from watcher import DeviceTracker, watch_devices
+
+# Short enough to hide a device before a user can reach the tray icon,
+# long enough to coalesce the handful of writes Plug and Play makes per arrival
+GUARD_DEBOUNCE = 0.02
+GUARD_MAX_DELAY = 0.1
+
+
+def build_rule(paths=None, selection=None, match=None):
+    """
+    Returns should_hide(device) for agent policy key paths and/or compiled
+    selection rules, narrowed by match(device) when given. Raises ValueError
+    without any of them, since the guard would then hide every removable device.
+    """
+    if paths is None and selection is None and match is None:
+        raise ValueError("No rules given: use a policy, a selection file or device selectors")
+    listed = {path.lower() for path in paths or ()}
+
+    def should_hide(device):
+        if match is not None and not match(device):
+            return False
+        if paths is None and selection is None:
+            return True
+        if device.path.lower() in listed:
+            return True
+        return selection is not None and selection.action(device) == HIDE
+
+    return should_hide
+
+
+class HotplugGuard:
+    """
+    Applies the rules to devices as they appear. It stands in as both the
+    change source and the tracker of watch_devices, so it can timestamp
+    the first notification of each burst and act on every refresh.
+    """
+
+    def __init__(self, registry, source, should_hide, capabilities=None,
+                 device_filter=DEFAULT_FILTER, on_applied=None):
+        self.registry = registry
+        self.source = source
+        self.should_hide = should_hide
+        self.capabilities = capabilities
+        self.on_applied = on_applied
+        # Starts empty, so the first refresh also hides devices present before the guard started
+        self.tracker = DeviceTracker(registry, device_filter=device_filter)
+        self.first_signal = None
+        self.refreshes = 0
+        self.counts = {APPLIED: 0, FAILED: 0}
+        self.latencies_ms = []
+
+    def wait(self, timeout):
+        signalled = self.source.wait(timeout)
+        if signalled and self.first_signal is None:
+            self.first_signal = time.perf_counter()
+        return signalled
+
+    def close(self):
+        self.source.close()
+
+    def refresh(self):
+        """Rescans the changed vendor subtrees and hides the devices that appeared"""
+        signalled_at, self.first_signal = self.first_signal, None
+        self.refreshes += 1
+        added, removed, updated = self.tracker.refresh()
+
+        paths = [device.path for device in added + updated if self.should_hide(device)]
+        if paths:
+            results = apply_capabilities(self.registry, paths, self.capabilities)
+            latency_ms = None
+            if signalled_at is not None:
+                latency_ms = round((time.perf_counter() - signalled_at) * 1000, 3)
+                self.latencies_ms.append(latency_ms)
+            counts = count_results(results)
+            self.counts[APPLIED] += counts[APPLIED]
+            self.counts[FAILED] += counts[FAILED]
+            if self.on_applied:
+                self.on_applied(results, latency_ms)
+        return added, removed, updated
+
+    def run(self, is_stopped, debounce=GUARD_DEBOUNCE, max_delay=GUARD_MAX_DELAY, poll_interval=0.5):
+        """Guards until is_stopped() returns True"""
+        watch_devices(self, self, lambda added, removed, updated: None, is_stopped,
+                      debounce, max_delay, poll_interval)
+
+    def stats(self):
+        """Returns counters and latency figures, in milliseconds, for the bursts handled so far"""
+        latencies = self.latencies_ms
+        return {
+            'notifications': self.source.notifications,
+            'refreshes': self.refreshes,
+            'applied': self.counts[APPLIED],
+            'failed': self.counts[FAILED],
+            'bursts': len(latencies),
+            'latency_ms': {
+                'last': latencies[-1] if latencies else None,
+                'median': round(median(latencies), 3) if latencies else None,
+                'max': max(latencies) if latencies else None,
+            }
+        }
@@ -0,0 +1,123 @@
+"""
+Lightweight instrumentation: named spans and counters that can be dumped
+as a Chrome trace (chrome://tracing, https://ui.perfetto.dev) and
+summarized per phase.
+
+Everything is off unless enable() is called. Disabled, span() returns a
+shared no-op context manager and count() returns after a single check, so
+the calls can stay in hot paths.
+"""
+import os
+import json
+import time
+import threading
+
+enabled = False
+
+_lock = threading.Lock()
+_events = []
+_counters = {}
+_started = 0
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A timed section recorded as a complete ("X") trace event"""
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter_ns()
+        event = {'name': self.name, 'ph': 'X', 'ts': (self.start - _started) / 1000, 'dur': (end - self.start) / 1000,
+                 'pid': os.getpid(), 'tid': threading.get_ident()}
+        if self.args:
+            event['args'] = self.args
+        with _lock:
+            _events.append(event)
+        return False
+
+
+def enable():
+    """Starts recording, clearing anything recorded before"""
+    global enabled, _started
+    with _lock:
+        _events.clear()
+        _counters.clear()
+        _started = time.perf_counter_ns()
+        enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def span(name, **args):
+    """Times a with block under a name, e.g. with span('scan'): ..."""
+    if not enabled:
+        return NULL_SPAN
+    return Span(name, args)
+
+
+def count(name, amount=1):
+    """Adds to a named counter"""
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+def summary():
+    """Returns [(name, calls, total_ms)] for every span name, slowest first"""
+    totals = {}
+    with _lock:
+        for event in _events:
+            calls, total = totals.get(event['name'], (0, 0.0))
+            totals[event['name']] = (calls + 1, total + event['dur'] / 1000)
+    return sorted(((name, calls, total) for name, (calls, total) in totals.items()), key=lambda item: -item[2])
+
+
+def format_summary(limit=None):
+    """Formats the span totals and the counters as lines of text"""
+    lines = [f"{total:10.1f} ms  {calls:6d}x  {name}" for name, calls, total in summary()[:limit]]
+    lines += [f"{value:>13}  {name}" for name, value in sorted(counters().items())]
+    return '\n'.join(lines)
+
+
+def write_trace(path):
+    """Writes the recorded spans and the final counter values in Chrome trace format"""
+    with _lock:
+        events = list(_events)
+        final = dict(_counters)
+    now = (time.perf_counter_ns() - _started) / 1000
+    pid = os.getpid()
+    events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'Nomoject'}})
+    for name, value in sorted(final.items()):
+        events.append({'name': name, 'ph': 'C', 'ts': now, 'pid': pid, 'args': {'value': value}})
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    os.replace(tmp_path, path)
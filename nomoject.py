@@ -1,58 +1,54 @@
 import os
+import re
 import sys
-import pyuac
-import winreg
+import json
+import time
 import locale
 import gettext
-import urllib3
-import requests
 import warnings
-import subprocess
-import webbrowser
-from pathlib import Path
-from PyQt5.QtCore import Qt
-from packaging import version
-from datetime import datetime
-from PyQt5.QtGui import QIcon, QFont, QPalette, QColor
+import threading
+import shutil
+
+if __name__ == '__main__':
+    # Elevate before loading Qt and the rest, the unelevated process only relaunches
+    # itself and should not pay for a full startup first
+    import pyuac
+    if not pyuac.isUserAdmin():
+        pyuac.runAsAdmin(wait=False)
+        sys.exit(0)
+
+from PyQt5.QtCore import (Qt, QThread, QTimer, QObject, QProcess, pyqtSignal, QAbstractListModel, QModelIndex,
+                          QSortFilterProxyModel)
+import instrument
+from instrument import span
+from registry import open_registry
+from devices import scan_devices, refresh_stale_devices, DeviceStore, DeviceFilter
+from settings import get_app_data_dir, load_settings, save_settings
+from watcher import DeviceTracker, FakeChangeSource, create_change_source, watch_devices
+from cache import save_device_cache, load_device_cache
+from updates import UpdateChecker, RELEASES_PAGE_URL
+from regfile import write_capabilities_file
+from backupstore import BackupStore
+from selection import load_selection
+from tasks import TaskScheduler, write_task_xml, decode_output, TASK_XML_FILENAME, INSTALL, RUN
+from apply import apply_capabilities, count_results, write_policy, APPLIED, UNCHANGED, MISSING, FAILED
+from PyQt5.QtGui import QPalette, QColor
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
-                           QListWidget, QPushButton, QMessageBox, QFileDialog,
-                           QLabel, QListWidgetItem, QHBoxLayout, QFrame,
-                           QStatusBar, QStyleFactory, QRadioButton, QButtonGroup)
+                           QListView, QPushButton, QMessageBox, QFileDialog,
+                           QLabel, QHBoxLayout, QFrame, QLineEdit,
+                           QStatusBar, QStyleFactory, QRadioButton, QButtonGroup,
+                           QProgressBar, QCheckBox)
 
 VERSION = "1.2.0"
 
-def check_for_updates():
-    """
-    Check for updates using GitHub API.
-    Returns True if a newer version is available, False otherwise.
-    """
-    try:
-        # Get the latest release from GitHub API
-        response = requests.get(
-            "http://api.github.com/repos/junglivre/Nomoject/releases/latest",
-            timeout=5
-        )
-        response.raise_for_status()
-        
-        # Get latest version from GitHub
-        latest_version = response.json()["tag_name"].replace("v", "")
-        
-        # Compare versions
-        current_ver = version.parse(VERSION)
-        latest_ver = version.parse(latest_version)
-        
-        return latest_ver > current_ver
-        
-    except Exception:
-        # In case of any error, return False to continue with the program
-        return False
+APPLY_AGENT_FILENAME = "NomojectApply.exe"
+APPLY_POLICY_FILENAME = "nomoject_policy.json"
 
 # Suppress warnings from deprecated modules and other warnings
 os.environ['PYTHONWARNINGS'] = 'ignore::DeprecationWarning'
 warnings.filterwarnings('ignore', message='.*sipPyTypeDict.*')
 warnings.filterwarnings('ignore', category=DeprecationWarning)
 warnings.filterwarnings('ignore', category=DeprecationWarning, module='sip')
-warnings.filterwarnings('ignore', category=urllib3.exceptions.InsecureRequestWarning)
 
 def get_locales_path():
     """Returns the correct path to the locales folder, whether in development or compiled"""
@@ -63,29 +59,325 @@ def get_locales_path():
         # If running in development
         return os.path.join(os.path.abspath(os.path.dirname(__file__)), 'locales')
 
-class DeviceListWidget(QListWidget):
+class Translator:
+    """
+    Holds every catalog found under locales/, loaded once, and the widget
+    texts to update when the language changes, so switching is immediate.
+    """
+
+    def __init__(self, localedir, language):
+        self.catalogs = {'en': gettext.NullTranslations()}
+        for name in sorted(os.listdir(localedir)) if os.path.isdir(localedir) else []:
+            try:
+                self.catalogs[name] = gettext.translation('nomoject', localedir, languages=[name])
+            except OSError:
+                pass  # A folder without a compiled catalog
+        self.catalog = self.catalogs['en']
+        self.bindings = []
+        self.set_language(language)
+
+    def set_language(self, language):
+        self.language = language
+        self.catalog = self.catalogs.get(language, self.catalogs['en'])
+
+    def gettext(self, message):
+        return self.catalog.gettext(message)
+
+    def bind(self, setter, message):
+        """Sets a translated text now and again whenever the language changes"""
+        setter(self.gettext(message))
+        self.bindings.append((setter, message))
+
+    def retranslate(self):
+        for setter, message in self.bindings:
+            setter(self.gettext(message))
+
+class DeviceListModel(QAbstractListModel):
+    """
+    List model over the device store. Rows only hold paths, data() reads
+    the device when a row is painted, and check states live in a set of
+    paths so they survive rescans and can be changed in bulk.
+    """
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.setSelectionMode(QListWidget.NoSelection)  # Disable selection highlighting
+        self.store = DeviceStore()
+        self.paths = []
+        self.checked = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def device(self, row):
+        return self.store.get(self.paths[row])
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.paths[index.row()]
+        if role == Qt.DisplayRole:
+            return self.store.get(path).desc
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if path in self.checked else Qt.Unchecked
+        if role == Qt.ToolTipRole:
+            return self.store.get(path).vendor_key
+        if role == Qt.UserRole:
+            return path
+        return None
+
+    def flags(self, index):
+        return Qt.ItemIsEnabled | Qt.ItemIsUserCheckable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.CheckStateRole or not index.isValid():
+            return False
+        path = self.paths[index.row()]
+        if value == Qt.Checked:
+            self.checked.add(path)
+        else:
+            self.checked.discard(path)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        return True
+
+    def add_devices(self, devices):
+        """Appends new devices, or replaces the ones already listed"""
+        new_devices = []
+        replaced = False
+        for device in devices:
+            if self.store.add(device) is None:
+                new_devices.append(device)
+            else:
+                replaced = True
+        if replaced:
+            self.dataChanged.emit(self.index(0), self.index(len(self.paths) - 1))
+        if new_devices:
+            first = len(self.paths)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_devices) - 1)
+            self.paths.extend(device.path for device in new_devices)
+            self.endInsertRows()
+
+    def remove_devices(self, paths):
+        paths = {path for path in paths if self.store.remove(path) is not None}
+        if not paths:
+            return
+        # Remove each run of consecutive rows with a single notification
+        rows = [row for row, path in enumerate(self.paths) if path in paths]
+        while rows:
+            last = rows.pop()
+            first = last
+            while rows and rows[-1] == first - 1:
+                first = rows.pop()
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self.paths[first:last + 1]
+            self.endRemoveRows()
+
+    def clear(self):
+        """Removes every device, check states are kept for when they come back"""
+        self.beginResetModel()
+        self.store.clear()
+        self.paths = []
+        self.endResetModel()
+
+    def set_checked(self, paths, checked):
+        """Checks or unchecks many devices with a single view update"""
+        if checked:
+            self.checked.update(paths)
+        else:
+            self.checked.difference_update(paths)
+        if self.paths:
+            self.dataChanged.emit(self.index(0), self.index(len(self.paths) - 1), [Qt.CheckStateRole])
+
+    def checked_devices(self):
+        return [self.store.get(path) for path in self.paths if path in self.checked]
+
+
+class DeviceFilterProxyModel(QSortFilterProxyModel):
+    """Filters devices by a text found in the description or the vendor key IDs"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.search = ''
+
+    def set_search(self, text):
+        self.search = text.strip().lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self.search:
+            return True
+        device = self.sourceModel().device(source_row)
+        return self.search in device.desc.lower() or self.search in device.vendor_key.lower()
+
+    def source_paths(self):
+        """Returns the paths of the rows passing the filter"""
+        model = self.sourceModel()
+        if not self.search:
+            return list(model.paths)
+        return [model.paths[self.mapToSource(self.index(row, 0)).row()] for row in range(self.rowCount())]
+
+
+class DeviceListView(QListView):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSelectionMode(QListView.NoSelection)  # Disable selection highlighting
+        # Every row has the same height, so the view never measures rows it does not show
+        self.setUniformItemSizes(True)
         self.setStyleSheet("""
-            QListWidget {
+            QListView {
                 background-color: #1e1e1e;
                 border: 1px solid #333333;
                 border-radius: 4px;
                 padding: 5px;
                 color: #ffffff;
             }
-            QListWidget::item {
+            QListView::item {
                 padding: 8px;
                 margin: 2px;
                 border-radius: 3px;
             }
-            QListWidget::item:hover {
+            QListView::item:hover {
                 background-color: #2d2d2d;
             }
         """)
 
+def save_cache_quietly(path, source, devices, stamps):
+    """Saves the device cache, which is only an optimization and must never fail a scan"""
+    try:
+        with span('cache.save'):
+            save_device_cache(path, source, devices, stamps)
+    except (OSError, ValueError, TypeError):
+        pass
+
+class DeviceScanWorker(QThread):
+    """Enumerates devices off the GUI thread and streams them back in batches"""
+    devices_found = pyqtSignal(list)
+    progress = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+
+    BATCH_SIZE = 50
+    BATCH_INTERVAL = 0.1  # seconds
+
+    def __init__(self, registry, device_filter, cache=None, parent=None):
+        super().__init__(parent)
+        self.registry = registry
+        self.device_filter = device_filter
+        self.cache = cache  # (path, source) to save the result to, if any
+        self.error = None
+        self.stamps = {}
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def run(self):
+        batch = []
+        devices = []
+        last_emit = time.monotonic()
+        try:
+            with span('scan'):
+                for device in scan_devices(self.registry, self.progress.emit, self.is_cancelled, self.stamps,
+                                           self.device_filter):
+                    if self.is_cancelled():
+                        break  # The rest of a vendor key read while cancelling is stale
+                    batch.append(device)
+                    devices.append(device)
+                    # Flush on size or time so the list fills in steadily on slow registries
+                    if len(batch) >= self.BATCH_SIZE or time.monotonic() - last_emit >= self.BATCH_INTERVAL:
+                        self.devices_found.emit(batch)
+                        batch = []
+                        last_emit = time.monotonic()
+                if batch and not self.is_cancelled():
+                    self.devices_found.emit(batch)
+            if self.cache and not self.is_cancelled():
+                save_cache_quietly(*self.cache, devices, self.stamps)
+        except OSError as e:
+            if not self.is_cancelled():
+                self.error = str(e)
+                self.failed.emit(self.error)
+
+class DeviceWatchWorker(QThread):
+    """Watches the registry and reports device list differences as they happen"""
+    devices_changed = pyqtSignal(list, list, list)
+
+    def __init__(self, tracker, source, cache=None, once=False, parent=None):
+        super().__init__(parent)
+        self.tracker = tracker
+        self.source = source
+        self.cache = cache  # (path, source) kept up to date with every change
+        self.once = once  # Only revalidate, do not keep watching
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def on_changes(self, added, removed, updated):
+        self.devices_changed.emit(added, removed, updated)
+        if self.cache:
+            save_cache_quietly(*self.cache, self.tracker.all_devices(), self.tracker.stamps)
+
+    def run(self):
+        try:
+            if self.once:
+                with span('revalidate'):
+                    changes = self.tracker.refresh()
+                if any(changes):
+                    self.on_changes(*changes)
+            else:
+                watch_devices(self.tracker, self.source, self.on_changes, self._stopped.is_set)
+        except OSError:
+            pass  # Watching is best effort, Refresh still works
+        finally:
+            self.source.close()
+
+class UpdateCheckWorker(QThread):
+    """Runs the update check off the GUI thread"""
+    update_available = pyqtSignal(str)
+
+    def __init__(self, checker, parent=None):
+        super().__init__(parent)
+        self.checker = checker
+
+    def run(self):
+        with span('update_check'):
+            latest_version = self.checker.check()
+        if latest_version:
+            self.update_available.emit(latest_version)
+
+class QProcessRunner(QObject):
+    """Starts programs with QProcess, on_finished(exit_code, output) is called from the event loop"""
+
+    def start(self, program, arguments, on_finished):
+        process = QProcess(self)
+        process.setProcessChannelMode(QProcess.MergedChannels)
+        # Spans the process lifetime, so it is ended from the callbacks
+        timer = span(os.path.basename(program), arguments=arguments)
+        timer.__enter__()
+
+        def finished(exit_code, exit_status):
+            timer.__exit__(None, None, None)
+            output = decode_output(bytes(process.readAll()))
+            process.deleteLater()
+            on_finished(exit_code if exit_status == QProcess.NormalExit else -1, output)
+
+        def failed(error):
+            # No finished signal follows a failed start
+            if error == QProcess.FailedToStart:
+                timer.__exit__(None, None, None)
+                process.deleteLater()
+                on_finished(-1, process.errorString())
+
+        process.finished.connect(finished)
+        process.errorOccurred.connect(failed)
+        process.start(program, arguments)
+
+
 class NomojectMainWindow(QMainWindow):
+    # Task Scheduler results: operation, success, output
+    task_finished = pyqtSignal(str, bool, str)
+
     def __init__(self):
         super().__init__()
         
@@ -93,22 +385,15 @@ class NomojectMainWindow(QMainWindow):
         system_lang = locale.getdefaultlocale()[0]
         self.current_lang = 'pt_BR' if system_lang and system_lang.startswith('pt') else 'en'
         
-        # Setup translation
-        self.setup_translation()
+        # Setup translation, every catalog is loaded up front
+        with span('startup.translations'):
+            self.translator = Translator(get_locales_path(), self.current_lang)
+        self._ = self.translator.gettext
+        self.status_message = None
         
-        # Check for updates
-        if check_for_updates():
-            reply = QMessageBox.question(
-                self,
-                self._("New Version Available"),
-                self._("A new version of Nomoject is available. Would you like to download it?"),
-                QMessageBox.Yes | QMessageBox.No
-            )
-            if reply == QMessageBox.Yes:
-                webbrowser.open("https://github.com/junglivre/Nomoject/releases/latest")
-                sys.exit(0)  # Exit application after opening the browser
+        self.settings = load_settings()
         
-        self.setWindowTitle(self._("Nomoject - Device Manager"))
+        self.translator.bind(self.setWindowTitle, "Nomoject - Device Manager")
         self.setMinimumSize(550, 400)
         self.resize(600, 450)
         
@@ -209,7 +494,8 @@ class NomojectMainWindow(QMainWindow):
         title_row.addWidget(lang_container)
         header_layout.addLayout(title_row)
         
-        description = QLabel(self._("Select devices to hide from Eject popup"))
+        description = QLabel()
+        self.translator.bind(description.setText, "Select devices to hide from Eject popup")
         description.setStyleSheet("""
             QLabel {
                 color: #cccccc;
@@ -219,8 +505,40 @@ class NomojectMainWindow(QMainWindow):
         header_layout.addWidget(description)
         main_layout.addWidget(header_frame)
         
-        # Create list widget with custom styling
-        self.device_list = DeviceListWidget()
+        # Create search row
+        search_row = QHBoxLayout()
+        self.search_box = QLineEdit()
+        self.translator.bind(self.search_box.setPlaceholderText, "Search by description or ID")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.setStyleSheet("""
+            QLineEdit {
+                background-color: #252525;
+                border: 1px solid #333333;
+                border-radius: 4px;
+                padding: 6px;
+                color: #ffffff;
+            }
+        """)
+        self.select_all_checkbox = QCheckBox()
+        self.translator.bind(self.select_all_checkbox.setText, "Select all")
+        self.select_all_checkbox.clicked.connect(self.on_select_all_clicked)
+        search_row.addWidget(self.search_box)
+        search_row.addWidget(self.select_all_checkbox)
+        main_layout.addLayout(search_row)
+        
+        # Filter as the user types, once typing pauses
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.apply_search)
+        self.search_box.textChanged.connect(self.search_timer.start)
+        
+        # Create list view with custom styling
+        self.device_model = DeviceListModel(self)
+        self.device_filter = DeviceFilterProxyModel(self)
+        self.device_filter.setSourceModel(self.device_model)
+        self.device_list = DeviceListView()
+        self.device_list.setModel(self.device_filter)
         main_layout.addWidget(self.device_list)
         
         # Create button container
@@ -229,12 +547,22 @@ class NomojectMainWindow(QMainWindow):
         button_layout.setContentsMargins(0, 0, 0, 0)
         
         # Create buttons
-        refresh_button = QPushButton(self._("Refresh Devices"))
+        refresh_button = QPushButton()
+        self.translator.bind(refresh_button.setText, "Refresh Devices")
         refresh_button.clicked.connect(self.load_devices)
-        self.generate_button = QPushButton(self._("Generate Registry File"))
+        self.generate_button = QPushButton()
+        self.translator.bind(self.generate_button.setText, "Generate Registry File")
         self.generate_button.clicked.connect(self.generate_registry_file)
-        backup_button = QPushButton(self._("Backup PCI Keys"))
-        backup_button.clicked.connect(self.backup_pci_keys)
+        self.backup_button = QPushButton()
+        self.translator.bind(self.backup_button.setText, "Backup PCI Keys")
+        self.backup_button.clicked.connect(self.backup_pci_keys)
+        selection_button = QPushButton()
+        self.translator.bind(selection_button.setText, "Load Selection Rules")
+        selection_button.clicked.connect(self.choose_selection_file)
+        self.watch_checkbox = QCheckBox()
+        self.translator.bind(self.watch_checkbox.setText, "Watch for changes")
+        self.watch_checkbox.setChecked(self.settings['watch_devices'])
+        self.watch_checkbox.toggled.connect(self.on_watch_toggled)
         
         # Style buttons
         button_style = """
@@ -260,11 +588,14 @@ class NomojectMainWindow(QMainWindow):
         """
         refresh_button.setStyleSheet(button_style)
         self.generate_button.setStyleSheet(button_style)
-        backup_button.setStyleSheet(button_style)
+        self.backup_button.setStyleSheet(button_style)
+        selection_button.setStyleSheet(button_style)
         
         # Add buttons to layout
         button_layout.addWidget(refresh_button)
-        button_layout.addWidget(backup_button)
+        button_layout.addWidget(self.backup_button)
+        button_layout.addWidget(selection_button)
+        button_layout.addWidget(self.watch_checkbox)
         button_layout.addStretch()
         button_layout.addWidget(self.generate_button)
         main_layout.addWidget(button_container)
@@ -294,12 +625,91 @@ class NomojectMainWindow(QMainWindow):
         author_label.setOpenExternalLinks(True)
         author_label.setText("<a href='https://jung.moe' style='color: #666666; text-decoration: none;'>by jung</a>")
         author_label.setCursor(Qt.PointingHandCursor)
+        
+        # Scan progress indicator, only visible while devices are loading
+        self.scan_progress = QProgressBar()
+        self.scan_progress.setMaximumWidth(150)
+        self.scan_progress.setMaximumHeight(14)
+        self.scan_progress.setTextVisible(False)
+        self.scan_progress.hide()
+        self.statusBar.addPermanentWidget(self.scan_progress)
         self.statusBar.addPermanentWidget(author_label)
         
         self.setStatusBar(self.statusBar)
         
-        # Load devices
-        self.load_devices()
+        # Load devices in the background
+        # NOMOJECT_REGISTRY can point at a .reg file to run against an in-memory copy
+        self.registry_source = os.environ.get('NOMOJECT_REGISTRY')
+        try:
+            self.registry = open_registry(self.registry_source)
+        except (OSError, ValueError):
+            self.registry = None  # load_devices tries again and reports the error
+        self.scan_worker = None
+        self.watch_worker = None
+        # Cancelled or stopped workers still running, waited for on close
+        self.retiring_workers = []
+        self.devices = self.device_model.store
+        try:
+            self.scan_filter = DeviceFilter.from_config(self.settings.get('device_filter'))
+        except (re.error, TypeError, AttributeError):
+            self.scan_filter = DeviceFilter()  # Broken settings should not keep the app from starting
+        # The cache is only valid for the same registry and the same filter
+        source = os.path.abspath(self.registry_source) if self.registry_source else 'live'
+        self.device_cache = (os.path.join(get_app_data_dir(), 'device_cache.bin'),
+                             source + '|' + json.dumps(self.settings.get('device_filter'), sort_keys=True))
+        # Selection rules check devices the first time they are listed, later clicks are left alone
+        self.selection = None
+        self.selection_seen = set()
+        if self.settings.get('selection_file'):
+            try:
+                self.selection = load_selection(self.settings['selection_file'])
+            except (OSError, ValueError):
+                pass  # A rules file that went away only disables preselection
+        cached = None
+        if self.registry is not None:
+            with span('cache.load'):
+                cached = load_device_cache(*self.device_cache)
+        if cached:
+            self.show_cached_devices(*cached)
+        elif self.registry is None:
+            # Deferred so the error is shown over the window, like a failed scan
+            QTimer.singleShot(0, self.load_devices)
+        else:
+            self.load_devices()
+        
+        self.backup_store = BackupStore()
+        
+        # Task Scheduler calls never block the window
+        self.task_scheduler = TaskScheduler(QProcessRunner(self))
+        self.task_finished.connect(self.on_task_finished)
+        
+        # Check for updates once the window is up
+        self.update_worker = None
+        QTimer.singleShot(0, self.start_update_check)
+    
+    def start_update_check(self):
+        if not self.settings.get('check_for_updates', True):
+            return
+        checker = UpdateChecker(
+            VERSION,
+            os.path.join(get_app_data_dir(), 'update_check.json'),
+            self.settings.get('update_check_ttl', 0)
+        )
+        self.update_worker = UpdateCheckWorker(checker, self)
+        self.update_worker.update_available.connect(self.on_update_available)
+        self.update_worker.start()
+
+    def on_update_available(self, latest_version):
+        reply = QMessageBox.question(
+            self,
+            self._("New Version Available"),
+            self._("A new version of Nomoject is available. Would you like to download it?"),
+            QMessageBox.Yes | QMessageBox.No
+        )
+        if reply == QMessageBox.Yes:
+            import webbrowser
+            webbrowser.open(RELEASES_PAGE_URL)
+            self.close()  # Exit application after opening the browser
     
     def setup_dark_theme(self):
         palette = QPalette()
@@ -378,161 +788,297 @@ class NomojectMainWindow(QMainWindow):
             }
         """)
     
-    def setup_translation(self):
-        """Sets up translation based on current language"""
-        localedir = get_locales_path()
-        self.translate = gettext.translation('nomoject', localedir, languages=[self.current_lang], fallback=True)
-        self._ = self.translate.gettext
-    
     def on_language_changed(self, button):
         """Changes the application language when a radio button is selected"""
         new_lang = "pt_BR" if button == self.radio_pt else "en"
         if new_lang != self.current_lang:
             self.current_lang = new_lang
-            self.setup_translation()
+            self.translator.set_language(new_lang)
             self.retranslate_ui()
     
     def retranslate_ui(self):
-        """Updates all interface texts with the new language"""
-        self.setWindowTitle(self._("Nomoject - Device Manager"))
-        
-        # Update description - looking for specific text to ensure we get the correct label
-        for label in self.findChildren(QLabel):
-            if label.text() == "Nomoject":
-                continue  # Skip the title that should not be translated
-            if "Select devices" in label.text() or "Selecione os dispositivos" in label.text():
-                label.setText(self._("Select devices to hide from Eject popup"))
-                break
-        
-        # Update buttons
-        refresh_button = None
-        for button in self.findChildren(QPushButton):
-            if "Refresh" in button.text() or "Atualizar" in button.text():
-                button.setText(self._("Refresh Devices"))
-            elif "Generate" in button.text() or "Gerar" in button.text():
-                button.setText(self._("Generate Registry File"))
-            elif "Backup" in button.text() or "Backup" in button.text():
-                button.setText(self._("Backup PCI Keys"))
-        
-        # Reload devices to update messages
-        self.load_devices()
+        """Updates all interface texts with the new language, the device list is left alone"""
+        self.translator.retranslate()
+        if self.status_message:
+            self.show_status(*self.status_message)
+    
+    def show_status(self, message, *args):
+        """Shows a status bar message, kept untranslated so a language switch can redo it"""
+        self.status_message = (message, *args)
+        text = self._(message)
+        self.statusBar.showMessage(text % args if args else text)
     
     def load_devices(self):
-        self.statusBar.showMessage(self._("Loading devices..."))
-        self.device_list.clear()
-        self.devices = []
-        
-        try:
-            pci_key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE,
-                                    r"SYSTEM\CurrentControlSet\Enum\PCI",
-                                    0, winreg.KEY_READ)
-            
-            i = 0
-            while True:
-                try:
-                    vendor_key_name = winreg.EnumKey(pci_key, i)
-                    vendor_key = winreg.OpenKey(pci_key, vendor_key_name)
-                    
-                    j = 0
-                    while True:
-                        try:
-                            instance_name = winreg.EnumKey(vendor_key, j)
-                            instance_key = winreg.OpenKey(vendor_key, instance_name)
-                            
-                            try:
-                                capabilities, _ = winreg.QueryValueEx(instance_key, "Capabilities")
-                                if capabilities == 6:  # Removable device
-                                    try:
-                                        device_desc, _ = winreg.QueryValueEx(instance_key, "DeviceDesc")
-                                        if ';' in device_desc:
-                                            device_desc = device_desc.split(';')[-1]
-                                        
-                                        full_path = f"SYSTEM\\CurrentControlSet\\Enum\\PCI\\{vendor_key_name}\\{instance_name}"
-                                        self.devices.append({
-                                            'path': full_path,
-                                            'desc': device_desc,
-                                            'vendor_key': vendor_key_name,
-                                            'instance': instance_name
-                                        })
-                                        
-                                        item = QListWidgetItem()
-                                        item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
-                                        item.setCheckState(Qt.Unchecked)
-                                        item.setText(device_desc)
-                                        self.device_list.addItem(item)
-                                    except WindowsError:
-                                        pass
-                            except WindowsError:
-                                pass
-                            
-                            j += 1
-                        except WindowsError:
-                            break
-                        finally:
-                            try:
-                                winreg.CloseKey(instance_key)
-                            except:
-                                pass
-                    
-                    i += 1
-                except WindowsError:
-                    break
-                finally:
-                    try:
-                        winreg.CloseKey(vendor_key)
-                    except:
-                        pass
-                        
-            self.statusBar.showMessage(self._("Found %d removable device(s)") % len(self.devices))
-            
-        except WindowsError as e:
-            QMessageBox.critical(self, self._("Error"), self._("Failed to access registry: %s") % str(e))
-            self.statusBar.showMessage(self._("Error loading devices"))
-        finally:
+        """Starts a background scan, cancelling any scan still in progress"""
+        if self.scan_worker is not None:
+            self.scan_worker.cancel()
+            self.retire_worker(self.scan_worker)
+        self.stop_watching()
+
+        # Check states are kept by path, so they survive the rescan
+        self.show_status("Loading devices...")
+        self.device_model.clear()
+        self.generate_button.setEnabled(False)
+        self.backup_button.setEnabled(False)
+        if self.registry is None:
+            # Opening it failed before, the file may have been fixed since
             try:
-                winreg.CloseKey(pci_key)
-            except:
-                pass
+                self.registry = open_registry(self.registry_source)
+            except (OSError, ValueError) as e:
+                self.report_registry_error(e)
+                return
+        self.scan_progress.setRange(0, 0)  # Busy until the vendor count is known
+        self.scan_progress.show()
+
+        self.scan_worker = DeviceScanWorker(self.registry, self.scan_filter, self.device_cache, self)
+        self.scan_worker.devices_found.connect(self.on_devices_found)
+        self.scan_worker.progress.connect(self.on_scan_progress)
+        self.scan_worker.failed.connect(self.on_scan_failed)
+        self.scan_worker.finished.connect(self.on_scan_finished)
+        self.scan_worker.finished.connect(self.scan_worker.deleteLater)
+        self.scan_worker.start()
+
+    def on_devices_found(self, devices):
+        """Appends a batch of devices streamed from the scan worker"""
+        if self.sender() is not self.scan_worker:
+            return  # Batch from a cancelled scan
+
+        self.add_devices(devices)
+
+    def add_devices(self, devices):
+        """Lists devices, checking the ones the selection rules hide when they are first seen"""
+        self.device_model.add_devices(devices)
+        if self.selection is not None:
+            new_devices = [device for device in devices if device.path not in self.selection_seen]
+            self.selection_seen.update(device.path for device in new_devices)
+            hidden = self.selection.hidden(new_devices)
+            if hidden:
+                self.device_model.set_checked([device.path for device in hidden], True)
+
+    def choose_selection_file(self):
+        """Loads a selection rules file and checks exactly the listed devices it hides"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self,
+            self._("Open Selection Rules"),
+            "",
+            self._("Rules Files (*.json *.toml);;All Files (*.*)")
+        )
+
+        if not file_path:
+            return
+
+        try:
+            self.selection = load_selection(file_path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, self._("Error"), self._("Failed to load selection rules: %s") % str(e))
+            return
+
+        self.settings['selection_file'] = file_path
+        try:
+            save_settings(self.settings)
+        except OSError:
+            pass
+
+        hidden = {device.path for device in self.selection.hidden(self.devices)}
+        self.selection_seen = {device.path for device in self.devices}
+        self.device_model.set_checked(self.selection_seen - hidden, False)
+        self.device_model.set_checked(hidden, True)
+        self.show_status("Selection rules checked %d device(s)", len(hidden))
+
+    def apply_search(self):
+        self.device_filter.set_search(self.search_box.text())
+        self.select_all_checkbox.setChecked(False)
+
+    def on_select_all_clicked(self, checked):
+        """Checks or unchecks every device matching the search"""
+        self.device_model.set_checked(self.device_filter.source_paths(), checked)
+
+    def on_scan_progress(self, done, total):
+        if self.sender() is not self.scan_worker:
+            return
+        self.scan_progress.setRange(0, total)
+        self.scan_progress.setValue(done)
+
+    def on_scan_failed(self, error):
+        if self.sender() is not self.scan_worker:
+            return
+        self.report_registry_error(error)
+
+    def report_registry_error(self, error):
+        QMessageBox.critical(self, self._("Error"), self._("Failed to access registry: %s") % error)
+        self.show_status("Error loading devices")
+
+    def on_scan_finished(self):
+        worker = self.sender()
+        if worker is not self.scan_worker:
+            return
+        self.scan_worker = None
+        self.scan_progress.hide()
+        self.generate_button.setEnabled(True)
+        self.backup_button.setEnabled(True)
+        if not worker.is_cancelled() and worker.error is None:
+            self.show_status("Found %d removable device(s)", len(self.devices))
+            self.show_profile_summary()
+            if self.watch_checkbox.isChecked():
+                self.start_watching(worker.stamps)
+
+    def show_profile_summary(self):
+        """With --profile, shows the slowest phases so far in the status bar"""
+        if instrument.enabled:
+            self.statusBar.showMessage(
+                ' | '.join(f"{name} {total:.0f} ms" for name, _, total in instrument.summary()[:4]))
+
+    def start_watching(self, stamps, once=False):
+        """Starts applying registry changes to the list as they happen"""
+        # The tracker works on copies, the list's devices stay owned by the GUI thread
+        tracker = DeviceTracker(self.registry, [device.copy() for device in self.devices], stamps, self.scan_filter)
+        source = FakeChangeSource() if once else create_change_source(self.registry, self.scan_filter)
+        self.watch_worker = DeviceWatchWorker(tracker, source, self.device_cache, once, self)
+        self.watch_worker.devices_changed.connect(self.on_devices_changed)
+        self.watch_worker.finished.connect(self.on_watch_finished)
+        self.watch_worker.finished.connect(self.watch_worker.deleteLater)
+        self.watch_worker.start()
+
+    def stop_watching(self):
+        if self.watch_worker is not None:
+            self.watch_worker.stop()
+            self.retire_worker(self.watch_worker)
+            self.watch_worker = None
+
+    def retire_worker(self, worker):
+        """Keeps a cancelled worker until it finishes, so closing the window can wait for it"""
+        if worker not in self.retiring_workers:
+            self.retiring_workers.append(worker)
+            worker.finished.connect(self.on_retired_worker_finished)
+
+    def on_retired_worker_finished(self):
+        # Queued before the deleteLater this finish triggers, so the worker still exists here
+        self.retiring_workers.remove(self.sender())
+
+    def show_cached_devices(self, devices, stamps):
+        """Shows the cached device list right away and revalidates it in the background"""
+        self.add_devices(devices)
+        self.show_status("Found %d removable device(s)", len(self.devices))
+        # Only vendor subtrees whose stamps moved are read again
+        self.start_watching(stamps, once=not self.watch_checkbox.isChecked())
+
+    def on_watch_finished(self):
+        if self.sender() is self.watch_worker:
+            self.watch_worker = None
+            self.show_profile_summary()
+
+    def on_watch_toggled(self, checked):
+        self.settings['watch_devices'] = checked
+        try:
+            save_settings(self.settings)
+        except OSError:
+            pass
+        # A fresh scan provides the baseline the watcher compares against
+        if checked:
+            self.load_devices()
+        else:
+            self.stop_watching()
+
+    def on_devices_changed(self, added, removed, updated):
+        """Applies the minimal difference to the list, keeping check states"""
+        if self.sender() is not self.watch_worker:
+            return
+
+        self.device_model.remove_devices(device.path for device in removed)
+        self.add_devices([device.copy() for device in updated + added])
+
+        self.show_status("Found %d removable device(s)", len(self.devices))
+
+    def closeEvent(self, event):
+        if self.scan_worker is not None:
+            self.scan_worker.cancel()
+            self.scan_worker.wait()
+        if self.watch_worker is not None:
+            self.watch_worker.stop()
+            self.watch_worker.wait()
+        if self.update_worker is not None:
+            self.update_worker.wait()
+        for worker in self.retiring_workers:
+            worker.wait()
+        super().closeEvent(event)
     
-    def create_scheduled_task(self, reg_file_path):
-        """Creates a scheduled task to apply the registry file at system startup"""
+    def create_scheduled_task(self, devices):
+        """Writes the agent policy and the task definition, then registers the task in the background"""
         try:
             # Create _utils directory if it doesn't exist
             system_drive = os.environ['SystemDrive']
             utils_dir = os.path.join(system_drive + "\\", "Windows", "System32", "_utils")
             os.makedirs(utils_dir, exist_ok=True)
             
-            # Copy registry file to _utils directory
-            new_reg_path = os.path.join(utils_dir, os.path.basename(reg_file_path))
-            import shutil
-            shutil.copy2(reg_file_path, new_reg_path)
+            # The agent only rewrites keys that drifted from this policy
+            policy_path = os.path.join(utils_dir, APPLY_POLICY_FILENAME)
+            write_policy(policy_path, [device.path for device in devices])
             
-            # Create task command with correct path
-            task_name = "NomojectRegistryApply"
-            task_cmd = f'schtasks /Create /TN "{task_name}" /TR "regedit.exe /s \\"%SystemDrive%\\Windows\\System32\\_utils\\{os.path.basename(reg_file_path)}\\"" /SC ONSTART /RU SYSTEM /RL HIGHEST /F'
+            if getattr(sys, 'frozen', False):
+                # The agent executable is bundled, copy it next to the policy
+                command = os.path.join(utils_dir, APPLY_AGENT_FILENAME)
+                shutil.copy2(os.path.join(sys._MEIPASS, APPLY_AGENT_FILENAME), command)
+                arguments = [policy_path]
+            else:
+                command = os.path.join(os.path.dirname(sys.executable), 'pythonw.exe')
+                arguments = [os.path.join(os.path.abspath(os.path.dirname(__file__)), 'apply.py'), policy_path]
             
-            # Execute command as administrator
-            result = subprocess.run(task_cmd, shell=True, capture_output=True, text=True)
+            xml_path = os.path.join(utils_dir, TASK_XML_FILENAME)
+            write_task_xml(xml_path, command, arguments)
+        except Exception as e:
+            self.on_task_finished(INSTALL, False, str(e))
+            return
+        
+        self.show_status("Creating startup task...")
+        self.task_scheduler.install(xml_path, self.task_finished.emit)
+
+    def on_task_finished(self, operation, success, output):
+        """Reports a Task Scheduler result, offering to run the task once it is installed"""
+        if operation == INSTALL:
+            if not success:
+                QMessageBox.critical(
+                    self,
+                    self._("Error"),
+                    self._("Failed to create startup task: %s") % output
+                )
+                self.show_status("Error creating startup task")
+                return
             
-            if result.returncode != 0:
-                raise Exception(result.stderr)
-                
-            return True, new_reg_path
+            QMessageBox.information(
+                self,
+                self._("Success"),
+                self._("Startup task created successfully. The registry changes will be applied automatically at system startup.")
+            )
+            self.show_status("Startup task created successfully")
             
-        except Exception as e:
-            return False, str(e)
+            reply = QMessageBox.question(
+                self,
+                self._("Run Now"),
+                self._("Would you like to run the task now?"),
+                QMessageBox.Yes | QMessageBox.No
+            )
+            
+            if reply == QMessageBox.Yes:
+                self.show_status("Starting startup task...")
+                self.task_scheduler.run(self.task_finished.emit)
+        elif operation == RUN:
+            if success:
+                self.show_status("Task executed successfully")
+            else:
+                QMessageBox.critical(
+                    self,
+                    self._("Error"),
+                    self._("Failed to run startup task: %s") % output
+                )
+                self.show_status("Error running startup task")
 
     def generate_registry_file(self):
-        selected_items = [self.device_list.item(i) for i in range(self.device_list.count())
-                         if self.device_list.item(i).checkState() == Qt.Checked]
+        selected_devices = self.device_model.checked_devices()
         
-        if not selected_items:
+        if not selected_devices:
             QMessageBox.warning(self, self._("Warning"), self._("Please select at least one device."))
             return
         
-        selected_indices = [self.device_list.row(item) for item in selected_items]
-        selected_devices = [self.devices[i] for i in selected_indices]
-        
         file_path, _ = QFileDialog.getSaveFileName(
             self,
             self._("Save Registry File"),
@@ -547,21 +1093,17 @@ class NomojectMainWindow(QMainWindow):
             file_path += '.reg'
         
         try:
-            self.statusBar.showMessage(self._("Generating registry file..."))
+            self.show_status("Generating registry file...")
             
-            # Criar o backup primeiro
-            backup_path = file_path.rsplit('.', 1)[0] + '_backup.reg'
-            self.create_backup_file(backup_path)
+            # Back up first, unchanged keys are not stored again
+            self.create_backup_snapshot(os.path.basename(file_path))
+            # Devices removed since the scan were dropped from the list by the backup
+            selected_devices = [device for device in selected_devices if device.path in self.devices]
             
             # Gerar o arquivo de registro para remoção
-            with open(file_path, 'w', encoding='utf-16') as f:
-                f.write("Windows Registry Editor Version 5.00\n\n")
-                
-                for device in selected_devices:
-                    f.write(f"[HKEY_LOCAL_MACHINE\\{device['path']}]\n")
-                    f.write('"Capabilities"=dword:00000002\n\n')
+            write_capabilities_file(file_path, selected_devices)
             
-            self.statusBar.showMessage(self._("Registry file and backup generated successfully"))
+            self.show_status("Registry file and backup generated successfully")
             
             reply = QMessageBox.question(
                 self,
@@ -571,35 +1113,7 @@ class NomojectMainWindow(QMainWindow):
             )
             
             if reply == QMessageBox.Yes:
-                success, result = self.create_scheduled_task(file_path)
-                if success:
-                    QMessageBox.information(
-                        self,
-                        self._("Success"),
-                        self._("Startup task created successfully. The registry changes will be applied automatically at system startup.")
-                    )
-                    self.statusBar.showMessage(self._("Startup task created successfully"))
-                    
-                    # Perguntar se quer executar agora
-                    reply = QMessageBox.question(
-                        self,
-                        self._("Run Now"),
-                        self._("Would you like to run the task now?"),
-                        QMessageBox.Yes | QMessageBox.No
-                    )
-                    
-                    if reply == QMessageBox.Yes:
-                        task_name = "NomojectRegistryApply"
-                        run_cmd = f'schtasks /Run /TN "{task_name}"'
-                        subprocess.run(run_cmd, shell=True)
-                        self.statusBar.showMessage(self._("Task executed successfully"))
-                else:
-                    QMessageBox.critical(
-                        self,
-                        self._("Error"),
-                        self._("Failed to create startup task: %s") % result
-                    )
-                    self.statusBar.showMessage(self._("Error creating startup task"))
+                self.create_scheduled_task(selected_devices)
             else:
                 reply = QMessageBox.question(
                     self,
@@ -609,52 +1123,45 @@ class NomojectMainWindow(QMainWindow):
                 )
                 
                 if reply == QMessageBox.Yes:
-                    os.startfile(file_path)
-                    self.statusBar.showMessage(self._("Applying registry changes..."))
+                    self.apply_changes(selected_devices)
             
         except Exception as e:
             QMessageBox.critical(self, self._("Error"), self._("Failed to save registry file: %s") % str(e))
-            self.statusBar.showMessage(self._("Error generating registry file"))
+            self.show_status("Error generating registry file")
 
-    def create_backup_file(self, backup_path):
-        """Creates a backup of PCI registry keys that have capabilities 6"""
+    def apply_changes(self, devices):
+        """Writes the new Capabilities value directly and reports the result per key"""
+        self.show_status("Applying registry changes...")
+        results = apply_capabilities(self.registry, [device.path for device in devices])
+        counts = count_results(results)
+        
+        self.show_status("Registry changes applied: %d changed, %d already applied, %d failed",
+                         counts[APPLIED], counts[UNCHANGED], counts[MISSING] + counts[FAILED])
+        summary = self.statusBar.currentMessage()
+        
+        if counts[MISSING] or counts[FAILED]:
+            failures = "\n".join(f"{result['path']}: {result['error']}"
+                                 for result in results if result['status'] in (MISSING, FAILED))
+            QMessageBox.warning(self, self._("Warning"), summary + "\n\n" + failures)
+        
+        # Applied devices are no longer removable
+        if counts[APPLIED]:
+            self.load_devices()
+
+    def create_backup_snapshot(self, label=None):
+        """
+        Records the current keys in the backup store, returns the snapshot result
+        or None on failure. Devices removed since the scan are dropped from the
+        list and counted under 'missing' in the result.
+        """
         try:
-            with open(backup_path, 'w', encoding='utf-16') as f:
-                f.write("Windows Registry Editor Version 5.00\n\n")
-                
-                for device in self.devices:
-                    f.write(f"[HKEY_LOCAL_MACHINE\\{device['path']}]\n")
-                    
-                    # Open the device key to read all values
-                    device_key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, device['path'], 0, winreg.KEY_READ)
-                    
-                    try:
-                        i = 0
-                        while True:
-                            try:
-                                name, value, type_ = winreg.EnumValue(device_key, i)
-                                
-                                # Format the value based on its type
-                                if type_ == winreg.REG_SZ:
-                                    f.write(f'"{name}"="{value}"\n')
-                                elif type_ == winreg.REG_DWORD:
-                                    f.write(f'"{name}"=dword:{value:08x}\n')
-                                elif type_ == winreg.REG_BINARY:
-                                    hex_str = ','.join([f'{b:02x}' for b in value])
-                                    f.write(f'"{name}"=hex:{hex_str}\n')
-                                elif type_ == winreg.REG_MULTI_SZ:
-                                    hex_str = ','.join([f'{ord(c):02x}' for s in value for c in s + '\0']) + '00,00'
-                                    f.write(f'"{name}"=hex(7):{hex_str}\n')
-                                
-                                i += 1
-                            except WindowsError:
-                                break
-                    finally:
-                        winreg.CloseKey(device_key)
-                    
-                    f.write("\n")
+            # Only keys written since the scan are read again
+            _, missing = refresh_stale_devices(self.registry, self.devices)
+            self.device_model.remove_devices(device.path for device in missing)
             
-            return True
+            snapshot = self.backup_store.take_snapshot(list(self.devices), label)
+            snapshot['missing'] = len(missing)
+            return snapshot
             
         except Exception as e:
             QMessageBox.critical(
@@ -662,19 +1169,35 @@ class NomojectMainWindow(QMainWindow):
                 self._("Error"),
                 self._("Failed to create backup file: %s") % str(e)
             )
-            return False
+            return None
 
     def backup_pci_keys(self):
-        """Creates a backup of PCI registry keys that have capabilities 6"""
+        """Records a backup snapshot of the PCI keys and offers to export it as a .reg file"""
+        self.show_status("Creating PCI keys backup...")
+        snapshot = self.create_backup_snapshot()
+        if snapshot is None:
+            self.show_status("Error creating PCI keys backup")
+            return
+        if snapshot['missing']:
+            self.show_status("PCI keys backup created, %d device(s) no longer present were left out",
+                             snapshot['missing'])
+        else:
+            self.show_status("PCI keys backup created successfully")
+        
+        reply = QMessageBox.question(
+            self,
+            self._("Success"),
+            self._("PCI keys backup saved as snapshot %s. Would you like to export it to a .reg file?") % snapshot['id'],
+            QMessageBox.Yes | QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+        
         try:
-            # Create default filename with timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            default_filename = f"pci_keys_backup_{timestamp}.reg"
-            
             file_path, _ = QFileDialog.getSaveFileName(
                 self,
                 self._("Save PCI Keys Backup"),
-                default_filename,
+                f"pci_keys_backup_{snapshot['id']}.reg",
                 self._("Registry Files (*.reg);;All Files (*.*)")
             )
             
@@ -684,44 +1207,8 @@ class NomojectMainWindow(QMainWindow):
             if not file_path.endswith('.reg'):
                 file_path += '.reg'
             
-            self.statusBar.showMessage(self._("Creating PCI keys backup..."))
-            
-            with open(file_path, 'w', encoding='utf-16') as f:
-                f.write("Windows Registry Editor Version 5.00\n\n")
-                
-                for device in self.devices:
-                    f.write(f"[HKEY_LOCAL_MACHINE\\{device['path']}]\n")
-                    
-                    # Open the device key to read all values
-                    device_key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, device['path'], 0, winreg.KEY_READ)
-                    
-                    try:
-                        i = 0
-                        while True:
-                            try:
-                                name, value, type_ = winreg.EnumValue(device_key, i)
-                                
-                                # Format the value based on its type
-                                if type_ == winreg.REG_SZ:
-                                    f.write(f'"{name}"="{value}"\n')
-                                elif type_ == winreg.REG_DWORD:
-                                    f.write(f'"{name}"=dword:{value:08x}\n')
-                                elif type_ == winreg.REG_BINARY:
-                                    hex_str = ','.join([f'{b:02x}' for b in value])
-                                    f.write(f'"{name}"=hex:{hex_str}\n')
-                                elif type_ == winreg.REG_MULTI_SZ:
-                                    hex_str = ','.join([f'{ord(c):02x}' for s in value for c in s + '\0']) + '00,00'
-                                    f.write(f'"{name}"=hex(7):{hex_str}\n')
-                                
-                                i += 1
-                            except WindowsError:
-                                break
-                    finally:
-                        winreg.CloseKey(device_key)
-                    
-                    f.write("\n")
+            self.backup_store.export_snapshot(snapshot['id'], file_path)
             
-            self.statusBar.showMessage(self._("PCI keys backup created successfully"))
             QMessageBox.information(
                 self,
                 self._("Success"),
@@ -734,17 +1221,38 @@ class NomojectMainWindow(QMainWindow):
                 self._("Error"),
                 self._("Failed to create PCI keys backup: %s") % str(e)
             )
-            self.statusBar.showMessage(self._("Error creating PCI keys backup"))
+            self.show_status("Error creating PCI keys backup")
+
+def get_profile_path(args):
+    """Returns the trace file asked for with --profile[=FILE], or None"""
+    for arg in args:
+        if arg == '--profile':
+            return os.path.join(get_app_data_dir(), 'nomoject_trace.json')
+        if arg.startswith('--profile='):
+            return arg.split('=', 1)[1]
+    return None
 
 def main():
-    app = QApplication(sys.argv)
-    app.setStyle(QStyleFactory.create('Fusion'))  # Use Fusion style for better dark theme support
-    window = NomojectMainWindow()
-    window.show()
-    sys.exit(app.exec_())
+    # --profile records where startup and scans spend their time, written as a Chrome trace on exit
+    profile_path = get_profile_path(sys.argv[1:])
+    if profile_path:
+        instrument.enable()
+    with span('startup.application'):
+        app = QApplication(sys.argv)
+        app.setStyle(QStyleFactory.create('Fusion'))  # Use Fusion style for better dark theme support
+    with span('startup.window'):
+        window = NomojectMainWindow()
+        window.show()
+    if '--quit-after-start' in sys.argv[1:]:
+        # Closes as soon as the event loop runs, used by benchmarks/bench_startup.py
+        QTimer.singleShot(0, window.close)
+    exit_code = app.exec_()
+    if profile_path:
+        os.makedirs(os.path.dirname(os.path.abspath(profile_path)), exist_ok=True)
+        instrument.write_trace(profile_path)
+        if sys.stderr:  # None in the windowed executable
+            print(instrument.format_summary(), file=sys.stderr)
+    sys.exit(exit_code)
 
 if __name__ == '__main__':
-    if not pyuac.isUserAdmin():
-        pyuac.runAsAdmin()
-    else:
-        main()
\ No newline at end of file
+    main()
\ No newline at end of file
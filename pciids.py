@@ -0,0 +1,202 @@
+"""
+Vendor and device names from the PCI ID database (https://pci-ids.ucw.cz).
+
+The text pci.ids file is compiled at build time into pci_ids.bin: three
+sorted key arrays (vendors, vendor+device, vendor+device+subsystem) each
+with a parallel array of offsets into a pool of UTF-8 names. At run time
+the file is memory-mapped on the first lookup and the key arrays are
+binary-searched in place, so nothing is parsed at startup and a lookup is
+a few bisections over the mapped pages.
+
+Usage: python pciids.py pci.ids pci_ids.bin
+"""
+import os
+import sys
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+
+INDEX_FILENAME = 'pci_ids.bin'
+INDEX_MAGIC = b'PCII'
+INDEX_VERSION = 1
+
+# Magic, version, then the entry count of each table
+INDEX_HEADER = struct.Struct('<4sIIII')
+
+_index = None
+
+
+def get_index_path():
+    """Returns where pci_ids.bin is bundled, whether in development or compiled"""
+    if getattr(sys, 'frozen', False):
+        return os.path.join(sys._MEIPASS, INDEX_FILENAME)
+    return os.path.join(os.path.abspath(os.path.dirname(__file__)), INDEX_FILENAME)
+
+
+def parse_pci_ids(f):
+    """
+    Yields (vendor, device, subsystem, name) from a pci.ids text stream.
+    device is None for vendor lines, subsystem is None unless the line
+    names a subsystem, given as subvendor << 16 | subdevice.
+    """
+    vendor = device = None
+    for line in f:
+        if not line.strip() or line.startswith('#'):
+            continue
+        if line.startswith('C '):
+            break  # Device classes follow the vendors until the end of the file
+        line = line.rstrip('\r\n')
+        try:
+            if line.startswith('\t\t'):
+                if device is not None:
+                    subvendor, subdevice, name = line[2:].split(None, 2)
+                    yield vendor, device, int(subvendor, 16) << 16 | int(subdevice, 16), name
+            elif line.startswith('\t'):
+                if vendor is not None:
+                    device_id, name = line[1:].split(None, 1)
+                    device = int(device_id, 16)
+                    yield vendor, device, None, name
+            else:
+                vendor_id, name = line.split(None, 1)
+                vendor, device = int(vendor_id, 16), None
+                yield vendor, None, None, name
+        except ValueError:
+            continue  # Malformed line, the rest of the database is still usable
+
+
+def compile_pci_ids(source, target):
+    """Compiles a pci.ids text file into the binary index, returns the number of names"""
+    vendors, devices, subsystems = {}, {}, {}
+    with open(source, 'r', encoding='utf-8', errors='replace') as f:
+        for vendor, device, subsystem, name in parse_pci_ids(f):
+            if device is None:
+                vendors[vendor] = name
+            elif subsystem is None:
+                devices[vendor << 16 | device] = name
+            else:
+                subsystems[(vendor << 16 | device) << 32 | subsystem] = name
+
+    # Names are pooled, many subsystems share the same one
+    pool = bytearray()
+    offsets = {}
+
+    def name_offset(name):
+        offset = offsets.get(name)
+        if offset is None:
+            offset = offsets[name] = len(pool)
+            # Lengths are a single byte, cut long names on a character boundary
+            encoded = name.encode('utf-8')[:255].decode('utf-8', 'ignore').encode('utf-8')
+            pool.append(len(encoded))
+            pool.extend(encoded)
+        return offset
+
+    tables = []
+    for table, typecode in ((vendors, 'H'), (devices, 'I'), (subsystems, 'Q')):
+        keys = sorted(table)
+        tables.append((array(typecode, keys), array('I', (name_offset(table[key]) for key in keys))))
+
+    tmp_path = target + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(vendors), len(devices), len(subsystems)))
+        for keys, names in tables:
+            for data in (keys, names):
+                # Each array starts 8-byte aligned so it can be cast in place
+                f.write(b'\0' * (-f.tell() % 8))
+                if sys.byteorder != 'little':
+                    data.byteswap()
+                f.write(data.tobytes())
+        f.write(b'\0' * (-f.tell() % 8))
+        f.write(pool)
+    os.replace(tmp_path, target)
+    return len(vendors) + len(devices) + len(subsystems)
+
+
+class PciIdIndex:
+    """A compiled index mapped read-only, looked up without loading it into memory"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, *counts = INDEX_HEADER.unpack_from(self.map)
+        except struct.error:
+            raise OSError(f"Not a PCI ID index: {path}")
+        if magic != INDEX_MAGIC or version != INDEX_VERSION or sys.byteorder != 'little':
+            raise OSError(f"Unsupported PCI ID index: {path}")
+
+        view = memoryview(self.map)
+        position = INDEX_HEADER.size + (-INDEX_HEADER.size % 8)
+        self.tables = []
+        for count, typecode in zip(counts, ('H', 'I', 'Q')):
+            arrays = []
+            for item_type in (typecode, 'I'):
+                size = count * struct.calcsize(item_type)
+                if position + size > len(self.map):
+                    raise OSError(f"Truncated PCI ID index: {path}")
+                arrays.append(view[position:position + size].cast(item_type))
+                position += size + (-size % 8)
+            self.tables.append(tuple(arrays))
+        self.pool = position
+
+    def _name(self, table, key):
+        keys, names = self.tables[table]
+        i = bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return None
+        start = self.pool + names[i]
+        return self.map[start + 1:start + 1 + self.map[start]].decode('utf-8')
+
+    def vendor_name(self, vendor):
+        return self._name(0, vendor)
+
+    def device_name(self, vendor, device):
+        return self._name(1, vendor << 16 | device)
+
+    def subsystem_name(self, vendor, device, subvendor, subdevice):
+        return self._name(2, (vendor << 16 | device) << 32 | subvendor << 16 | subdevice)
+
+
+def get_index():
+    """Maps the bundled index on first use, returns None if it is not available"""
+    global _index
+    if _index is None:
+        try:
+            _index = PciIdIndex(get_index_path())
+        except (OSError, ValueError):
+            _index = False  # Not bundled, names are simply not resolved
+    return _index or None
+
+
+def lookup_device_name(vendor_id, device_id=None, subsys_id=None):
+    """
+    Returns "Vendor Device" for the hexadecimal IDs of a PCI vendor key, the
+    subsystem name taking precedence over the device name, or None if the
+    IDs are not in the database. subsys_id is SUBSYS_ssssvvvv's digits:
+    subdevice first, then subvendor.
+    """
+    index = get_index()
+    if index is None or not vendor_id:
+        return None
+    vendor = int(vendor_id, 16)
+    vendor_name = index.vendor_name(vendor)
+    if vendor_name is None:
+        return None
+    if not device_id:
+        return vendor_name
+
+    device = int(device_id, 16)
+    name = None
+    if subsys_id:
+        subsys = int(subsys_id, 16)
+        name = index.subsystem_name(vendor, device, subsys & 0xFFFF, subsys >> 16)
+    name = name or index.device_name(vendor, device)
+    return f"{vendor_name} {name}" if name else vendor_name
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print(__doc__.strip().splitlines()[-1], file=sys.stderr)
+        sys.exit(2)
+    count = compile_pci_ids(sys.argv[1], sys.argv[2])
+    print(f"Compiled {count} names into {sys.argv[2]}")
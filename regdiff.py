@@ -0,0 +1,127 @@
+"""
+Compares registry snapshots: .reg backups, offline hives or the live tree.
+
+Sources are read as streams of key blocks. A first pass keeps only a hash
+of each key's values, so memory grows with the number of keys and not with
+the size of the exports. Values are read again, in a second pass, only for
+the keys whose hashes differ.
+"""
+import hashlib
+from regfile import iter_reg_file, split_root, encode_value_data, format_value, CONTINUATION, ROOT_KEY
+from devices import scan_devices
+
+# Change kinds, in the order they are reported for a key
+KEY_ADDED = 'key_added'
+KEY_REMOVED = 'key_removed'
+VALUE_ADDED = 'value_added'
+VALUE_REMOVED = 'value_removed'
+VALUE_CHANGED = 'value_changed'
+
+
+def normalize_key_path(key_path):
+    """Returns the path with HKLM spelled out, so files and the live tree compare equal"""
+    root, path = split_root(key_path)
+    if root.upper() in ('HKEY_LOCAL_MACHINE', 'HKLM'):
+        return f"{ROOT_KEY}\\{path}"
+    return key_path
+
+
+def reg_file_blocks(path, wanted=None):
+    """
+    Yields (key_path, values) for the keys a .reg file sets. If a set of
+    lower-cased key paths is given, only those keys have their values parsed.
+    """
+    select = None
+    if wanted is not None:
+        select = lambda key_path: normalize_key_path(key_path).lower() in wanted
+    for key_path, values, deleted in iter_reg_file(path, select):
+        if not deleted:
+            if values is not None:
+                values = [value for value in values if value[2] is not None]
+            yield normalize_key_path(key_path), values
+
+
+def device_blocks(registry):
+    """Yields (key_path, values) for the removable devices of a registry, like a backup holds them"""
+    for device in scan_devices(registry):
+        yield f"{ROOT_KEY}\\{device.path}", device.values
+
+
+def hash_values(values):
+    """Returns a digest of a key's values that ignores their order and name case"""
+    digest = hashlib.blake2b(digest_size=16)
+    for name, data, type_ in sorted(values, key=lambda value: value[0].lower()):
+        raw = encode_value_data(data, type_)
+        digest.update(b'%d:%d:%d:' % (len(name), type_, len(raw)))
+        digest.update(name.lower().encode('utf-8'))
+        digest.update(raw)
+    return digest.digest()
+
+
+def index_blocks(blocks):
+    """Returns {lower-cased path: (path, digest)} for a stream of key blocks"""
+    index = {}
+    for key_path, values in blocks:
+        index[key_path.lower()] = (key_path, hash_values(values))
+    return index
+
+
+def collect_values(blocks, wanted):
+    """Returns {lower-cased path: values} for the wanted keys only"""
+    found = {}
+    for key_path, values in blocks:
+        if key_path.lower() in wanted:
+            found[key_path.lower()] = values
+    return found
+
+
+def describe_data(data, type_):
+    """Formats value data the way a .reg file shows it, on a single line"""
+    return format_value('', data, type_)[2:].replace(CONTINUATION, '')
+
+
+def diff_values(key_path, old_values, new_values):
+    """Yields the value changes of one key, sorted by value name"""
+    old = {name.lower(): (name, data, type_) for name, data, type_ in old_values}
+    new = {name.lower(): (name, data, type_) for name, data, type_ in new_values}
+    for lower_name in sorted(old.keys() | new.keys()):
+        if lower_name not in new:
+            name, data, type_ = old[lower_name]
+            yield make_change(VALUE_REMOVED, key_path, name, old=describe_data(data, type_))
+        elif lower_name not in old:
+            name, data, type_ = new[lower_name]
+            yield make_change(VALUE_ADDED, key_path, name, new=describe_data(data, type_))
+        else:
+            name, old_data, old_type = old[lower_name]
+            _, new_data, new_type = new[lower_name]
+            old_text, new_text = describe_data(old_data, old_type), describe_data(new_data, new_type)
+            if old_text != new_text:
+                yield make_change(VALUE_CHANGED, key_path, name, old=old_text, new=new_text)
+
+
+def make_change(change, path, value=None, old=None, new=None):
+    return {'change': change, 'path': path, 'value': value, 'old': old, 'new': new}
+
+
+def diff_sources(open_old, open_new):
+    """
+    Yields changes between two sources, sorted by key path then value name.
+    open_old and open_new are called with None to stream every
+    (key_path, values) block, then again with the set of changed paths to
+    read their values; blocks outside that set may come with no values.
+    """
+    old_index = index_blocks(open_old(None))
+    new_index = index_blocks(open_new(None))
+
+    changed = {path for path, (_, digest) in old_index.items()
+               if path in new_index and new_index[path][1] != digest}
+    old_values = collect_values(open_old(changed), changed) if changed else {}
+    new_values = collect_values(open_new(changed), changed) if changed else {}
+
+    for path in sorted(old_index.keys() | new_index.keys()):
+        if path not in new_index:
+            yield make_change(KEY_REMOVED, old_index[path][0])
+        elif path not in old_index:
+            yield make_change(KEY_ADDED, new_index[path][0])
+        elif path in changed:
+            yield from diff_values(new_index[path][0], old_values.get(path, ()), new_values.get(path, ()))
@@ -0,0 +1,284 @@
+import io
+import re
+from registry import (REG_SZ, REG_EXPAND_SZ, REG_BINARY, REG_DWORD,
+                      REG_DWORD_BIG_ENDIAN, REG_MULTI_SZ, REG_QWORD)
+from instrument import span, count
+from devices import non_removable, get_value
+
+REG_FILE_HEADER = "Windows Registry Editor Version 5.00"
+# Headers accepted when reading, REGEDIT4 being the ANSI format of older exports
+REG_FILE_HEADERS = (REG_FILE_HEADER, "REGEDIT4")
+ROOT_KEY = "HKEY_LOCAL_MACHINE"
+
+# Same wrapping rule as regedit: break once a line reaches 77 columns,
+# continuation lines start with two spaces and hold 25 bytes each
+MAX_HEX_CHARS = 77
+CONTINUATION = "\\\r\n  "
+BYTES_PER_CONTINUATION_LINE = 25
+
+BUFFER_SIZE = 1024 * 1024
+
+# A backslash at the end of a line continues hex data on the next one
+CONTINUATION_RE = re.compile(r'\\\n[ \t]*')
+
+
+def escape_string(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def format_name(name):
+    """Returns the left-hand side of a value line, @ for the default value"""
+    return '@' if not name else f'"{escape_string(name)}"'
+
+
+def format_hex(prefix, data):
+    """Formats bytes as a regedit hex list, wrapped the way regedit wraps it"""
+    if not data:
+        return prefix
+    hex_str = data.hex(',')
+
+    # Each byte takes three characters ("xx,") so lines can be cut by slicing
+    first_line_bytes = max(1, -(-(MAX_HEX_CHARS - len(prefix)) // 3))
+    first_end = first_line_bytes * 3
+    if first_end >= len(hex_str):
+        return prefix + hex_str
+
+    step = BYTES_PER_CONTINUATION_LINE * 3
+    lines = [hex_str[:first_end]]
+    lines.extend(hex_str[i:i + step] for i in range(first_end, len(hex_str), step))
+    return prefix + CONTINUATION.join(lines)
+
+
+def encode_value_data(data, type_):
+    """Returns the raw bytes a value is stored as, for the types exported as hex"""
+    if data is None:
+        return b''
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data)
+    if type_ == REG_MULTI_SZ:
+        return ''.join(s + '\0' for s in data).encode('utf-16-le') + b'\0\0'
+    if type_ in (REG_SZ, REG_EXPAND_SZ):
+        return (data + '\0').encode('utf-16-le')
+    if isinstance(data, int):
+        if type_ == REG_QWORD:
+            return (data & 0xFFFFFFFFFFFFFFFF).to_bytes(8, 'little')
+        return (data & 0xFFFFFFFF).to_bytes(4, 'big' if type_ == REG_DWORD_BIG_ENDIAN else 'little')
+    raise TypeError(f"Unsupported data for registry type {type_}: {type(data).__name__}")
+
+
+def format_value(name, data, type_):
+    """Formats one value as a .reg line (without line terminator)"""
+    prefix = format_name(name) + '='
+    # A quoted string cannot span lines, so like regedit strings with line breaks go out as hex(1)
+    if type_ == REG_SZ and isinstance(data, str) and '\n' not in data and '\r' not in data:
+        return f'{prefix}"{escape_string(data)}"'
+    if type_ == REG_DWORD and isinstance(data, int):
+        return f'{prefix}dword:{data & 0xFFFFFFFF:08x}'
+    if type_ == REG_BINARY:
+        return format_hex(prefix + 'hex:', encode_value_data(data, type_))
+    return format_hex(f'{prefix}hex({type_:x}):', encode_value_data(data, type_))
+
+
+class RegFileWriter:
+    """
+    Streams keys and values to a .reg file in regedit's format
+    (UTF-16 little endian with BOM and CRLF line endings).
+    The target can be a path or any buffered binary file-like object.
+    """
+
+    def __init__(self, target, root=ROOT_KEY):
+        self.root = root
+        self._owns_target = isinstance(target, (str, bytes)) or hasattr(target, '__fspath__')
+        if self._owns_target:
+            target = open(target, 'wb', buffering=BUFFER_SIZE)
+        self._stream = io.TextIOWrapper(target, encoding='utf-16-le', newline='')
+        self._stream.write('\ufeff' + REG_FILE_HEADER + '\r\n\r\n')
+
+    def write_key(self, path, values=()):
+        """Writes a key header followed by its values and a blank line"""
+        lines = [f'[{self.root}\\{path}]']
+        lines.extend(format_value(name, data, type_) for name, data, type_ in values)
+        lines.append('\r\n')
+        self._stream.write('\r\n'.join(lines))
+
+    def write_deleted_key(self, path):
+        self._stream.write(f'[-{self.root}\\{path}]\r\n\r\n')
+
+    def close(self):
+        if self._stream is None:
+            return
+        self._stream.flush()
+        if self._owns_target:
+            count('regfile.bytes_written', self._stream.buffer.tell())
+            self._stream.close()
+        else:
+            # Leave the caller's target open
+            self._stream.detach()
+        self._stream = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def write_devices_backup(target, devices):
+    """Writes every captured value of the given devices to a .reg file"""
+    with span('regfile.write_backup'), RegFileWriter(target) as writer:
+        for device in devices:
+            writer.write_key(device.path, device.values)
+
+
+def write_capabilities_file(target, devices, capabilities=None):
+    """
+    Writes a .reg file that sets Capabilities on the given devices. Without an
+    explicit value, each device keeps its scanned bits except the removable one.
+    """
+    with span('regfile.write_capabilities'), RegFileWriter(target) as writer:
+        for device in devices:
+            value = non_removable(get_value(device.values, "Capabilities")) if capabilities is None else capabilities
+            writer.write_key(device.path, [("Capabilities", value, REG_DWORD)])
+
+
+def decode_value_data(raw, type_):
+    """Converts raw value bytes back to the Python object winreg would return"""
+    if type_ in (REG_SZ, REG_EXPAND_SZ):
+        return raw.decode('utf-16-le', 'replace').split('\0', 1)[0]
+    if type_ == REG_MULTI_SZ:
+        strings = raw.decode('utf-16-le', 'replace').split('\0')
+        while strings and not strings[-1]:
+            strings.pop()
+        return strings
+    if type_ in (REG_DWORD, REG_DWORD_BIG_ENDIAN) and len(raw) == 4:
+        return int.from_bytes(raw, 'big' if type_ == REG_DWORD_BIG_ENDIAN else 'little')
+    if type_ == REG_QWORD and len(raw) == 8:
+        return int.from_bytes(raw, 'little')
+    return raw or None
+
+
+def unescape_string(value):
+    return value.replace('\\\\', '\0').replace('\\"', '"').replace('\0', '\\')
+
+
+def parse_quoted(text, start):
+    """Parses a quoted .reg string starting at text[start], returns (string, end index)"""
+    i = start + 1
+    while True:
+        end = text.find('"', i)
+        if end < 0:
+            raise ValueError(f"Unterminated string: {text}")
+        # A quote is escaped when preceded by an odd number of backslashes
+        backslashes = 0
+        while text[end - 1 - backslashes] == '\\':
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return unescape_string(text[start + 1:end]), end + 1
+        i = end + 1
+
+
+def parse_value_line(line):
+    """Parses a complete value line into (name, data, type); type is None for a deletion"""
+    if line.startswith('@'):
+        name, pos = '', 1
+    else:
+        name, pos = parse_quoted(line, 0)
+    if line[pos:pos + 1] != '=':
+        raise ValueError(f"Invalid value line: {line}")
+    data = line[pos + 1:].strip()
+
+    if data == '-':
+        return name, None, None
+    if data.startswith('"'):
+        return name, parse_quoted(data, 0)[0], REG_SZ
+    if data.startswith('dword:'):
+        return name, int(data[6:], 16), REG_DWORD
+    if data.startswith('hex'):
+        tag, _, hex_str = data.partition(':')
+        type_ = int(tag[4:-1], 16) if tag.startswith('hex(') else REG_BINARY
+        raw = bytes.fromhex(hex_str.replace(',', ' '))
+        return name, decode_value_data(raw, type_), type_
+    raise ValueError(f"Unsupported value data: {line}")
+
+
+def open_reg_text(path):
+    """Opens a .reg file as text, detecting UTF-16 exports and ANSI REGEDIT4 files"""
+    with open(path, 'rb') as f:
+        bom = f.read(2)
+    if bom == b'\xff\xfe':
+        encoding = 'utf-16'
+    elif bom == b'\xfe\xff':
+        encoding = 'utf-16'
+    else:
+        encoding = 'utf-8-sig'
+    return open(path, 'r', encoding=encoding, errors='replace', newline=None, buffering=BUFFER_SIZE)
+
+
+def iter_logical_lines(f):
+    """
+    Yields the lines of a .reg text stream with hex continuations joined.
+    Text is read in large chunks and continuations are removed per chunk,
+    which is much faster than joining them line by line.
+    """
+    tail = ''
+    while True:
+        chunk = f.read(BUFFER_SIZE)
+        if not chunk:
+            break
+        text = tail + chunk
+        # Hold back the last line, along with the lines it continues
+        end = text.rfind('\n')
+        while end > 0 and text[end - 1] == '\\':
+            end = text.rfind('\n', 0, end)
+        if end < 0:
+            tail = text
+            continue
+        tail = text[end + 1:]
+        yield from CONTINUATION_RE.sub('', text[:end]).split('\n')
+    if tail:
+        yield from CONTINUATION_RE.sub('', tail).split('\n')
+
+
+def iter_reg_file(path, select=None):
+    """
+    Streams a .reg file, yielding (key_path, values, deleted) for every key block.
+    key_path includes the root key name; values is a list of (name, data, type).
+    If select is given, values are only parsed for the key paths it returns
+    True for, the other keys are yielded with values set to None.
+    Raises ValueError if the file does not start with a regedit header.
+    """
+    key_path = None
+    values = None
+    deleted = False
+
+    with open_reg_text(path) as f:
+        lines = iter_logical_lines(f)
+        for line in lines:
+            if line.strip():
+                if line.strip() not in REG_FILE_HEADERS:
+                    raise ValueError(f"Not a .reg file, the \"{REG_FILE_HEADER}\" header is missing: {path}")
+                break
+        else:
+            raise ValueError(f"Empty .reg file: {path}")
+
+        for line in lines:
+            stripped = line.strip()
+            if not stripped or stripped.startswith(';'):
+                continue
+            if stripped.startswith('['):
+                if key_path is not None:
+                    yield key_path, values, deleted
+                deleted = stripped.startswith('[-')
+                key_path = stripped[2 if deleted else 1:stripped.rindex(']')]
+                values = [] if select is None or select(key_path) else None
+            elif values is not None and not deleted:
+                values.append(parse_value_line(stripped))
+
+    if key_path is not None:
+        yield key_path, values, deleted
+
+
+def split_root(key_path):
+    """Splits 'HKEY_LOCAL_MACHINE\\SYSTEM\\...' into the root name and the rest"""
+    root, _, path = key_path.partition('\\')
+    return root, path
@@ -0,0 +1,227 @@
+import time
+from instrument import count
+
+try:
+    import winreg
+except ImportError:
+    # Not running on Windows, only the in-memory registry is available
+    winreg = None
+
+# Registry value types, mirrored here so they are available outside Windows
+REG_NONE = 0
+REG_SZ = 1
+REG_EXPAND_SZ = 2
+REG_BINARY = 3
+REG_DWORD = 4
+REG_DWORD_BIG_ENDIAN = 5
+REG_MULTI_SZ = 7
+REG_QWORD = 11
+
+# Offset between the FILETIME epoch (1601) and the Unix epoch, in 100ns units
+FILETIME_UNIX_OFFSET = 116444736000000000
+
+
+def filetime_now():
+    """Returns the current time as a FILETIME value, like QueryInfoKey reports"""
+    return FILETIME_UNIX_OFFSET + time.time_ns() // 100
+
+
+class RegistryBackend:
+    """
+    Interface every registry implementation provides.
+    Paths are relative to HKEY_LOCAL_MACHINE unless a parent key is given,
+    and failures are reported as OSError like winreg does.
+    """
+
+    def open_key(self, path, parent=None, write=False):
+        """Opens an existing key for reading, or for setting values if write is True"""
+        raise NotImplementedError
+
+    def create_key(self, path, parent=None):
+        """Opens a key for writing, creating it and any missing parents"""
+        raise NotImplementedError
+
+    def close_key(self, key):
+        raise NotImplementedError
+
+    def enum_keys(self, key):
+        """Yields the names of the direct subkeys of an opened key"""
+        raise NotImplementedError
+
+    def enum_values(self, key):
+        """Yields (name, data, type) for every value of an opened key"""
+        raise NotImplementedError
+
+    def query_value(self, key, name):
+        """Returns (data, type) for a value, raises OSError if it does not exist"""
+        raise NotImplementedError
+
+    def query_info(self, key):
+        """Returns (subkey_count, value_count, last_write) with last_write as a FILETIME"""
+        raise NotImplementedError
+
+    def set_value(self, key, name, data, type_):
+        """Writes a value to a key opened for writing"""
+        raise NotImplementedError
+
+
+class WinRegistry(RegistryBackend):
+    """Registry access through winreg, rooted at HKEY_LOCAL_MACHINE"""
+
+    def open_key(self, path, parent=None, write=False):
+        count('registry.keys_opened')
+        if parent is None:
+            parent = winreg.HKEY_LOCAL_MACHINE
+        access = winreg.KEY_READ | winreg.KEY_SET_VALUE if write else winreg.KEY_READ
+        return winreg.OpenKey(parent, path, 0, access)
+
+    def create_key(self, path, parent=None):
+        if parent is None:
+            parent = winreg.HKEY_LOCAL_MACHINE
+        return winreg.CreateKeyEx(parent, path, 0, winreg.KEY_READ | winreg.KEY_WRITE)
+
+    def close_key(self, key):
+        winreg.CloseKey(key)
+
+    def enum_keys(self, key):
+        i = 0
+        while True:
+            try:
+                name = winreg.EnumKey(key, i)
+            except OSError:
+                break
+            yield name
+            i += 1
+
+    def enum_values(self, key):
+        i = 0
+        while True:
+            try:
+                value = winreg.EnumValue(key, i)
+            except OSError:
+                break
+            yield value
+            i += 1
+
+    def query_value(self, key, name):
+        return winreg.QueryValueEx(key, name)
+
+    def query_info(self, key):
+        return winreg.QueryInfoKey(key)
+
+    def set_value(self, key, name, data, type_):
+        winreg.SetValueEx(key, name, 0, type_, data)
+
+
+class MemoryKey:
+    """A registry key held in memory"""
+
+    def __init__(self, name):
+        self.name = name
+        self.subkeys = {}
+        self.values = {}
+        self.last_write = filetime_now()
+
+    def subkey(self, name, create=False):
+        """Returns a direct subkey by name (case-insensitive), creating it if requested"""
+        key = self.subkeys.get(name.lower())
+        if key is None:
+            if not create:
+                raise FileNotFoundError(f"Registry key not found: {name}")
+            key = MemoryKey(name)
+            self.subkeys[name.lower()] = key
+            self.last_write = key.last_write
+        return key
+
+
+class MemoryRegistry(RegistryBackend):
+    """
+    In-memory registry, used to run Nomoject and measure it off Windows.
+    An optional per-key latency simulates slow registry access.
+    """
+
+    def __init__(self, latency=0.0):
+        self.root = MemoryKey("HKEY_LOCAL_MACHINE")
+        self.latency = latency
+
+    @classmethod
+    def from_reg_file(cls, path, latency=0.0):
+        """Builds a registry from the HKEY_LOCAL_MACHINE keys of a .reg file"""
+        # Imported here since regfile depends on the constants of this module
+        from regfile import iter_reg_file, split_root
+
+        registry = cls(latency)
+        for key_path, values, deleted in iter_reg_file(path):
+            root, path = split_root(key_path)
+            if root.upper() not in ('HKEY_LOCAL_MACHINE', 'HKLM') or deleted:
+                continue
+            key = registry.create_key(path)
+            for name, data, type_ in values:
+                if type_ is not None:
+                    registry.set_value(key, name, data, type_)
+        return registry
+
+    def _walk(self, path, parent, create):
+        if self.latency:
+            time.sleep(self.latency)
+        key = self.root if parent is None else parent
+        for part in path.split("\\"):
+            if part:
+                key = key.subkey(part, create)
+        return key
+
+    def open_key(self, path, parent=None, write=False):
+        count('registry.keys_opened')
+        return self._walk(path, parent, False)
+
+    def create_key(self, path, parent=None):
+        return self._walk(path, parent, True)
+
+    def close_key(self, key):
+        pass
+
+    def enum_keys(self, key):
+        for subkey in list(key.subkeys.values()):
+            yield subkey.name
+
+    def enum_values(self, key):
+        yield from list(key.values.values())
+
+    def query_value(self, key, name):
+        try:
+            _, data, type_ = key.values[name.lower()]
+        except KeyError:
+            raise FileNotFoundError(f"Registry value not found: {name}")
+        return data, type_
+
+    def query_info(self, key):
+        return len(key.subkeys), len(key.values), key.last_write
+
+    def set_value(self, key, name, data, type_):
+        key.values[name.lower()] = (name, data, type_)
+        key.last_write = filetime_now()
+
+    def delete_key(self, path):
+        """Removes a key and its whole subtree, used to simulate device removal"""
+        parent_path, _, name = path.rpartition("\\")
+        parent = self.open_key(parent_path)
+        if parent.subkeys.pop(name.lower(), None) is None:
+            raise FileNotFoundError(f"Registry key not found: {path}")
+        parent.last_write = filetime_now()
+
+
+def open_registry(source=None, latency=0.0):
+    """
+    Returns the live registry, or one backed by a file: an offline hive
+    is opened read-only in place, a .reg file is loaded into memory.
+    """
+    if source:
+        with open(source, 'rb') as f:
+            magic = f.read(4)
+        if magic == b'regf':
+            from hive import HiveRegistry
+            return HiveRegistry(source)
+        return MemoryRegistry.from_reg_file(source, latency)
+    if winreg is None:
+        raise OSError("The Windows registry is not available on this system")
+    return WinRegistry()
@@ -0,0 +1,232 @@
+"""
+Declarative device selection: a rules file saying which devices to hide
+from the Eject popup and which to keep, for unattended runs and for
+preselecting devices in the GUI.
+
+Example (JSON, TOML with the same structure works too):
+
+    {
+        "version": 1,
+        "default": "keep",
+        "rules": [
+            {"action": "keep", "id": "VEN_1AF4&DEV_1050"},
+            {"action": "hide", "id": "VEN_1AF4"},
+            {"action": "hide", "instance": "3&*&0&*", "description": "Ethernet"}
+        ]
+    }
+
+Rules are tried in order and the first one matching a device decides.
+"id" takes a vendor key prefix and matches the vendor, device and
+subsystem IDs it names; "instance" is a wildcard and "description" a
+regular expression searched case-insensitively.
+"""
+import re
+import json
+from fnmatch import translate
+from devices import PCI_ID_PATTERN
+
+SELECTION_VERSION = 1
+
+HIDE = 'hide'
+KEEP = 'keep'
+
+RULE_FIELDS = {'action', 'id', 'vendor_id', 'device_id', 'subsys_id', 'instance', 'description'}
+
+# Global inline flags, only allowed at the start of a pattern
+LEADING_FLAGS_RE = re.compile(r'\(\?([aiLmsux]+)\)')
+# Numbered or named references to a group, or a conditional on one
+GROUP_REFERENCE_RE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+
+class Rule:
+    """One compiled rule; the ID fields are upper-cased and None means any"""
+    __slots__ = ('index', 'action', 'vendor_id', 'device_id', 'subsys_id', 'instance', 'description')
+
+    def __init__(self, index, spec):
+        if not isinstance(spec, dict):
+            raise ValueError(f"Rule {index + 1}: must be an object")
+        if not spec.keys() <= RULE_FIELDS:
+            raise ValueError(f"Rule {index + 1}: unknown fields {sorted(set(spec) - RULE_FIELDS)}")
+        self.index = index
+        self.action = spec.get('action')
+        if self.action not in (HIDE, KEEP):
+            raise ValueError(f"Rule {index + 1}: action must be '{HIDE}' or '{KEEP}'")
+
+        ids = [spec.get('vendor_id'), spec.get('device_id'), spec.get('subsys_id')]
+        if spec.get('id'):
+            match = PCI_ID_PATTERN.match(spec['id'])
+            if not match:
+                raise ValueError(f"Rule {index + 1}: unrecognized id {spec['id']!r}")
+            ids = [part or given for part, given in zip(match.groups(), ids)]
+        self.vendor_id, self.device_id, self.subsys_id = [part.upper() if part else None for part in ids]
+
+        try:
+            self.instance = re.compile(translate(spec['instance']), re.IGNORECASE) if spec.get('instance') else None
+            self.description = re.compile(spec['description'], re.IGNORECASE) if spec.get('description') else None
+        except re.error as e:
+            raise ValueError(f"Rule {index + 1}: {e}")
+
+    @property
+    def ids(self):
+        return self.vendor_id, self.device_id, self.subsys_id
+
+    def has_patterns(self):
+        return self.instance is not None or self.description is not None
+
+    def matches(self, device):
+        for wanted, actual in zip(self.ids, (device.vendor_id, device.device_id, device.subsys_id)):
+            if wanted is not None and wanted != actual:
+                return False
+        if self.instance is not None and not self.instance.match(device.instance):
+            return False
+        if self.description is not None and not self.description.search(device.desc):
+            return False
+        return True
+
+
+class PatternGroup:
+    """
+    Pattern rules sharing the same IDs. One combined regex per field tells
+    whether any rule of the group can match before they are tried in turn,
+    None when the patterns cannot be combined and only the rules are tried.
+    """
+
+    def __init__(self):
+        self.rules = []
+
+    def compile(self):
+        # Rules without a description pattern match any description, same for instances
+        self.any_instance = any(rule.instance is None for rule in self.rules)
+        self.any_description = any(rule.description is None for rule in self.rules)
+        self.instances = combine(rule.instance for rule in self.rules)
+        self.descriptions = combine(rule.description for rule in self.rules)
+
+    def first_match(self, device, before=None):
+        """Returns the first rule of the group matching a device whose IDs fit the group, or None"""
+        instance, desc = device.instance, device.desc
+        if not self.any_instance and self.instances is not None and not self.instances.match(instance):
+            return None
+        if not self.any_description and self.descriptions is not None and not self.descriptions.search(desc):
+            return None
+        for rule in self.rules:
+            if before is not None and rule.index > before:
+                break
+            if rule.instance is not None and not rule.instance.match(instance):
+                continue
+            if rule.description is not None and not rule.description.search(desc):
+                continue
+            return rule
+        return None
+
+
+class DeviceSelection:
+    """
+    Matcher compiled from a list of rules. Rules are hashed by their
+    (vendor, device, subsystem) IDs with None for any, so a device only
+    looks up the eight ID combinations it can match instead of walking
+    every rule. Rules made only of IDs are decided by those lookups;
+    pattern rules are grouped under the same keys and a group is only
+    tried when its combined regexes match.
+    """
+
+    def __init__(self, rules, default=KEEP):
+        if default not in (HIDE, KEEP):
+            raise ValueError(f"default must be '{HIDE}' or '{KEEP}'")
+        self.default = default
+        self.rules = [Rule(index, spec) for index, spec in enumerate(rules)]
+
+        self.exact = {}
+        self.patterns = {}
+        for rule in self.rules:
+            if rule.has_patterns():
+                self.patterns.setdefault(rule.ids, PatternGroup()).rules.append(rule)
+            else:
+                # Keep the first rule for a given key, later ones never win
+                self.exact.setdefault(rule.ids, rule)
+        for group in self.patterns.values():
+            group.compile()
+
+    def match(self, device):
+        """Returns the first rule matching the device, or None"""
+        best = None
+        vendor_id, device_id, subsys_id = device.vendor_id, device.device_id, device.subsys_id
+        for key in ((vendor_id, device_id, subsys_id), (vendor_id, device_id, None), (vendor_id, None, subsys_id),
+                    (vendor_id, None, None), (None, device_id, subsys_id), (None, device_id, None),
+                    (None, None, subsys_id), (None, None, None)):
+            rule = self.exact.get(key)
+            if rule is not None and (best is None or rule.index < best.index):
+                best = rule
+            group = self.patterns.get(key)
+            if group is not None:
+                rule = group.first_match(device, best.index if best is not None else None)
+                if rule is not None:
+                    best = rule
+        return best
+
+    def action(self, device):
+        rule = self.match(device)
+        return rule.action if rule is not None else self.default
+
+    def hidden(self, devices):
+        """Returns the devices the rules hide, in the given order"""
+        return [device for device in devices if self.action(device) == HIDE]
+
+
+def scope_flags(source):
+    """Turns the global inline flags a pattern starts with, like (?s), into a group scoped to it"""
+    flags = ''
+    match = LEADING_FLAGS_RE.match(source)
+    while match:
+        flags += match.group(1)
+        source = source[match.end():]
+        match = LEADING_FLAGS_RE.match(source)
+    if not flags:
+        return f'(?:{source})'
+    # A verbose pattern may end in a comment, which would swallow the closing parenthesis
+    return f'(?{flags}:{source}\n)' if 'x' in flags else f'(?{flags}:{source})'
+
+
+def combine(patterns):
+    """
+    Joins compiled patterns into one case-insensitive alternation, or returns
+    None when they cannot be joined and have to be tried one by one
+    """
+    sources = []
+    groups = 0
+    for pattern in patterns:
+        if pattern is None:
+            continue
+        # Group numbers shift in an alternation, references would point at another pattern's groups
+        if groups and pattern.groups and GROUP_REFERENCE_RE.search(pattern.pattern):
+            return None
+        groups += pattern.groups
+        sources.append(scope_flags(pattern.pattern))
+    try:
+        return re.compile('|'.join(sources) or r'(?!)', re.IGNORECASE)
+    except re.error:
+        # Group names repeated across patterns, or flags that cannot be scoped
+        return None
+
+
+def load_selection(path):
+    """Reads and compiles a rules file (.json or .toml), raising ValueError if it is invalid"""
+    if path.lower().endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError("TOML files need Python 3.11 or later, use a .json file instead")
+        with open(path, 'rb') as f:
+            try:
+                spec = tomllib.load(f)
+            except tomllib.TOMLDecodeError as e:
+                raise ValueError(str(e))
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+
+    if not isinstance(spec, dict) or spec.get('version') != SELECTION_VERSION:
+        raise ValueError("Unsupported device selection file")
+    rules = spec.get('rules', [])
+    if not isinstance(rules, list):
+        raise ValueError("Malformed device selection file")
+    return DeviceSelection(rules, spec.get('default', KEEP))
@@ -0,0 +1,52 @@
+import os
+import json
+
+DEFAULT_SETTINGS = {
+    'check_for_updates': True,
+    'update_check_ttl': 24 * 60 * 60,  # seconds
+    'watch_devices': True,
+    # Which devices are listed, see devices.DeviceFilter.from_config
+    'device_filter': {
+        'buses': ['PCI'],
+        'capabilities_mask': 0x4,  # CM_DEVCAP_REMOVABLE
+        'hardware_id': None,
+        'class_guids': [],
+    },
+    # Rules file that preselects devices, see selection.py
+    'selection_file': None,
+}
+
+
+def get_app_data_dir():
+    """Returns the per-user folder where Nomoject keeps settings and caches"""
+    override = os.environ.get('NOMOJECT_DATA_DIR')
+    if override:
+        return override
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(base, 'Nomoject')
+
+
+def get_settings_path():
+    return os.path.join(get_app_data_dir(), 'settings.json')
+
+
+def load_settings():
+    """Loads user settings, falling back to the defaults for anything missing or unreadable"""
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        with open(get_settings_path(), 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        if isinstance(stored, dict):
+            settings.update(stored)
+    except (OSError, ValueError):
+        pass
+    return settings
+
+
+def save_settings(settings):
+    path = get_settings_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(settings, f, indent=2)
+    os.replace(tmp_path, path)
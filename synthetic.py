@@ -0,0 +1,309 @@
+"""
+Generates synthetic Enum\\PCI trees for profiling Nomoject off Windows.
+The benchmarks build all their data here, including pci.ids databases.
+
+Usage: python synthetic.py OUTPUT.reg [--vendors N | --devices N] [--instances N] [--seed N] [--detailed] [--hive]
+"""
+import sys
+import struct
+import random
+import argparse
+from devices import PCI_ENUM_PATH, REMOVABLE_CAPABILITIES
+from registry import MemoryRegistry, REG_NONE, REG_SZ, REG_EXPAND_SZ, REG_BINARY, REG_DWORD, REG_MULTI_SZ, REG_QWORD
+
+# (vendor id, device id, description) pairs seen on typical QEMU/KVM guests
+KNOWN_DEVICES = [
+    (0x1AF4, 0x1000, "Red Hat VirtIO Ethernet Adapter"),
+    (0x1AF4, 0x1001, "Red Hat VirtIO SCSI controller"),
+    (0x1AF4, 0x1002, "VirtIO Balloon Driver"),
+    (0x1AF4, 0x1003, "VirtIO Serial Driver"),
+    (0x1AF4, 0x1004, "Red Hat VirtIO SCSI pass-through controller"),
+    (0x1AF4, 0x1005, "VirtIO RNG Device"),
+    (0x1AF4, 0x1041, "Red Hat VirtIO Ethernet Adapter"),
+    (0x1AF4, 0x1050, "Red Hat VirtIO GPU DOD controller"),
+    (0x1B36, 0x000D, "Red Hat QEMU XHCI Host Controller"),
+    (0x8086, 0x10D3, "Intel(R) 82574L Gigabit Network Connection"),
+    (0x10DE, 0x2204, "NVIDIA GeForce RTX 3090"),
+    (0x1002, 0x73BF, "AMD Radeon RX 6800 XT"),
+]
+
+CLASS_GUIDS = [
+    "{4d36e972-e325-11ce-bfc1-08002be10318}",
+    "{4d36e97b-e325-11ce-bfc1-08002be10318}",
+    "{4d36e97d-e325-11ce-bfc1-08002be10318}",
+    "{4d36e968-e325-11ce-bfc1-08002be10318}",
+]
+
+# Shape of the trees the benchmarks run on: installed devices, mostly removable, mixed blob sizes
+BENCHMARK_TREE = {'instances': 8, 'removable_ratio': 0.9, 'blob_size': (64, 256, 1024), 'detailed': True}
+
+
+def instance_values(rng, vendor_id, device_id, subsys, desc, removable, blob_size, detailed=False):
+    """
+    Returns a realistic value set for one device instance key. detailed adds
+    the values of a fully installed device, including REG_QWORD and REG_NONE
+    ones, and gives a few devices the generic "PCI Device" name.
+    """
+    hardware_ids = [
+        f"PCI\\VEN_{vendor_id:04X}&DEV_{device_id:04X}&SUBSYS_{subsys:08X}&REV_00",
+        f"PCI\\VEN_{vendor_id:04X}&DEV_{device_id:04X}&SUBSYS_{subsys:08X}",
+        f"PCI\\VEN_{vendor_id:04X}&DEV_{device_id:04X}&CC_020000",
+        f"PCI\\VEN_{vendor_id:04X}&DEV_{device_id:04X}",
+    ]
+    device_desc = f"@oem{rng.randrange(1, 40)}.inf,%dev_{device_id:04x}%;{desc}"
+    if detailed and rng.random() < 0.05:
+        device_desc = "PCI Device"
+    if not isinstance(blob_size, int):
+        blob_size = rng.choice(blob_size)
+    values = [
+        ("DeviceDesc", device_desc, REG_SZ),
+        ("LocationInformation", f"PCI bus {rng.randrange(0, 8)}, device {rng.randrange(0, 32)}, function 0", REG_SZ),
+        ("Capabilities", REMOVABLE_CAPABILITIES if removable else 2, REG_DWORD),
+        ("UINumber", rng.randrange(0, 64), REG_DWORD),
+        ("HardwareID", hardware_ids, REG_MULTI_SZ),
+        ("CompatibleIDs", [f"PCI\\VEN_{vendor_id:04X}&CC_020000", "PCI\\CC_0200"], REG_MULTI_SZ),
+        ("ContainerID", "{00000000-0000-0000-ffff-ffffffffffff}", REG_SZ),
+        ("ClassGUID", rng.choice(CLASS_GUIDS), REG_SZ),
+        ("Driver", f"{rng.choice(CLASS_GUIDS)}\\{rng.randrange(0, 10000):04d}", REG_SZ),
+        ("Service", "netkvm", REG_SZ),
+        ("Mfg", "@oem3.inf,%rhel%;Red Hat, Inc.", REG_SZ),
+        ("ConfigFlags", 0, REG_DWORD),
+        ("ImagePath", "%SystemRoot%\\System32\\drivers\\netkvm.sys", REG_EXPAND_SZ),
+        ("ResourceData", rng.randbytes(blob_size), REG_BINARY),
+    ]
+    if detailed:
+        values += [
+            ("Address", rng.randrange(0, 32), REG_DWORD),
+            ("InstallDate", 0x01D9000000000000 + rng.randrange(0, 1 << 48), REG_QWORD),
+            ("Phantom", None, REG_NONE),
+        ]
+    return values
+
+
+def generate_pci_tree(registry=None, vendors=1000, instances=4, removable_ratio=0.5, blob_size=256, seed=0,
+                      devices=None, detailed=False):
+    """
+    Fills a registry with a synthetic Enum\\PCI tree and returns it.
+    Each vendor key gets the given number of instances, a share of which
+    is marked removable. With devices, vendor keys get one to instances
+    instances each until that many devices exist. blob_size may be a
+    sequence of sizes to pick from, and detailed adds the values and the
+    Device Parameters subkey of fully installed devices. The output is
+    deterministic for a given seed.
+    """
+    rng = random.Random(seed)
+    registry = registry or MemoryRegistry()
+
+    created = 0
+    v = 0
+    while (created < devices) if devices is not None else (v < vendors):
+        vendor_id, device_id, desc = KNOWN_DEVICES[v % len(KNOWN_DEVICES)]
+        # Vary the device id so every vendor key is unique
+        device_id = (device_id + v // len(KNOWN_DEVICES)) & 0xFFFF
+        subsys = rng.randrange(0, 0xFFFFFFFF)
+        vendor_key_name = f"VEN_{vendor_id:04X}&DEV_{device_id:04X}&SUBSYS_{subsys:08X}&REV_00"
+        count = instances if devices is None else min(rng.randint(1, instances), devices - created)
+
+        for i in range(count):
+            instance_name = f"3&{rng.randrange(0, 0xFFFFFFFF):08x}&0&{i * 8:02X}"
+            key = registry.create_key(f"{PCI_ENUM_PATH}\\{vendor_key_name}\\{instance_name}")
+            removable = rng.random() < removable_ratio
+            for name, data, type_ in instance_values(rng, vendor_id, device_id, subsys, desc, removable, blob_size,
+                                                     detailed):
+                registry.set_value(key, name, data, type_)
+            if detailed:
+                parameters = registry.create_key("Device Parameters", key)
+                registry.set_value(parameters, "SymbolicName",
+                                   f"\\??\\PCI#{vendor_key_name}#{instance_name}#{{{CLASS_GUIDS[0][1:-1]}}}", REG_SZ)
+                registry.close_key(parameters)
+            registry.close_key(key)
+        created += count
+        v += 1
+
+    return registry
+
+
+def generate_devices(devices, seed=0, **options):
+    """Returns the removable devices of a benchmark tree holding that many devices, as scanned"""
+    from devices import scan_devices
+
+    return list(scan_devices(generate_pci_tree(devices=devices, seed=seed, **dict(BENCHMARK_TREE, **options))))
+
+
+def iter_tree(registry, path):
+    """Yields (path, values) for a key and all its descendants"""
+    key = registry.open_key(path)
+    try:
+        yield path, list(registry.enum_values(key))
+        subkeys = list(registry.enum_keys(key))
+    finally:
+        registry.close_key(key)
+    for name in subkeys:
+        yield from iter_tree(registry, f"{path}\\{name}")
+
+
+def hive_name_hash(name):
+    """Returns the name hint stored in "lh" subkey lists"""
+    h = 0
+    for c in name.upper():
+        h = (h * 37 + ord(c)) & 0xFFFFFFFF
+    return h
+
+
+class HiveWriter:
+    """
+    Serializes an in-memory key tree to a minimal but valid regf file,
+    with a single hive bin. Used to build SYSTEM hive fixtures.
+    """
+
+    def __init__(self):
+        # Cell offsets are relative to the first hive bin, after its 32 byte header
+        self.cells = bytearray(32)
+
+    def alloc(self, data):
+        """Appends an allocated cell and returns its offset"""
+        offset = len(self.cells)
+        size = (len(data) + 4 + 7) & ~7
+        self.cells += struct.pack('<i', -size) + data + bytes(size - 4 - len(data))
+        return offset
+
+    def write_key(self, key, parent_offset, root=False):
+        from hive import NK_HEADER, KEY_COMP_NAME
+
+        name = key.name.encode('latin-1')
+        # Root keys are flagged as the hive entry and not deletable
+        flags = KEY_COMP_NAME | (0x0C if root else 0)
+        offset = self.alloc(NK_HEADER.pack(b'nk', flags, key.last_write, parent_offset,
+                                           0, 0, 0, 0, 0, 0, len(name), 0) + name)
+
+        subkeys = sorted(key.subkeys.values(), key=lambda subkey: subkey.name.upper())
+        entries = [(self.write_key(subkey, offset), hive_name_hash(subkey.name)) for subkey in subkeys]
+        subkey_list = 0
+        if entries:
+            subkey_list = self.alloc(struct.pack('<2sH', b'lh', len(entries))
+                                     + b''.join(struct.pack('<II', *entry) for entry in entries))
+
+        value_offsets = [self.write_value(*value) for value in key.values.values()]
+        value_list = self.alloc(struct.pack(f'<{len(value_offsets)}I', *value_offsets)) if value_offsets else 0
+
+        # Fill in the counts now that the lists exist
+        struct.pack_into('<I4xI4xII', self.cells, offset + 4 + 20, len(entries), subkey_list,
+                         len(value_offsets), value_list)
+        return offset
+
+    def write_value(self, name, data, type_):
+        from hive import VK_HEADER, VALUE_COMP_NAME, DATA_INLINE_FLAG, BIG_DATA_SEGMENT_SIZE
+        from regfile import encode_value_data
+
+        raw_name = name.encode('latin-1')
+        raw = encode_value_data(data, type_)
+        if len(raw) <= 4:
+            data_size, data_offset = len(raw) | DATA_INLINE_FLAG, int.from_bytes(raw.ljust(4, b'\0'), 'little')
+        elif len(raw) > BIG_DATA_SEGMENT_SIZE:
+            segments = [self.alloc(raw[i:i + BIG_DATA_SEGMENT_SIZE])
+                        for i in range(0, len(raw), BIG_DATA_SEGMENT_SIZE)]
+            segment_list = self.alloc(struct.pack(f'<{len(segments)}I', *segments))
+            data_size, data_offset = len(raw), self.alloc(struct.pack('<2sHI', b'db', len(segments), segment_list))
+        else:
+            data_size, data_offset = len(raw), self.alloc(raw)
+        return self.alloc(VK_HEADER.pack(b'vk', len(raw_name), data_size, data_offset, type_, VALUE_COMP_NAME)
+                          + raw_name)
+
+    def save(self, path, root):
+        root_offset = self.write_key(root, 0, root=True)
+        # Pad the bin to a multiple of 4096 with one free cell
+        bin_size = (len(self.cells) + 4095) & ~4095
+        if bin_size - len(self.cells) < 8:
+            bin_size += 4096
+        self.cells += struct.pack('<i', bin_size - len(self.cells)) + bytes(bin_size - len(self.cells) - 4)
+        struct.pack_into('<4sII', self.cells, 0, b'hbin', 0, bin_size)
+
+        base = bytearray(4096)
+        struct.pack_into('<4sIIQIIIIIII', base, 0, b'regf', 1, 1, root.last_write, 1, 5, 0, 1,
+                         root_offset, bin_size, 1)
+        checksum = 0
+        for dword in struct.unpack_from('<127I', base):
+            checksum ^= dword
+        struct.pack_into('<I', base, 0x1FC, checksum)
+        with open(path, 'wb') as f:
+            f.write(base)
+            f.write(self.cells)
+
+
+def write_system_hive(registry, path):
+    """
+    Writes the SYSTEM key of an in-memory registry as an offline hive,
+    with CurrentControlSet stored as ControlSet001 like Windows does.
+    """
+    from registry import MemoryKey
+
+    system = registry.open_key("SYSTEM")
+    root = MemoryKey(system.name)
+    root.values = system.values
+    for name, key in system.subkeys.items():
+        if name == 'currentcontrolset':
+            control_set = MemoryKey("ControlSet001")
+            control_set.subkeys, control_set.values = key.subkeys, key.values
+            root.subkeys['controlset001'] = control_set
+        else:
+            root.subkeys[name] = key
+    select = root.subkey("Select", create=True)
+    select.values['current'] = ("Current", 1, REG_DWORD)
+    HiveWriter().save(path, root)
+
+
+def write_reg_file(registry, path):
+    """Exports the Enum\\PCI tree of a registry as a .reg file"""
+    from regfile import RegFileWriter
+
+    with RegFileWriter(path) as writer:
+        for key_path, values in iter_tree(registry, PCI_ENUM_PATH):
+            writer.write_key(key_path, values)
+
+
+def write_pci_ids(path, vendors, seed=0):
+    """Writes a pci.ids-like database, returns (vendor, device, subsystem) IDs as hex strings"""
+    rng = random.Random(seed)
+    ids = []
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("# Synthetic PCI ID list\n")
+        for vendor in sorted(rng.sample(range(0x10000), vendors)):
+            f.write(f"{vendor:04x}  Vendor {vendor:04X} Corporation\n")
+            for device in sorted(rng.sample(range(0x10000), rng.randint(1, 14))):
+                f.write(f"\t{device:04x}  Device {device:04X} Controller\n")
+                subsys = None
+                for _ in range(rng.choice((0, 0, 0, 1, 3))):
+                    subvendor, subdevice = rng.randrange(0x10000), rng.randrange(0x10000)
+                    f.write(f"\t\t{subvendor:04x} {subdevice:04x}  Subsystem {subdevice:04X}\n")
+                    subsys = f"{subdevice:04X}{subvendor:04X}"
+                ids.append((f"{vendor:04X}", f"{device:04X}", subsys))
+        f.write("C 00  Unclassified device\n\t00  Non-VGA unclassified device\n")
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('output')
+    parser.add_argument('--vendors', type=int, default=1000)
+    parser.add_argument('--devices', type=int, help="total device count, spread over vendors of 1 to --instances")
+    parser.add_argument('--instances', type=int, default=4)
+    parser.add_argument('--removable-ratio', type=float, default=0.5)
+    parser.add_argument('--blob-size', type=int, default=256)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--detailed', action='store_true', help="add the values and subkeys of installed devices")
+    parser.add_argument('--hive', action='store_true', help="write an offline SYSTEM hive instead of a .reg file")
+    args = parser.parse_args()
+
+    registry = generate_pci_tree(vendors=args.vendors, instances=args.instances,
+                                 removable_ratio=args.removable_ratio,
+                                 blob_size=args.blob_size, seed=args.seed,
+                                 devices=args.devices, detailed=args.detailed)
+    if args.hive:
+        write_system_hive(registry, args.output)
+    else:
+        write_reg_file(registry, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
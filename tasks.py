@@ -0,0 +1,131 @@
+"""
+Startup task management through the Task Scheduler command line.
+
+The task is described by a single generated XML definition and each
+operation is one schtasks invocation with an argument list, no shell and
+no quoting of nested commands. Processes are started through a runner so
+the GUI can run them asynchronously and tests can stand in a fake
+schtasks (NOMOJECT_SCHTASKS points at any executable taking the same
+arguments).
+"""
+import os
+import locale
+
+TASK_NAME = "NomojectRegistryApply"
+TASK_XML_FILENAME = "nomoject_task.xml"
+
+# Operations, as reported back to on_finished callbacks
+INSTALL = 'install'
+QUERY = 'query'
+RUN = 'run'
+DELETE = 'delete'
+
+# Well-known SID of the LocalSystem account
+SYSTEM_SID = "S-1-5-18"
+
+TASK_XML_TEMPLATE = """<?xml version="1.0" encoding="UTF-16"?>
+<Task version="1.2" xmlns="http://schemas.microsoft.com/windows/2004/02/mit/task">
+  <RegistrationInfo>
+    <Description>{description}</Description>
+    <URI>\\{name}</URI>
+  </RegistrationInfo>
+  <Triggers>
+    <BootTrigger>
+      <Enabled>true</Enabled>
+    </BootTrigger>
+  </Triggers>
+  <Principals>
+    <Principal id="Author">
+      <UserId>{user}</UserId>
+      <RunLevel>HighestAvailable</RunLevel>
+    </Principal>
+  </Principals>
+  <Settings>
+    <MultipleInstancesPolicy>IgnoreNew</MultipleInstancesPolicy>
+    <DisallowStartIfOnBatteries>false</DisallowStartIfOnBatteries>
+    <StopIfGoingOnBatteries>false</StopIfGoingOnBatteries>
+    <ExecutionTimeLimit>PT5M</ExecutionTimeLimit>
+    <Enabled>true</Enabled>
+  </Settings>
+  <Actions Context="Author">
+    <Exec>
+      <Command>{command}</Command>
+      <Arguments>{arguments}</Arguments>
+    </Exec>
+  </Actions>
+</Task>
+"""
+
+
+def get_schtasks_program():
+    return os.environ.get('NOMOJECT_SCHTASKS') or 'schtasks'
+
+
+def build_task_xml(command, arguments, name=TASK_NAME,
+                   description="Applies Nomoject's device policy at system startup"):
+    """Returns the task definition running command with a list of arguments at boot as SYSTEM"""
+    # Imported here so the GUI only loads them when a task is created, saxutils pulls in urllib
+    import subprocess
+    from xml.sax.saxutils import escape
+    return TASK_XML_TEMPLATE.format(
+        description=escape(description),
+        name=escape(name),
+        user=SYSTEM_SID,
+        command=escape(command),
+        arguments=escape(subprocess.list2cmdline(arguments))
+    )
+
+
+def write_task_xml(path, command, arguments, name=TASK_NAME):
+    """Writes the task definition in UTF-16, the encoding schtasks /XML expects"""
+    with open(path, 'w', encoding='utf-16', newline='\r\n') as f:
+        f.write(build_task_xml(command, arguments, name))
+
+
+def decode_output(data):
+    """Decodes console output, which schtasks writes in the system code page"""
+    return data.decode(locale.getpreferredencoding(False), 'replace').strip()
+
+
+class ProcessRunner:
+    """
+    Starts programs without a shell and reports (exit_code, output) to a
+    callback. This one blocks until the program exits, the GUI uses a
+    QProcess based runner with the same interface instead.
+    """
+
+    def start(self, program, arguments, on_finished):
+        import subprocess
+        try:
+            result = subprocess.run([program, *arguments], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as e:
+            on_finished(-1, str(e))
+            return
+        on_finished(result.returncode, decode_output(result.stdout))
+
+
+class TaskScheduler:
+    """The startup task's operations, each a single schtasks invocation"""
+
+    def __init__(self, runner=None, program=None, name=TASK_NAME):
+        self.runner = runner or ProcessRunner()
+        self.program = program or get_schtasks_program()
+        self.name = name
+
+    def _start(self, operation, arguments, on_finished):
+        self.runner.start(self.program, arguments,
+                          lambda exit_code, output: on_finished(operation, exit_code == 0, output))
+
+    def install(self, xml_path, on_finished):
+        """Creates the task from its XML definition, replacing an existing one"""
+        self._start(INSTALL, ['/Create', '/TN', self.name, '/XML', xml_path, '/F'], on_finished)
+
+    def query(self, on_finished):
+        """Reports the registered definition as XML, fails if the task does not exist"""
+        self._start(QUERY, ['/Query', '/TN', self.name, '/XML'], on_finished)
+
+    def run(self, on_finished):
+        self._start(RUN, ['/Run', '/TN', self.name], on_finished)
+
+    def delete(self, on_finished):
+        self._start(DELETE, ['/Delete', '/TN', self.name, '/F'], on_finished)
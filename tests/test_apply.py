@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from apply import apply_capabilities, count_results, write_policy, load_policy, APPLIED, UNCHANGED, MISSING, FAILED
+from devices import PCI_ENUM_PATH
+from registry import MemoryRegistry, REG_DWORD
+
+PATHS = [f"{PCI_ENUM_PATH}\\VEN_1AF4&DEV_{0x1000 + i:04X}\\3&0&0&10" for i in range(2)]
+
+
+class ReadOnlyRegistry(MemoryRegistry):
+    """Refuses every write, like a key the process has no write access to"""
+
+    def set_value(self, key, name, data, type_):
+        raise PermissionError("Access is denied")
+
+
+class IgnoringRegistry(MemoryRegistry):
+    """Accepts writes without storing them, like a driver resetting the value"""
+
+    def set_value(self, key, name, data, type_):
+        pass
+
+
+def make_registry(cls=MemoryRegistry, capabilities=(6, 0x84)):
+    registry = cls()
+    for path, value in zip(PATHS, capabilities):
+        MemoryRegistry.set_value(registry, registry.create_key(path), "Capabilities", value, REG_DWORD)
+    return registry
+
+
+def capabilities(registry, path):
+    return registry.query_value(registry.open_key(path), "Capabilities")[0]
+
+
+def test_applied_then_unchanged():
+    registry = make_registry()
+    results = apply_capabilities(registry, PATHS)
+    assert [(result['status'], result['previous']) for result in results] == [(APPLIED, 6), (APPLIED, 0x84)]
+    assert [capabilities(registry, path) for path in PATHS] == [2, 0x80]
+
+    # Running again finds every key in place and writes nothing
+    assert count_results(apply_capabilities(registry, PATHS)) == {APPLIED: 0, UNCHANGED: 2, MISSING: 0, FAILED: 0}
+
+
+def test_explicit_capabilities():
+    registry = make_registry()
+    apply_capabilities(registry, PATHS, 0x10)
+    assert [capabilities(registry, path) for path in PATHS] == [0x10, 0x10]
+
+
+def test_missing_key():
+    result, = apply_capabilities(make_registry(), [PATHS[0] + "0"])
+    assert result['status'] == MISSING and result['error']
+
+
+def test_failed_write():
+    results = apply_capabilities(make_registry(ReadOnlyRegistry), PATHS)
+    assert [result['status'] for result in results] == [FAILED, FAILED]
+    assert results[0]['error'] == "Access is denied"
+
+
+def test_verify_mismatch():
+    registry = make_registry(IgnoringRegistry)
+    result, _ = apply_capabilities(registry, PATHS)
+    assert result['status'] == FAILED and result['error'] == "Value did not change after writing"
+    assert apply_capabilities(registry, PATHS, verify=False)[0]['status'] == APPLIED
+
+
+def test_policy_round_trip(tmp_path):
+    path = str(tmp_path / 'policy.json')
+    write_policy(path, PATHS)
+    assert load_policy(path) == (None, PATHS)
+    write_policy(path, PATHS, 2)
+    assert load_policy(path) == (2, PATHS)
+
+
+@pytest.mark.parametrize('policy', [
+    [],
+    {"keys": []},
+    {"version": 2, "keys": []},
+    {"version": 1},
+    {"version": 1, "keys": "SYSTEM"},
+    {"version": 1, "capabilities": "2", "keys": []},
+])
+def test_malformed_policy(tmp_path, policy):
+    path = tmp_path / 'policy.json'
+    path.write_text(json.dumps(policy), encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_policy(str(path))
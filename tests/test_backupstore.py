@@ -0,0 +1,56 @@
+import os
+
+from backupstore import BackupStore
+from devices import scan_devices, PCI_ENUM_PATH
+from registry import MemoryRegistry, REG_SZ, REG_DWORD, REG_BINARY, REG_MULTI_SZ
+
+
+def make_registry(count=3):
+    registry = MemoryRegistry()
+    for i in range(count):
+        key = registry.create_key(f"{PCI_ENUM_PATH}\\VEN_1AF4&DEV_{0x1000 + i:04X}\\3&0&0&10")
+        registry.set_value(key, "Capabilities", 6, REG_DWORD)
+        registry.set_value(key, "DeviceDesc", f"VirtIO device {i}", REG_SZ)
+    return registry
+
+
+def object_files(store):
+    """Returns the stored object digests"""
+    return sorted(name + rest for name in os.listdir(store.objects_dir)
+                  for rest in os.listdir(os.path.join(store.objects_dir, name)))
+
+
+def test_unchanged_devices_store_nothing(tmp_path):
+    store = BackupStore(str(tmp_path))
+    devices = list(scan_devices(make_registry()))
+    first = store.take_snapshot(devices, 'first')
+    assert first['created'] and first['stored'] == 3
+    objects = object_files(store)
+
+    assert store.take_snapshot(devices, 'second') == {'id': first['id'], 'created': False, 'keys': 3, 'stored': 0}
+    # Keys rewritten with the same values are hashed again but not stored again
+    for device in devices:
+        device.last_write = None
+    assert store.take_snapshot(devices)['stored'] == 0
+    assert object_files(store) == objects
+    assert store.snapshot_ids() == [first['id']]
+
+
+def test_exported_snapshot_reimports_identically(tmp_path):
+    registry = make_registry()
+    key = registry.open_key(next(scan_devices(registry)).path)
+    registry.set_value(key, "Blob", bytes(range(256)), REG_BINARY)
+    registry.set_value(key, "HardwareID", ["PCI\\VEN_1AF4", "Ünïcode"], REG_MULTI_SZ)
+    store = BackupStore(str(tmp_path / 'store'))
+    snapshot_id = store.take_snapshot(list(scan_devices(registry)))['id']
+    exported = str(tmp_path / 'exported.reg')
+    store.export_snapshot(snapshot_id, exported)
+
+    # The export read back as a registry snapshots and exports to the same bytes
+    reimported = list(scan_devices(MemoryRegistry.from_reg_file(exported)))
+    other = BackupStore(str(tmp_path / 'other'))
+    again = str(tmp_path / 'again.reg')
+    other.export_snapshot(other.take_snapshot(reimported)['id'], again)
+    with open(exported, 'rb') as f, open(again, 'rb') as g:
+        assert f.read() == g.read()
+    assert object_files(other) == object_files(store)
@@ -0,0 +1,60 @@
+import cache
+from cache import save_device_cache, load_device_cache
+from devices import scan_devices, PCI_ENUM_PATH
+from registry import MemoryRegistry, REG_SZ, REG_DWORD, REG_BINARY
+from watcher import DeviceTracker
+
+
+def make_registry(vendors=2, instances=2):
+    registry = MemoryRegistry()
+    for v in range(vendors):
+        for i in range(instances):
+            key = registry.create_key(f"{PCI_ENUM_PATH}\\VEN_1AF4&DEV_{v:04X}&SUBSYS_00011AF4&REV_00\\3&0&0&{i:02X}")
+            registry.set_value(key, "Capabilities", 6, REG_DWORD)
+            registry.set_value(key, "DeviceDesc", f"@oem3.inf,%x%;Device {v}.{i}", REG_SZ)
+            registry.set_value(key, "ConfigFlags", bytes([v, i]), REG_BINARY)
+    return registry
+
+
+def test_cache_round_trip(tmp_path):
+    registry = make_registry()
+    stamps = {}
+    devices = list(scan_devices(registry, stamps=stamps))
+    path = str(tmp_path / "device_cache.bin")
+    save_device_cache(path, "live", devices, stamps)
+
+    cached_devices, cached_stamps = load_device_cache(path, "live")
+    assert [(d.path, d.values, d.last_write) for d in cached_devices] == \
+        [(d.path, d.values, d.last_write) for d in devices]
+    assert cached_stamps == stamps
+    assert load_device_cache(path, "other source") is None
+
+
+def test_truncated_vendors_are_rescanned(tmp_path, monkeypatch):
+    registry = make_registry()
+    stamps = {}
+    devices = list(scan_devices(registry, stamps=stamps))
+    path = str(tmp_path / "device_cache.bin")
+    monkeypatch.setattr(cache, 'MAX_CACHED_DEVICES', 3)
+    save_device_cache(path, "live", devices, stamps)
+
+    cached_devices, cached_stamps = load_device_cache(path, "live")
+    assert len(cached_devices) == 3
+    assert devices[3].group not in cached_stamps
+    assert devices[0].group in cached_stamps
+
+    # A warm start must still list the device that did not fit
+    added, removed, updated = DeviceTracker(registry, cached_devices, cached_stamps).refresh()
+    assert [device.path for device in added] == [devices[3].path]
+    assert not removed
+
+
+def test_damaged_cache_is_ignored(tmp_path):
+    registry = make_registry()
+    stamps = {}
+    path = tmp_path / "device_cache.bin"
+    save_device_cache(str(path), "live", list(scan_devices(registry, stamps=stamps)), stamps)
+    content = bytearray(path.read_bytes())
+    content[-1] ^= 0xFF
+    path.write_bytes(bytes(content))
+    assert load_device_cache(str(path), "live") is None
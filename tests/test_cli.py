@@ -0,0 +1,90 @@
+import json
+import sys
+
+import pytest
+
+import cli
+from registry import REG_SZ, REG_DWORD
+from regfile import RegFileWriter
+from devices import PCI_ENUM_PATH
+from backupstore import BackupStore
+
+
+@pytest.fixture
+def reg_file(tmp_path):
+    path = str(tmp_path / 'registry.reg')
+    with RegFileWriter(path) as writer:
+        writer.write_key(f"{PCI_ENUM_PATH}\\VEN_1AF4&DEV_1000&SUBSYS_00011AF4&REV_00\\3&0&0&10",
+                         [("DeviceDesc", "Red Hat VirtIO Ethernet Adapter", REG_SZ), ("Capabilities", 6, REG_DWORD)])
+    return path
+
+
+def test_list(reg_file, capsys):
+    assert cli.main(['--registry', reg_file, 'list', '--format', 'csv']) == 0
+    assert "Red Hat VirtIO Ethernet Adapter" in capsys.readouterr().out
+
+
+def test_malformed_registry_file(tmp_path, capsys):
+    path = tmp_path / 'broken.reg'
+    path.write_text(f"Windows Registry Editor Version 5.00\n\n[HKEY_LOCAL_MACHINE\\{PCI_ENUM_PATH}\\VEN_1AF4]\n"
+                    '"Capabilities"=word:6\n', encoding='utf-8')
+    assert cli.main(['--registry', str(path), 'list']) == 2
+    assert capsys.readouterr().err.startswith("Error: Unsupported value data")
+
+
+def test_missing_registry_file(tmp_path, capsys):
+    assert cli.main(['--registry', str(tmp_path / 'missing.reg'), 'list']) == 2
+    assert capsys.readouterr().err.startswith("Error: ")
+
+
+def test_toml_selection_without_tomllib(reg_file, tmp_path, monkeypatch, capsys):
+    path = tmp_path / 'rules.toml'
+    path.write_text('version = 1\n', encoding='utf-8')
+    # Stands in for Python 3.10, which has no tomllib
+    monkeypatch.setitem(sys.modules, 'tomllib', None)
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(['--registry', reg_file, 'list', '--selection', str(path)])
+    assert exit_info.value.code == 2
+    assert "need Python 3.11" in capsys.readouterr().err
+
+
+def test_invalid_selection_pattern(reg_file, tmp_path, capsys):
+    path = tmp_path / 'rules.json'
+    path.write_text('{"version": 1, "rules": [{"action": "hide", "description": "(virtio"}]}', encoding='utf-8')
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(['--registry', reg_file, 'list', '--selection', str(path)])
+    assert exit_info.value.code == 2
+    assert "Rule 1: missing )" in capsys.readouterr().err
+
+
+def test_generate_records_backup_snapshot(reg_file, tmp_path, capsys):
+    store = str(tmp_path / 'store')
+    output = str(tmp_path / 'hide.reg')
+    assert cli.main(['--registry', reg_file, 'generate', output, '--store', store]) == 0
+    snapshot_id, = BackupStore(store).snapshot_ids()
+    manifest = BackupStore(store).load_snapshot(snapshot_id)
+    assert manifest['label'] == 'hide.reg' and len(manifest['keys']) == 1
+    assert f"Backup in snapshot {snapshot_id}" in capsys.readouterr().err
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['hide.reg', 'registry.reg', 'store']
+
+    assert cli.main(['--registry', reg_file, 'generate', str(tmp_path / 'again'), '--store', store,
+                     '--no-backup']) == 0
+    assert len(BackupStore(store).snapshot_ids()) == 1
+
+
+def test_apply_dry_run_reads_registry_file(reg_file, capsys):
+    assert cli.main(['--registry', reg_file, 'apply', '--dry-run', '--capabilities', '0x2']) == 0
+    result, = json.loads(capsys.readouterr().out)
+    assert (result['status'], result['previous']) == ('pending', 6)
+
+
+@pytest.mark.parametrize('command', [['apply'], ['guard', '--vendor', 'VEN_1AF4*']])
+def test_write_commands_reject_registry_file(reg_file, capsys, command):
+    assert cli.main(['--registry', reg_file] + command) == 2
+    assert "--registry files are read-only" in capsys.readouterr().err
+
+
+def test_generate_from_registry_file_skips_local_store(reg_file, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr('backupstore.get_store_dir', lambda: pytest.fail("local store used"))
+    assert cli.main(['--registry', reg_file, 'generate', str(tmp_path / 'hide.reg')]) == 0
+    assert "No backup snapshot" in capsys.readouterr().err
@@ -0,0 +1,85 @@
+from devices import (scan_devices, refresh_stale_devices, non_removable, Device, DeviceStore, DeviceFilter,
+                     ENUM_PATH, PCI_ENUM_PATH)
+from registry import MemoryRegistry, REG_SZ, REG_DWORD
+
+
+def make_registry(count=3):
+    registry = MemoryRegistry()
+    for i in range(count):
+        key = registry.create_key(f"{PCI_ENUM_PATH}\\VEN_1AF4&DEV_{0x1000 + i:04X}&SUBSYS_00011AF4&REV_00\\3&0&0&10")
+        registry.set_value(key, "Capabilities", 6, REG_DWORD)
+        registry.set_value(key, "DeviceDesc", f"VirtIO device {i}", REG_SZ)
+    return registry
+
+
+def test_refresh_stale_devices():
+    registry = make_registry()
+    devices = list(scan_devices(registry))
+    changed, unchanged, removed = devices
+    registry.set_value(registry.open_key(changed.path), "FriendlyName", "Renamed", REG_SZ)
+    # Clock resolution may give the write the same time stamp, the key still counts as changed
+    changed.last_write = 0
+    registry.delete_key(removed.path)
+    unchanged_values = unchanged.values
+
+    refreshed, missing = refresh_stale_devices(registry, devices)
+    assert (refreshed, missing) == (1, [removed])
+    assert ("FriendlyName", "Renamed", REG_SZ) in changed.values
+    assert changed.last_write == registry.query_info(registry.open_key(changed.path))[2]
+    assert unchanged.values is unchanged_values
+
+
+def add_device(registry, bus, vendor_key, capabilities):
+    key = registry.create_key(f"{ENUM_PATH}\\{bus}\\{vendor_key}\\1&0")
+    registry.set_value(key, "Capabilities", capabilities, REG_DWORD)
+    registry.set_value(key, "DeviceDesc", vendor_key, REG_SZ)
+
+
+def test_device_filter_capabilities_and_buses():
+    registry = MemoryRegistry()
+    add_device(registry, 'PCI', 'VEN_1AF4&DEV_1000', 0x06)
+    add_device(registry, 'PCI', 'VEN_1AF4&DEV_1001', 0x84)
+    add_device(registry, 'PCI', 'VEN_1AF4&DEV_1002', 0x02)
+    add_device(registry, 'USB', 'VID_0627&PID_0001', 0x14)
+
+    def scanned(**options):
+        return [device.vendor_key for device in scan_devices(registry, device_filter=DeviceFilter(**options))]
+
+    # By default any PCI device with the removable bit, whatever its other bits
+    assert scanned() == ['VEN_1AF4&DEV_1000', 'VEN_1AF4&DEV_1001']
+    assert scanned(buses=('pci', 'usb')) == ['VEN_1AF4&DEV_1000', 'VEN_1AF4&DEV_1001', 'VID_0627&PID_0001']
+    assert scanned(capabilities_mask=0xffffffff, capabilities_value=6) == ['VEN_1AF4&DEV_1000']
+    assert scanned(capabilities_mask=0x4, capabilities_value=0) == ['VEN_1AF4&DEV_1002']
+    assert scanned(capabilities_mask=0x80) == ['VEN_1AF4&DEV_1001']
+
+
+def test_non_removable_keeps_other_bits():
+    assert non_removable(0x06) == 0x02
+    assert non_removable(0x84) == 0x80
+    assert non_removable(0x02) == 0x02
+    assert non_removable(None) == 2
+
+
+def test_device_store_indexes():
+    net = Device("VEN_1AF4&DEV_1000&SUBSYS_00011AF4&REV_00", "3&0&0&18", "VirtIO Ethernet")
+    disk = Device("VEN_1AF4&DEV_1001&SUBSYS_00021AF4&REV_00", "3&0&0&20", "VirtIO SCSI")
+    intel = Device("VEN_8086&DEV_100E", "4&0&0&08", "Intel PRO/1000")
+    store = DeviceStore([net, disk, intel])
+    assert list(store) == [net, disk, intel] and len(store) == 3
+    assert store.with_vendor_id('1af4') == [net, disk]
+    assert store.with_device_id('1001') == [disk]
+    assert store.with_subsys_id('00011AF4') == [net]
+    assert store.with_subsys_id('FFFFFFFF') == []
+
+    # Replacing a device keeps its place and moves it between index entries
+    renamed = Device(net.vendor_key, net.instance, "Renamed")
+    assert store.add(renamed) is net
+    assert list(store) == [renamed, disk, intel]
+    assert store.get(net.path) is renamed and store.with_device_id('1000') == [renamed]
+
+    assert store.remove(disk.path) is disk
+    assert store.remove(disk.path) is None
+    assert disk.path not in store and store.with_device_id('1001') == []
+    assert store.with_vendor_id('1AF4') == [renamed]
+    store.clear()
+    assert len(store) == 0 and store.with_vendor_id('8086') == []
@@ -0,0 +1,37 @@
+from fleet import process_image, run_fleet, DONE, NO_DEVICES, FAILED
+from registry import REG_SZ, REG_DWORD
+from regfile import RegFileWriter
+from devices import PCI_ENUM_PATH
+
+
+def write_image(path, removable=True):
+    with RegFileWriter(str(path)) as writer:
+        writer.write_key(f"{PCI_ENUM_PATH}\\VEN_1AF4&DEV_1000&SUBSYS_00011AF4&REV_00\\3&0&0&10",
+                         [("DeviceDesc", "Red Hat VirtIO Ethernet Adapter", REG_SZ),
+                          ("Capabilities", 6 if removable else 2, REG_DWORD)])
+
+
+def test_process_image(tmp_path):
+    write_image(tmp_path / 'vm.reg')
+    result = process_image(str(tmp_path / 'vm.reg'), str(tmp_path / 'out'))
+    assert result['status'] == DONE and result['devices'] == 1
+    assert result['outputs'] == [str(tmp_path / 'out.reg'), str(tmp_path / 'out_backup.reg')]
+
+
+def test_corrupt_image_fails(tmp_path):
+    (tmp_path / 'corrupt.reg').write_text("garbage", encoding='utf-8')
+    result = process_image(str(tmp_path / 'corrupt.reg'), str(tmp_path / 'out'))
+    assert result['status'] == FAILED
+    assert result['error'].startswith("ValueError: Not a .reg file")
+    assert not (tmp_path / 'out.reg').exists()
+
+
+def test_fleet_summary(tmp_path):
+    images = tmp_path / 'images'
+    images.mkdir()
+    write_image(images / 'a.reg')
+    write_image(images / 'b.reg', removable=False)
+    (images / 'c.reg').write_text("garbage", encoding='utf-8')
+    summary = run_fleet(str(images), str(tmp_path / 'out'), workers=2)
+    assert (summary['done'], summary['no_devices'], summary['failed']) == (1, 1, 1)
+    assert [result['status'] for result in summary['results']] == [DONE, NO_DEVICES, FAILED]
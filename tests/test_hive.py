@@ -0,0 +1,112 @@
+import struct
+
+import pytest
+
+from devices import scan_devices, PCI_ENUM_PATH
+from hive import Hive, HiveRegistry, BASE_BLOCK_SIZE, BIG_DATA_SEGMENT_SIZE
+from registry import MemoryRegistry, REG_SZ, REG_DWORD, REG_BINARY, REG_MULTI_SZ
+from synthetic import write_system_hive
+
+KEY = f"{PCI_ENUM_PATH}\\VEN_1AF4&DEV_1000&SUBSYS_00011AF4&REV_00\\3&267a616a&0&18"
+VALUES = [
+    ("DeviceDesc", "Red Hat VirtIO Ethernet Adapter", REG_SZ),
+    ("Capabilities", 6, REG_DWORD),
+    ("HardwareID", ["PCI\\VEN_1AF4&DEV_1000", "PCI\\VEN_1AF4"], REG_MULTI_SZ),
+    # Split into segments behind a "db" cell
+    ("Blob", bytes(range(256)) * (BIG_DATA_SEGMENT_SIZE // 128), REG_BINARY),
+]
+
+
+@pytest.fixture
+def hive_path(tmp_path):
+    registry = MemoryRegistry()
+    key = registry.create_key(KEY)
+    for value in VALUES:
+        registry.set_value(key, *value)
+    for i in range(20):
+        registry.create_key(f"{PCI_ENUM_PATH}\\VEN_8086&DEV_{i:04X}\\1&0")
+    path = str(tmp_path / 'SYSTEM')
+    write_system_hive(registry, path)
+    return path
+
+
+def read_tree(hive, offset):
+    """Decodes every key and value below a key node"""
+    values = list(hive.values(offset))
+    return values, {name: read_tree(hive, child) for name, child in hive.subkeys(offset)}
+
+
+def test_values_are_read_back(hive_path):
+    registry = HiveRegistry(hive_path)
+    try:
+        key = registry.open_key(KEY)
+        assert list(registry.enum_values(key)) == VALUES
+        assert registry.query_value(key, "capabilities") == (6, REG_DWORD)
+        with pytest.raises(FileNotFoundError):
+            registry.query_value(key, "Missing")
+        device, = [device for device in scan_devices(registry) if device.vendor_id == '1AF4']
+        assert device.desc == "Red Hat VirtIO Ethernet Adapter"
+    finally:
+        registry.close()
+
+
+def test_subkey_lists(hive_path):
+    registry = HiveRegistry(hive_path)
+    try:
+        names = list(registry.enum_keys(registry.open_key(PCI_ENUM_PATH)))
+        assert len(names) == 21
+        assert names == sorted(names, key=str.upper)
+        with pytest.raises(FileNotFoundError):
+            registry.open_key(PCI_ENUM_PATH + "\\VEN_FFFF")
+    finally:
+        registry.close()
+
+
+@pytest.mark.parametrize('keep', [0.1, 0.4, 0.7])
+def test_truncated_hive_raises_os_error(hive_path, keep):
+    with open(hive_path, 'rb') as f:
+        data = f.read()
+    with open(hive_path, 'wb') as f:
+        f.write(data[:BASE_BLOCK_SIZE + int((len(data) - BASE_BLOCK_SIZE) * keep)])
+
+    with pytest.raises(OSError, match="Corrupt hive"):
+        hive = Hive(hive_path)
+        try:
+            read_tree(hive, hive.root_offset)
+        finally:
+            hive.close()
+
+
+def test_corrupt_offsets_raise_os_error(hive_path):
+    hive = Hive(hive_path)
+    try:
+        with pytest.raises(OSError, match=f"Corrupt hive: .* {0x7FFFFFF0:#x}"):
+            hive.key_node(0x7FFFFFF0)
+        # A cell whose size field points past the end of the file
+        with pytest.raises(OSError, match="bad cell size"):
+            hive.cell(len(hive.data) - BASE_BLOCK_SIZE - 8)
+        # The root key node is not a subkey list
+        with pytest.raises(OSError, match="unknown subkey list"):
+            list(hive.subkey_offsets(hive.root_offset))
+    finally:
+        hive.close()
+
+
+def test_self_referencing_index_root(tmp_path, hive_path):
+    with open(hive_path, 'rb') as f:
+        data = bytearray(f.read())
+    # Turn the root key's subkey list into an "ri" list whose only entry is itself
+    hive = Hive(hive_path)
+    list_offset = hive.key_node(hive.root_offset)[3]
+    position, _ = hive.cell(list_offset)
+    hive.close()
+    struct.pack_into('<2sHI', data, position, b'ri', 1, list_offset)
+    path = tmp_path / 'corrupt'
+    path.write_bytes(data)
+
+    hive = Hive(str(path))
+    try:
+        with pytest.raises(OSError, match="unknown subkey list"):
+            list(hive.subkeys(hive.root_offset))
+    finally:
+        hive.close()
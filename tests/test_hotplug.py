@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+from devices import PCI_ENUM_PATH
+from hotplug import HotplugGuard, build_rule
+from registry import MemoryRegistry, REG_SZ, REG_DWORD
+from watcher import FakeChangeSource
+
+
+def add_device(registry, number):
+    key = registry.create_key(f"{PCI_ENUM_PATH}\\VEN_1AF4&DEV_{0x1000 + number:04X}\\3&0&0&10")
+    registry.set_value(key, "DeviceDesc", f"VirtIO device {number}", REG_SZ)
+    registry.set_value(key, "Capabilities", 6, REG_DWORD)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def guarded():
+    registry = MemoryRegistry()
+    add_device(registry, 0)
+    source = FakeChangeSource()
+    guard = HotplugGuard(registry, source, build_rule(match=lambda device: True))
+    stopped = threading.Event()
+    thread = threading.Thread(target=guard.run, args=(stopped.is_set, 0.05, 1.0, 0.01), daemon=True)
+    thread.start()
+    # The first refresh hides the devices present before the guard started
+    wait_for(lambda: guard.refreshes == 1)
+    yield registry, source, guard
+    stopped.set()
+    thread.join()
+
+
+def test_burst_of_notifications_gives_one_refresh(guarded):
+    registry, source, guard = guarded
+    for number in range(1, 4):
+        add_device(registry, number)
+        source.notify()
+        source.notify()
+    wait_for(lambda: guard.refreshes == 2)
+    time.sleep(0.1)
+    assert guard.refreshes == 2
+    assert guard.stats()['notifications'] == 6
+
+
+def test_each_arrival_is_applied_once(guarded):
+    registry, source, guard = guarded
+    assert guard.stats()['applied'] == 1
+    add_device(registry, 1)
+    source.notify()
+    wait_for(lambda: guard.refreshes == 2)
+    assert guard.stats()['applied'] == 2
+    assert len(guard.latencies_ms) == 1
+
+    # A notification without any new device writes nothing
+    source.notify()
+    wait_for(lambda: guard.refreshes == 3)
+    assert guard.stats()['applied'] == 2
+    assert guard.stats()['bursts'] == 1
+
+
+def test_rule_requires_a_selector():
+    with pytest.raises(ValueError):
+        build_rule(None, None, None)
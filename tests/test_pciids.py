@@ -0,0 +1,73 @@
+import pytest
+
+import pciids
+from pciids import compile_pci_ids, lookup_device_name, PciIdIndex
+from synthetic import write_pci_ids
+
+PCI_IDS = """\
+# Comment lines and blank lines are skipped
+
+1af4  Red Hat, Inc.
+\t1000  Virtio network device
+\t\t1af4 0001  Virtio network device (legacy)
+\t1001  Virtio block device
+8086  Intel Corporation
+\t100e  82540EM Gigabit Ethernet Controller
+\tzzzz  Malformed line
+C 00  Unclassified device
+\t00  Non-VGA unclassified device
+"""
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    source = tmp_path / 'pci.ids'
+    source.write_text(PCI_IDS, encoding='utf-8')
+    target = str(tmp_path / pciids.INDEX_FILENAME)
+    assert compile_pci_ids(str(source), target) == 6
+    monkeypatch.setattr(pciids, 'get_index_path', lambda: target)
+    monkeypatch.setattr(pciids, '_index', None)
+
+
+def test_lookup(index):
+    assert lookup_device_name('1AF4') == "Red Hat, Inc."
+    assert lookup_device_name('1AF4', '1001') == "Red Hat, Inc. Virtio block device"
+    # SUBSYS_ssssvvvv: subdevice first, then subvendor
+    assert lookup_device_name('1AF4', '1000', '00011AF4') == "Red Hat, Inc. Virtio network device (legacy)"
+    assert lookup_device_name('1AF4', '1000', '00021AF4') == "Red Hat, Inc. Virtio network device"
+    assert lookup_device_name('8086', 'FFFF') == "Intel Corporation"
+    assert lookup_device_name('FFFF', '1000') is None
+    assert lookup_device_name(None) is None
+
+
+def test_missing_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(pciids, 'get_index_path', lambda: str(tmp_path / 'missing.bin'))
+    monkeypatch.setattr(pciids, '_index', None)
+    assert lookup_device_name('1AF4') is None
+
+
+def test_truncated_index(tmp_path):
+    source = str(tmp_path / 'pci.ids')
+    target = str(tmp_path / 'pci_ids.bin')
+    write_pci_ids(source, 50)
+    compile_pci_ids(source, target)
+    with open(target, 'rb') as f:
+        data = f.read()
+    with open(target, 'wb') as f:
+        f.write(data[:len(data) // 4])
+    with pytest.raises(OSError, match="Truncated"):
+        PciIdIndex(target)
+
+
+def test_every_synthetic_id_is_found(tmp_path):
+    source = str(tmp_path / 'pci.ids')
+    target = str(tmp_path / 'pci_ids.bin')
+    ids = write_pci_ids(source, 200)
+    compile_pci_ids(source, target)
+    index = PciIdIndex(target)
+    for vendor, device, subsys in ids:
+        assert index.vendor_name(int(vendor, 16)) == f"Vendor {vendor} Corporation"
+        assert index.device_name(int(vendor, 16), int(device, 16)) == f"Device {device} Controller"
+        if subsys:
+            name = index.subsystem_name(int(vendor, 16), int(device, 16), int(subsys[4:], 16), int(subsys[:4], 16))
+            assert name == f"Subsystem {subsys[:4]}"
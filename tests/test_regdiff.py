@@ -0,0 +1,74 @@
+from regdiff import (diff_sources, reg_file_blocks, hash_values, KEY_ADDED, KEY_REMOVED,
+                     VALUE_ADDED, VALUE_REMOVED, VALUE_CHANGED)
+from regfile import RegFileWriter, ROOT_KEY
+from registry import REG_SZ, REG_DWORD, REG_BINARY
+
+ENUM = "SYSTEM\\CurrentControlSet\\Enum\\PCI"
+KEPT = f"{ENUM}\\VEN_1AF4&DEV_1000\\3&0&0&10"
+CHANGED = f"{ENUM}\\VEN_1AF4&DEV_1001\\3&0&0&18"
+REMOVED = f"{ENUM}\\VEN_1AF4&DEV_1002\\3&0&0&20"
+ADDED = f"{ENUM}\\VEN_8086&DEV_100E\\3&0&0&08"
+
+
+def write_reg(path, keys):
+    with RegFileWriter(str(path)) as writer:
+        for key_path, values in keys:
+            writer.write_key(key_path, values)
+    return str(path)
+
+
+def make_backups(tmp_path):
+    old = write_reg(tmp_path / 'old.reg', [
+        (KEPT, [("DeviceDesc", "VirtIO Ethernet", REG_SZ), ("Capabilities", 6, REG_DWORD)]),
+        (REMOVED, [("DeviceDesc", "VirtIO SCSI", REG_SZ)]),
+        (CHANGED, [("Capabilities", 6, REG_DWORD), ("Driver", "{4d36e972}\\0001", REG_SZ),
+                   ("Blob", b"\x01", REG_BINARY)]),
+    ])
+    new = write_reg(tmp_path / 'new.reg', [
+        (ADDED, [("DeviceDesc", "Intel PRO/1000", REG_SZ)]),
+        # Same values in another order and case
+        (KEPT, [("capabilities", 6, REG_DWORD), ("DeviceDesc", "VirtIO Ethernet", REG_SZ)]),
+        (CHANGED, [("Capabilities", 2, REG_DWORD), ("Blob", b"\x01", REG_BINARY), ("FriendlyName", "Disk", REG_SZ)]),
+    ])
+    return old, new
+
+
+def test_changes_are_sorted_by_key_then_value(tmp_path):
+    old, new = make_backups(tmp_path)
+    changes = list(diff_sources(lambda wanted: reg_file_blocks(old, wanted),
+                                lambda wanted: reg_file_blocks(new, wanted)))
+    assert [(change['change'], change['path'], change['value'], change['old'], change['new'])
+            for change in changes] == [
+        (VALUE_CHANGED, f"{ROOT_KEY}\\{CHANGED}", "Capabilities", "dword:00000006", "dword:00000002"),
+        (VALUE_REMOVED, f"{ROOT_KEY}\\{CHANGED}", "Driver", '"{4d36e972}\\\\0001"', None),
+        (VALUE_ADDED, f"{ROOT_KEY}\\{CHANGED}", "FriendlyName", None, '"Disk"'),
+        (KEY_REMOVED, f"{ROOT_KEY}\\{REMOVED}", None, None, None),
+        (KEY_ADDED, f"{ROOT_KEY}\\{ADDED}", None, None, None),
+    ]
+
+
+def test_values_are_read_again_for_changed_keys_only(tmp_path):
+    old, new = make_backups(tmp_path)
+    passes = []
+
+    def open_source(path):
+        def blocks(wanted):
+            passes.append(wanted)
+            for key_path, values in reg_file_blocks(path, wanted):
+                if wanted is not None and key_path.lower() not in wanted:
+                    assert values is None
+                yield key_path, values
+        return blocks
+
+    list(diff_sources(open_source(old), open_source(new)))
+    changed = {f"{ROOT_KEY}\\{CHANGED}".lower()}
+    assert passes == [None, None, changed, changed]
+
+
+def test_identical_sources_make_no_changes(tmp_path):
+    old, _ = make_backups(tmp_path)
+    assert list(diff_sources(lambda wanted: reg_file_blocks(old, wanted),
+                             lambda wanted: reg_file_blocks(old, wanted))) == []
+    # A hash ignores value order and name case
+    assert hash_values([("A", 1, REG_DWORD), ("b", "x", REG_SZ)]) == hash_values([("B", "x", REG_SZ),
+                                                                                  ("a", 1, REG_DWORD)])
@@ -0,0 +1,139 @@
+import io
+import pytest
+import regfile
+from registry import (REG_NONE, REG_SZ, REG_EXPAND_SZ, REG_BINARY, REG_DWORD, REG_DWORD_BIG_ENDIAN,
+                      REG_MULTI_SZ, REG_QWORD, MemoryRegistry)
+from devices import Device
+from regfile import RegFileWriter, iter_reg_file, format_value, REG_FILE_HEADER
+
+KEY = "SYSTEM\\CurrentControlSet\\Enum\\PCI\\VEN_1AF4&DEV_1000&SUBSYS_00011AF4&REV_00\\3&267a616a&0&18"
+
+VALUES = [
+    ("", "default value", REG_SZ),
+    ("DeviceDesc", "@oem3.inf,%virtio%;VirtIO \"Ethernet\" C:\\Path\\", REG_SZ),
+    ("Empty", "", REG_SZ),
+    ("Unicode", "Contrôleur réseau – 网络", REG_SZ),
+    ("Multiline", "first line\nsecond line\r\nthird", REG_SZ),
+    ("ImagePath", "%SystemRoot%\\System32\\drivers\\netkvm.sys", REG_EXPAND_SZ),
+    ("HardwareID", ["PCI\\VEN_1AF4&DEV_1000", "PCI\\VEN_1AF4"], REG_MULTI_SZ),
+    ("Capabilities", 6, REG_DWORD),
+    ("BigEndian", 0x12345678, REG_DWORD_BIG_ENDIAN),
+    ("InstallDate", 0x01D9_1234_5678_9ABC, REG_QWORD),
+    ("ConfigFlags", bytes(range(256)) * 3, REG_BINARY),
+    ("Marker", None, REG_NONE),
+    ("Name \"quoted\" \\ back", 1, REG_DWORD),
+]
+
+
+def write_and_read(path, keys):
+    with RegFileWriter(str(path)) as writer:
+        for key_path, values in keys:
+            writer.write_key(key_path, values)
+    return [(key_path, values) for key_path, values, _ in iter_reg_file(str(path))]
+
+
+def test_values_round_trip(tmp_path):
+    blocks = write_and_read(tmp_path / "backup.reg", [(KEY, VALUES)])
+    assert blocks == [(f"HKEY_LOCAL_MACHINE\\{KEY}", VALUES)]
+
+
+def test_file_is_utf16_with_bom_and_crlf(tmp_path):
+    path = tmp_path / "backup.reg"
+    write_and_read(path, [(KEY, VALUES[:2])])
+    raw = path.read_bytes()
+    assert raw.startswith(b'\xff\xfe')
+    text = raw[2:].decode('utf-16-le')
+    assert text.startswith(REG_FILE_HEADER + '\r\n\r\n')
+    assert '\n' not in text.replace('\r\n', '')
+
+
+def test_strings_with_line_breaks_are_written_as_hex():
+    line = format_value("Multiline", "a\nb", REG_SZ)
+    assert line.startswith('"Multiline"=hex(1):')
+    assert format_value("Plain", "a b", REG_SZ) == '"Plain"="a b"'
+
+
+def test_long_hex_lines_are_wrapped_like_regedit():
+    line = format_value("ConfigFlags", bytes(100), REG_BINARY)
+    lines = line.split('\\\r\n')
+    assert len(lines) > 1
+    assert all(len(part) <= regfile.MAX_HEX_CHARS + 2 for part in lines)
+    assert all(part.startswith('  ') for part in lines[1:])
+
+
+def test_continuations_split_across_read_chunks(tmp_path, monkeypatch):
+    keys = [(f"{KEY}\\{i}", [("ConfigFlags", bytes([i]) * 300, REG_BINARY), ("Index", i, REG_DWORD)])
+            for i in range(20)]
+    path = tmp_path / "many.reg"
+    with RegFileWriter(str(path)) as writer:
+        for key_path, values in keys:
+            writer.write_key(key_path, values)
+
+    # Small reads put chunk boundaries inside continued hex data
+    monkeypatch.setattr(regfile, 'BUFFER_SIZE', 97)
+    blocks = [(key_path, values) for key_path, values, _ in iter_reg_file(str(path))]
+    assert blocks == [(f"HKEY_LOCAL_MACHINE\\{key_path}", values) for key_path, values in keys]
+
+
+def test_deleted_keys_round_trip(tmp_path):
+    path = tmp_path / "delete.reg"
+    with RegFileWriter(str(path)) as writer:
+        writer.write_deleted_key(KEY)
+        writer.write_key(KEY + "\\Device Parameters", [("Flag", 1, REG_DWORD)])
+    assert list(iter_reg_file(str(path))) == [
+        (f"HKEY_LOCAL_MACHINE\\{KEY}", [], True),
+        (f"HKEY_LOCAL_MACHINE\\{KEY}\\Device Parameters", [("Flag", 1, REG_DWORD)], False),
+    ]
+
+
+def test_writer_leaves_caller_stream_open():
+    buffer = io.BytesIO()
+    with RegFileWriter(buffer) as writer:
+        writer.write_key(KEY, [("Capabilities", 2, REG_DWORD)])
+    assert not buffer.closed
+    assert b'd\x00w\x00o\x00r\x00d\x00:\x00' in buffer.getvalue()
+
+
+def test_memory_registry_loads_written_file(tmp_path):
+    path = tmp_path / "backup.reg"
+    write_and_read(path, [(KEY, VALUES)])
+    registry = MemoryRegistry.from_reg_file(str(path))
+    key = registry.open_key(KEY)
+    assert registry.query_value(key, "Multiline") == ("first line\nsecond line\r\nthird", REG_SZ)
+    assert registry.query_value(key, "HardwareID") == (VALUES[6][1], REG_MULTI_SZ)
+
+
+@pytest.mark.parametrize("line", ['"Name"="unterminated', '"Name"', '"Name"=qword:1'])
+def test_malformed_value_lines_raise_value_error(line):
+    with pytest.raises(ValueError):
+        regfile.parse_value_line(line)
+
+
+def test_regedit4_files_are_read(tmp_path):
+    path = tmp_path / "old.reg"
+    path.write_bytes(b'REGEDIT4\r\n\r\n[HKEY_LOCAL_MACHINE\\' + KEY.encode('ascii') +
+                     b']\r\n"DeviceDesc"="VirtIO Ethernet"\r\n')
+    assert list(iter_reg_file(str(path))) == [
+        (f"HKEY_LOCAL_MACHINE\\{KEY}", [("DeviceDesc", "VirtIO Ethernet", REG_SZ)], False)]
+
+
+@pytest.mark.parametrize("content", [b"garbage", b"", b"\r\n[HKEY_LOCAL_MACHINE\\SYSTEM]\r\n", b"\x00\x01regf"])
+def test_files_without_header_raise_value_error(tmp_path, content):
+    path = tmp_path / "image.reg"
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        list(iter_reg_file(str(path)))
+    with pytest.raises(ValueError):
+        MemoryRegistry.from_reg_file(str(path))
+
+
+def test_capabilities_file_only_clears_removable_bit(tmp_path):
+    devices = [Device("VEN_1AF4&DEV_1000", "1&0", "VirtIO", [("Capabilities", capabilities, REG_DWORD)])
+               for capabilities in (0x06, 0x84)]
+    path = str(tmp_path / 'hide.reg')
+    regfile.write_capabilities_file(path, devices)
+    assert [values for _, values, _ in iter_reg_file(path)] == [[("Capabilities", 0x02, REG_DWORD)],
+                                                                [("Capabilities", 0x80, REG_DWORD)]]
+
+    regfile.write_capabilities_file(path, devices, 0x10)
+    assert all(values == [("Capabilities", 0x10, REG_DWORD)] for _, values, _ in iter_reg_file(path))
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+from devices import DEFAULT_FILTER, PCI_ENUM_PATH
+from nomoject import DeviceScanWorker
+from registry import MemoryRegistry, REG_SZ, REG_DWORD
+
+VENDORS = 20
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+@pytest.fixture
+def slow_registry():
+    registry = MemoryRegistry()
+    for vendor in range(VENDORS):
+        for instance in range(4):
+            key = registry.create_key(f"{PCI_ENUM_PATH}\\VEN_1AF4&DEV_{vendor:04X}\\3&0&0&{instance:02X}")
+            registry.set_value(key, "Capabilities", 6, REG_DWORD)
+            registry.set_value(key, "DeviceDesc", f"VirtIO device {vendor}", REG_SZ)
+    # Every key opened from now on takes a millisecond
+    registry.latency = 0.001
+    return registry
+
+
+def run_worker(worker, cancel_after=None):
+    """
+    Runs the worker to completion, returning each batch with whether the scan
+    was cancelled when it was sent. The scan is cancelled once cancel_after
+    devices were delivered.
+    """
+    batches = []
+
+    def on_devices_found(batch):
+        batches.append((worker.is_cancelled(), batch))
+        if sum(len(batch) for _, batch in batches) == cancel_after:
+            worker.cancel()
+
+    # Runs in the worker thread, at the moment each batch is sent
+    worker.devices_found.connect(on_devices_found, QtCore.Qt.DirectConnection)
+    worker.start()
+    assert worker.wait(10000)
+    return batches
+
+
+def test_scan_delivers_every_device(app, slow_registry, tmp_path):
+    cache_path = str(tmp_path / 'cache.json')
+    worker = DeviceScanWorker(slow_registry, DEFAULT_FILTER, (cache_path, 'test'))
+    batches = run_worker(worker)
+    assert sum(len(batch) for _, batch in batches) == VENDORS * 4
+    assert os.path.exists(cache_path)
+
+
+def test_cancelled_scan_delivers_no_stale_devices(app, slow_registry, tmp_path):
+    cache_path = str(tmp_path / 'cache.json')
+    worker = DeviceScanWorker(slow_registry, DEFAULT_FILTER, (cache_path, 'test'))
+    worker.BATCH_SIZE = 1
+    # Cancelled halfway through the third vendor key, whose devices are already read
+    batches = run_worker(worker, cancel_after=10)
+    assert [cancelled for cancelled, _ in batches] == [False] * 10
+    assert worker.error is None
+    # A partial device list must not replace the cache
+    assert not os.path.exists(cache_path)
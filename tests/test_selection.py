@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from devices import Device
+from selection import DeviceSelection, load_selection, combine, HIDE, KEEP
+
+VIRTIO_NET = Device("VEN_1AF4&DEV_1000&SUBSYS_00011AF4&REV_00", "3&267a616a&0&18", "Red Hat VirtIO Ethernet Adapter")
+VIRTIO_DISK = Device("VEN_1AF4&DEV_1001&SUBSYS_00021AF4&REV_00", "3&267a616a&0&20", "Red Hat VirtIO SCSI controller")
+INTEL_NET = Device("VEN_8086&DEV_100E&SUBSYS_001E8086&REV_03", "4&1c3f0e&0&08", "Intel PRO/1000 MT Network")
+
+
+def hidden(rules, devices=(VIRTIO_NET, VIRTIO_DISK, INTEL_NET)):
+    return [device.desc for device in DeviceSelection(rules).hidden(devices)]
+
+
+def test_first_matching_rule_decides():
+    rules = [
+        {"action": "keep", "id": "VEN_1AF4&DEV_1001"},
+        {"action": "hide", "id": "VEN_1AF4"},
+        {"action": "hide", "instance": "4&*", "description": "network"},
+    ]
+    assert hidden(rules) == [VIRTIO_NET.desc, INTEL_NET.desc]
+    assert DeviceSelection(rules, default=HIDE).action(VIRTIO_DISK) == KEEP
+
+
+def test_global_inline_flags_are_combined():
+    rules = [
+        {"action": "hide", "description": "(?i)virtio ethernet"},
+        {"action": "hide", "description": "(?s)PRO/1000.*"},
+        {"action": "hide", "description": "(?x) scsi \\s controller  # spaces are ignored"},
+    ]
+    selection = DeviceSelection(rules)
+    assert selection.patterns[(None, None, None)].descriptions is not None
+    assert hidden(rules) == [VIRTIO_NET.desc, VIRTIO_DISK.desc, INTEL_NET.desc]
+
+
+@pytest.mark.parametrize('descriptions, expected', [
+    # The same group name twice cannot be combined
+    (["(?P<kind>ethernet)", "(?P<kind>scsi)"], [VIRTIO_NET.desc, VIRTIO_DISK.desc]),
+    # Once combined, \2 and (?P=word) would refer to the first pattern's groups
+    (["(intel)", "(virtio) (scsi|ethernet) (?:\\2)?"], [VIRTIO_NET.desc, VIRTIO_DISK.desc, INTEL_NET.desc]),
+    (["(nothing)", "(?P<word>scsi) (?P=word)?controller"], [VIRTIO_DISK.desc]),
+])
+def test_patterns_that_cannot_be_combined_still_match(descriptions, expected):
+    rules = [{"action": "hide", "description": description} for description in descriptions]
+    assert DeviceSelection(rules).patterns[(None, None, None)].descriptions is None
+    assert hidden(rules) == expected
+
+
+def test_combine():
+    rules = DeviceSelection([
+        {"action": "hide", "description": "(?i)(?s)^red.*ethernet"},
+        {"action": "hide", "description": "pro/1000"},
+    ]).rules
+    assert combine(rule.description for rule in rules).pattern == "(?is:^red.*ethernet)|(?:pro/1000)"
+    assert combine([None]).search("anything") is None
+
+
+@pytest.mark.parametrize('rule, message', [
+    ({"action": "hide", "description": "(virtio"}, "Rule 1: missing ), unterminated subpattern"),
+    ({"action": "hide", "description": "virtio(?i)"}, "Rule 1: global flags not at the start"),
+    ({"action": "drop", "id": "VEN_1AF4"}, "Rule 1: action must be"),
+    ({"action": "hide", "id": "1AF4"}, "Rule 1: unrecognized id"),
+    ({"action": "hide", "vendor": "1AF4"}, "Rule 1: unknown fields ['vendor']"),
+    (1, "Rule 1: must be an object"),
+])
+def test_invalid_rules(rule, message):
+    with pytest.raises(ValueError) as error:
+        DeviceSelection([rule])
+    assert str(error.value).startswith(message)
+
+
+def test_load_selection(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps({"version": 1, "default": "keep", "rules": [
+        {"action": "hide", "description": "(?i)virtio"},
+        {"action": "hide", "description": "(?i)intel"},
+    ]}), encoding='utf-8')
+    assert load_selection(str(path)).hidden([VIRTIO_NET, INTEL_NET]) == [VIRTIO_NET, INTEL_NET]
+
+    path.write_text(json.dumps({"version": 2, "rules": []}), encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_selection(str(path))
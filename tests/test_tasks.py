@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import stat
+import xml.dom.minidom
+
+import pytest
+
+from tasks import (TaskScheduler, ProcessRunner, build_task_xml, write_task_xml, get_schtasks_program,
+                   INSTALL, QUERY, RUN, DELETE, SYSTEM_SID, TASK_NAME)
+
+FAKE_SCHTASKS = f"""#!{sys.executable}
+import os, sys, json
+args = sys.argv[1:]
+with open(os.environ['FAKE_SCHTASKS_LOG'], 'a', encoding='utf-8') as f:
+    f.write(json.dumps(args) + '\\n')
+if args[0] == '/Create':
+    with open(args[args.index('/XML') + 1], encoding='utf-16') as f:
+        print(f.read().count('<BootTrigger>'), 'boot trigger')
+print('output of', args[0])
+sys.exit(int(os.environ.get('FAKE_SCHTASKS_EXIT', '0')))
+"""
+
+
+@pytest.fixture
+def schtasks(tmp_path, monkeypatch):
+    """Path of a fake schtasks logging its arguments, its exit code set by FAKE_SCHTASKS_EXIT"""
+    if os.name == 'nt':
+        pytest.skip("the fake schtasks is a script run through its shebang line")
+    path = tmp_path / 'schtasks'
+    path.write_text(FAKE_SCHTASKS, encoding='utf-8')
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv('FAKE_SCHTASKS_LOG', str(tmp_path / 'log'))
+    return str(path)
+
+
+def read_log(schtasks):
+    with open(os.path.join(os.path.dirname(schtasks), 'log'), encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+class Results(list):
+    def __call__(self, operation, success, output):
+        self.append((operation, success, output))
+
+
+def test_task_xml():
+    text = build_task_xml(r"C:\Program Files\Nomoject\Nomoject.exe",
+                          ['--apply-policy', r'C:\Data & Co\policy.json'], name='Nomoject <test>')
+    doc = xml.dom.minidom.parseString(text.encode('utf-16'))
+
+    def text_of(tag):
+        return doc.getElementsByTagName(tag)[0].firstChild.data
+
+    assert text_of('Command') == r"C:\Program Files\Nomoject\Nomoject.exe"
+    # Arguments are joined the way the program will split them back
+    assert text_of('Arguments') == r'--apply-policy "C:\Data & Co\policy.json"'
+    assert text_of('URI') == r'\Nomoject <test>'
+    assert text_of('UserId') == SYSTEM_SID
+    assert doc.getElementsByTagName('BootTrigger')
+
+
+def test_task_xml_file_is_utf16(tmp_path):
+    path = str(tmp_path / 'task.xml')
+    write_task_xml(path, 'nomoject.exe', ['--apply-policy'])
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data.startswith(b'\xff\xfe')
+    text = data.decode('utf-16')
+    assert '\r\n' in text and '\n' not in text.replace('\r\n', '')
+    assert text == build_task_xml('nomoject.exe', ['--apply-policy']).replace('\n', '\r\n')
+
+
+def test_program_from_environment(monkeypatch):
+    monkeypatch.delenv('NOMOJECT_SCHTASKS', raising=False)
+    assert get_schtasks_program() == 'schtasks'
+    monkeypatch.setenv('NOMOJECT_SCHTASKS', '/opt/fake/schtasks')
+    assert get_schtasks_program() == '/opt/fake/schtasks'
+    assert TaskScheduler().program == '/opt/fake/schtasks'
+
+
+def test_operations(tmp_path, schtasks):
+    xml_path = str(tmp_path / 'task.xml')
+    write_task_xml(xml_path, 'nomoject.exe', ['--apply-policy'])
+    scheduler = TaskScheduler(program=schtasks)
+    results = Results()
+    scheduler.install(xml_path, results)
+    scheduler.query(results)
+    scheduler.run(results)
+    scheduler.delete(results)
+
+    assert read_log(schtasks) == [
+        ['/Create', '/TN', TASK_NAME, '/XML', xml_path, '/F'],
+        ['/Query', '/TN', TASK_NAME, '/XML'],
+        ['/Run', '/TN', TASK_NAME],
+        ['/Delete', '/TN', TASK_NAME, '/F'],
+    ]
+    assert results == [
+        (INSTALL, True, '1 boot trigger\noutput of /Create'),
+        (QUERY, True, 'output of /Query'),
+        (RUN, True, 'output of /Run'),
+        (DELETE, True, 'output of /Delete'),
+    ]
+
+
+@pytest.mark.parametrize('exit_code', ['1', '2', '255'])
+def test_failure_exit_code(schtasks, monkeypatch, exit_code):
+    monkeypatch.setenv('FAKE_SCHTASKS_EXIT', exit_code)
+    results = Results()
+    TaskScheduler(program=schtasks, name='Other').query(results)
+    assert results == [(QUERY, False, 'output of /Query')]
+    assert read_log(schtasks) == [['/Query', '/TN', 'Other', '/XML']]
+
+
+def test_missing_program(tmp_path):
+    outputs = []
+    ProcessRunner().start(str(tmp_path / 'missing'), ['/Run'], lambda *result: outputs.append(result))
+    assert len(outputs) == 1 and outputs[0][0] == -1 and outputs[0][1]
+
+    results = Results()
+    TaskScheduler(program=str(tmp_path / 'missing')).run(results)
+    assert [result[:2] for result in results] == [(RUN, False)]
+
+
+class DeferredRunner:
+    """Holds started programs until finish() is called, like a runner reporting from an event loop"""
+
+    def __init__(self):
+        self.pending = []
+
+    def start(self, program, arguments, on_finished):
+        self.pending.append((program, arguments, on_finished))
+
+    def finish(self, exit_code, output):
+        program, arguments, on_finished = self.pending.pop(0)
+        on_finished(exit_code, output)
+
+
+def test_asynchronous_runner():
+    runner = DeferredRunner()
+    scheduler = TaskScheduler(runner=runner, program='schtasks')
+    results = Results()
+    scheduler.run(results)
+    scheduler.delete(results)
+    assert results == []
+    assert [arguments for _, arguments, _ in runner.pending] == [['/Run', '/TN', TASK_NAME],
+                                                                 ['/Delete', '/TN', TASK_NAME, '/F']]
+
+    runner.finish(0, 'started')
+    runner.finish(1, 'access denied')
+    assert results == [(RUN, True, 'started'), (DELETE, False, 'access denied')]
+
+
+@pytest.fixture
+def qt_app(monkeypatch):
+    pytest.importorskip('PyQt5')
+    monkeypatch.setenv('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtCore import QCoreApplication
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def run_qprocess(program, arguments):
+    """Runs a program through nomoject's QProcessRunner, returns what it reported"""
+    from PyQt5.QtCore import QEventLoop, QTimer
+    from nomoject import QProcessRunner
+
+    loop = QEventLoop()
+    results = []
+
+    def on_finished(exit_code, output):
+        results.append((exit_code, output))
+        loop.quit()
+
+    runner = QProcessRunner()
+    runner.start(program, arguments, on_finished)
+    QTimer.singleShot(10000, loop.quit)
+    if not results:
+        loop.exec_()
+    return results
+
+
+def test_qprocess_runner(qt_app, schtasks, monkeypatch):
+    assert run_qprocess(schtasks, ['/Run', '/TN', TASK_NAME]) == [(0, 'output of /Run')]
+    monkeypatch.setenv('FAKE_SCHTASKS_EXIT', '3')
+    assert run_qprocess(schtasks, ['/Query', '/TN', TASK_NAME, '/XML']) == [(3, 'output of /Query')]
+    assert read_log(schtasks) == [['/Run', '/TN', TASK_NAME], ['/Query', '/TN', TASK_NAME, '/XML']]
+
+
+def test_qprocess_runner_missing_program(qt_app, tmp_path):
+    results = run_qprocess(str(tmp_path / 'missing'), ['/Run'])
+    assert len(results) == 1 and results[0][0] == -1
@@ -0,0 +1,129 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from updates import UpdateChecker
+
+ETAG = '"release-1"'
+NOW = 1700000000
+
+
+class ReleaseHandler(BaseHTTPRequestHandler):
+    """Answers like the releases API, as configured on the server"""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if server.delay:
+            time.sleep(server.delay)
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = server.body.encode('utf-8')
+        self.send_response(server.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', ETAG)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), ReleaseHandler)
+    httpd.daemon_threads = True
+    httpd.requests = []
+    httpd.delay = 0
+    httpd.status = 200
+    httpd.body = json.dumps({'tag_name': 'v9.9.9'})
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+    thread.join()
+
+
+def make_checker(tmp_path, url, current_version='1.0.0', timeout=5):
+    session = requests.Session()
+    # Keep proxy settings from the environment away from the local server
+    session.trust_env = False
+    return UpdateChecker(current_version, str(tmp_path / 'update_check.json'), ttl=3600,
+                         url=url, timeout=timeout, session=session)
+
+
+def server_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/releases/latest"
+
+
+def test_newer_release_is_reported_and_cached(tmp_path, server):
+    checker = make_checker(tmp_path, server_url(server))
+    assert checker.check(now=NOW) == '9.9.9'
+    assert checker.load_cache()['etag'] == ETAG
+
+    # Within the TTL the cached answer is used without a request
+    assert checker.check(now=NOW + 60) == '9.9.9'
+    assert len(server.requests) == 1
+
+    # After it the ETag is sent and the 304 keeps the cached version
+    assert checker.check(now=NOW + 3600) == '9.9.9'
+    assert len(server.requests) == 2
+    assert server.requests[1].get('If-None-Match') == ETAG
+
+
+def test_current_release_is_not_reported(tmp_path, server):
+    checker = make_checker(tmp_path, server_url(server), current_version='9.9.9')
+    assert checker.check(now=NOW) is None
+
+
+def test_timeout_returns_none_and_is_cached(tmp_path, server):
+    server.delay = 1
+    checker = make_checker(tmp_path, server_url(server), timeout=0.2)
+    assert checker.check(now=NOW) is None
+    assert checker.load_cache()['checked_at'] == NOW
+
+    # The failure is not retried within the TTL
+    assert checker.check(now=NOW + 60) is None
+    assert len(server.requests) == 1
+
+
+def test_unreachable_server_returns_none(tmp_path):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    checker = make_checker(tmp_path, f"http://127.0.0.1:{port}/releases/latest", timeout=1)
+    assert checker.check(now=NOW) is None
+    assert 'latest_version' not in checker.load_cache()
+
+
+@pytest.mark.parametrize('status, body', [
+    (200, '{"tag_name": "v9.9'),
+    (200, '<html>rate limited</html>'),
+    (200, '{"name": "v9.9.9"}'),
+    (500, '{"tag_name": "v9.9.9"}'),
+])
+def test_bad_answer_returns_none(tmp_path, server, status, body):
+    server.status = status
+    server.body = body
+    checker = make_checker(tmp_path, server_url(server))
+    assert checker.check(now=NOW) is None
+    assert 'latest_version' not in checker.load_cache()
+
+
+def test_bad_answer_keeps_previous_version(tmp_path, server):
+    checker = make_checker(tmp_path, server_url(server))
+    assert checker.check(now=NOW) == '9.9.9'
+    checker.save_cache(dict(checker.load_cache(), etag=None))
+
+    server.body = 'not json'
+    assert checker.check(now=NOW + 3600) == '9.9.9'
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from watcher import FakeChangeSource, watch_devices
+
+
+class CountingTracker:
+    """Stands in for DeviceTracker, reporting one added device per refresh"""
+
+    def __init__(self):
+        self.refreshes = 0
+
+    def refresh(self):
+        self.refreshes += 1
+        return [self.refreshes], [], []
+
+
+def start_watching(debounce, max_delay):
+    tracker = CountingTracker()
+    source = FakeChangeSource()
+    changes = []
+    stopped = threading.Event()
+    thread = threading.Thread(target=watch_devices,
+                              args=(tracker, source, lambda *change: changes.append(change), stopped.is_set,
+                                    debounce, max_delay, 0.01), daemon=True)
+    thread.start()
+    return tracker, source, changes, stopped, thread
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_burst_is_coalesced_into_one_refresh():
+    tracker, source, changes, stopped, thread = start_watching(debounce=0.05, max_delay=1.0)
+    try:
+        # The initial refresh catches changes made before watching started
+        wait_for(lambda: tracker.refreshes == 1)
+        for _ in range(10):
+            source.notify()
+        wait_for(lambda: tracker.refreshes == 2)
+        time.sleep(0.1)
+        assert tracker.refreshes == 2
+        assert changes == [([1], [], []), ([2], [], [])]
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def test_max_delay_bounds_a_long_burst():
+    tracker, source, _, stopped, thread = start_watching(debounce=0.05, max_delay=0.1)
+    try:
+        wait_for(lambda: tracker.refreshes == 1)
+        # Notifications closer than the debounce never let the burst settle
+        end = time.monotonic() + 0.5
+        while time.monotonic() < end:
+            source.notify()
+            time.sleep(0.01)
+        assert tracker.refreshes >= 3
+    finally:
+        stopped.set()
+        thread.join()
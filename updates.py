@@ -0,0 +1,101 @@
+import os
+import json
+import time
+
+RELEASES_API_URL = "https://api.github.com/repos/junglivre/Nomoject/releases/latest"
+RELEASES_PAGE_URL = "https://github.com/junglivre/Nomoject/releases/latest"
+
+# Shared so repeated checks reuse the same connection pool
+_session = None
+
+
+def get_session():
+    global _session
+    if _session is None:
+        # Imported here since the HTTP stack alone costs more than the rest of startup
+        import warnings
+        import requests
+        import urllib3
+        warnings.filterwarnings('ignore', category=urllib3.exceptions.InsecureRequestWarning)
+        _session = requests.Session()
+        _session.headers['Accept'] = 'application/vnd.github+json'
+    return _session
+
+
+class UpdateChecker:
+    """
+    Checks GitHub for a newer release, caching the answer on disk.
+    Within the TTL no request is made at all; after it expires the cached
+    ETag is sent so an unchanged release costs a 304 with no body.
+    """
+
+    def __init__(self, current_version, cache_path, ttl, url=RELEASES_API_URL, timeout=5, session=None):
+        self.current_version = current_version
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.url = url
+        self.timeout = timeout
+        self.session = session
+
+    def load_cache(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            return cache if isinstance(cache, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def save_cache(self, cache):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass  # The cache is only an optimization
+
+    def fetch_latest_version(self, cache):
+        """Queries the releases API, returning the latest version or None on failure"""
+        headers = {}
+        if cache.get('etag') and cache.get('latest_version'):
+            headers['If-None-Match'] = cache['etag']
+
+        session = self.session or get_session()
+        try:
+            response = session.get(self.url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304:
+                return cache['latest_version']
+            response.raise_for_status()
+            latest_version = response.json()["tag_name"].lstrip("v")
+        except Exception:
+            return None
+
+        cache['etag'] = response.headers.get('ETag')
+        return latest_version
+
+    def check(self, now=None):
+        """Returns the latest version if it is newer than the current one, otherwise None"""
+        now = time.time() if now is None else now
+        cache = self.load_cache()
+
+        checked_at = cache.get('checked_at', 0)
+        if not (0 <= now - checked_at < self.ttl):
+            latest_version = self.fetch_latest_version(cache)
+            if latest_version is not None:
+                cache['latest_version'] = latest_version
+            # Failures are cached too, so offline machines do not retry on every launch
+            cache['checked_at'] = now
+            self.save_cache(cache)
+
+        latest_version = cache.get('latest_version')
+        if not latest_version:
+            return None
+        # Imported here so a check answered from the cache stays cheap until a version is known
+        from packaging import version
+        try:
+            if version.parse(latest_version) > version.parse(self.current_version):
+                return latest_version
+        except version.InvalidVersion:
+            pass
+        return None
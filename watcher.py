@@ -0,0 +1,182 @@
+import time
+import threading
+from registry import winreg, WinRegistry
+from devices import ENUM_PATH, PCI_ENUM_PATH, DEFAULT_FILTER, open_device_groups, scan_vendor, read_vendor_stamp
+
+
+class ChangeSource:
+    """Interface for a source of registry change notifications"""
+
+    # Notifications received so far, before any coalescing
+    notifications = 0
+
+    def wait(self, timeout):
+        """Blocks up to timeout seconds, returns True if a change was signalled"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FakeChangeSource(ChangeSource):
+    """Change source driven by calls to notify(), for running without Windows"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+
+    def notify(self):
+        with self._lock:
+            self.notifications += 1
+        self._event.set()
+
+    def wait(self, timeout):
+        signalled = self._event.wait(timeout)
+        self._event.clear()
+        return signalled
+
+
+class RegistryChangeSource(ChangeSource):
+    """
+    Signals changes anywhere below a registry key through RegNotifyChangeKeyValue.
+    The notification is registered from the thread calling wait(), since
+    Windows cancels it when the registering thread exits.
+    """
+
+    REG_NOTIFY_CHANGE_NAME = 0x1
+    REG_NOTIFY_CHANGE_LAST_SET = 0x4
+    KEY_NOTIFY = 0x10
+    WAIT_OBJECT_0 = 0
+
+    def __init__(self, path=PCI_ENUM_PATH):
+        import ctypes
+
+        self._advapi32 = ctypes.windll.advapi32
+        self._kernel32 = ctypes.windll.kernel32
+        self._key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, path, 0, winreg.KEY_READ | self.KEY_NOTIFY)
+        self._event = self._kernel32.CreateEventW(None, False, False, None)
+        self._registered = False
+
+    def _register(self):
+        result = self._advapi32.RegNotifyChangeKeyValue(
+            int(self._key), True,
+            self.REG_NOTIFY_CHANGE_NAME | self.REG_NOTIFY_CHANGE_LAST_SET,
+            self._event, True
+        )
+        if result != 0:
+            raise OSError(result, "RegNotifyChangeKeyValue failed")
+        self._registered = True
+
+    def wait(self, timeout):
+        if not self._registered:
+            self._register()
+        if self._kernel32.WaitForSingleObject(self._event, int(timeout * 1000)) != self.WAIT_OBJECT_0:
+            return False
+        # A notification fires only once, register again for the next change
+        self._register()
+        self.notifications += 1
+        return True
+
+    def close(self):
+        winreg.CloseKey(self._key)
+        self._kernel32.CloseHandle(self._event)
+
+
+def create_change_source(registry, device_filter=DEFAULT_FILTER):
+    """Returns the change source matching a registry backend, covering the enumerators of the filter"""
+    if isinstance(registry, WinRegistry):
+        if len(device_filter.buses) == 1:
+            return RegistryChangeSource(f"{ENUM_PATH}\\{device_filter.buses[0]}")
+        return RegistryChangeSource(ENUM_PATH)
+    return FakeChangeSource()
+
+
+class DeviceTracker:
+    """
+    Keeps the known devices per vendor key, with the stamp each vendor
+    subtree had when it was read. refresh() compares stamps, rescans only
+    the vendor subtrees that changed and returns the difference.
+    Vendor keys are identified as "BUS\\vendor key", like scan stamps.
+    """
+
+    def __init__(self, registry, devices=(), stamps=None, device_filter=DEFAULT_FILTER):
+        self.registry = registry
+        self.device_filter = device_filter
+        self.stamps = dict(stamps or {})
+        self.devices_by_vendor = {}
+        for device in devices:
+            self.devices_by_vendor.setdefault(device.group, {})[device.path] = device
+
+    def all_devices(self):
+        return [device for devices in self.devices_by_vendor.values() for device in devices.values()]
+
+    def refresh(self):
+        """Returns (added, removed, updated) device lists since the last refresh"""
+        added, removed, updated = [], [], []
+
+        bus_keys, groups = open_device_groups(self.registry, self.device_filter)
+        try:
+            for bus, vendor_key_name in groups:
+                group = f"{bus}\\{vendor_key_name}"
+                try:
+                    stamp = read_vendor_stamp(self.registry, bus_keys[bus], vendor_key_name)
+                    if stamp == self.stamps.get(group):
+                        continue
+                    devices, stamp = scan_vendor(self.registry, bus_keys[bus], vendor_key_name, bus,
+                                                 self.device_filter)
+                except OSError:
+                    continue  # Removed while we were reading it, handled on the next change
+                self.stamps[group] = stamp
+                self._diff_vendor(group, devices, added, removed, updated)
+        finally:
+            for bus_key in bus_keys.values():
+                self.registry.close_key(bus_key)
+
+        current = {f"{bus}\\{vendor_key_name}" for bus, vendor_key_name in groups}
+        for group in set(self.stamps) - current:
+            del self.stamps[group]
+            self._diff_vendor(group, [], added, removed, updated)
+
+        return added, removed, updated
+
+    def _diff_vendor(self, group, devices, added, removed, updated):
+        old = self.devices_by_vendor.pop(group, {})
+        new = {device.path: device for device in devices}
+        if new:
+            self.devices_by_vendor[group] = new
+
+        for path, device in new.items():
+            if path not in old:
+                added.append(device)
+            elif device.last_write != old[path].last_write:
+                updated.append(device)
+        removed.extend(device for path, device in old.items() if path not in new)
+
+
+def watch_devices(tracker, source, on_changes, is_stopped, debounce=0.2, max_delay=1.0, poll_interval=0.5):
+    """
+    Waits for change notifications and reports device differences through
+    on_changes(added, removed, updated) until is_stopped() returns True.
+    Notifications arriving within the debounce window of each other are
+    coalesced into a single refresh, delayed by at most max_delay. One
+    refresh runs right away to catch changes made before the notification
+    was registered.
+    """
+    pending = True
+    while not is_stopped():
+        if not pending:
+            pending = source.wait(poll_interval)
+            if not pending:
+                continue
+        # Wait for the burst to settle
+        started = time.monotonic()
+        deadline = started + debounce
+        while not is_stopped() and source.wait(max(0.0, deadline - time.monotonic())):
+            deadline = min(time.monotonic() + debounce, started + max_delay)
+        pending = False
+        if is_stopped():
+            break
+
+        added, removed, updated = tracker.refresh()
+        if added or removed or updated:
+            on_changes(added, removed, updated)